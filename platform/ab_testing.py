@@ -0,0 +1,287 @@
+import atexit
+import hashlib
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import settings
+
+VARIANTS = ('A', 'B')
+
+
+def assign_variant(experiment_id: int, user_id: int) -> int:
+    """Детерминированный вариант пользователя (0 - A, 1 - B), одинаковый во всех процессах"""
+    digest = hashlib.blake2b(f'{experiment_id}:{user_id}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') & 1
+
+
+def compute_results(exposures: Tuple[int, int], conversions: Tuple[int, int],
+                    min_p_value: float = 1.0, tau: float = settings.AB_MSPRT_TAU,
+                    alpha: float = settings.AB_SIGNIFICANCE_LEVEL,
+                    min_exposures: int = settings.AB_MIN_EXPOSURES) -> Dict[str, Any]:
+    """
+    Сравнение конверсий вариантов по счетчикам (O(1)).
+
+    p_value - двусторонний z-тест для фиксированного объема выборки;
+    sequential_p_value - всегда корректное p-значение смешанного SPRT
+    (mSPRT, нормальное приближение, смесь N(0, tau^2) по разнице конверсий):
+    его можно проверять после каждого события без роста ошибки первого рода.
+    Пока в каком-либо варианте меньше min_exposures показов, нормальное
+    приближение не применяется и p-значения не считаются.
+    """
+    rates = [conversions[i] / exposures[i] if exposures[i] else 0.0 for i in range(2)]
+    result: Dict[str, Any] = {
+        'variants': {
+            name: {'exposures': exposures[i], 'conversions': conversions[i], 'rate': rates[i]}
+            for i, name in enumerate(VARIANTS)
+        },
+        'lift': (rates[1] - rates[0]) / rates[0] if rates[0] else None,
+        'z': None,
+        'p_value': None,
+        'sequential_p_value': min_p_value,
+        'significant': False,
+        'winner': None
+    }
+    if min(exposures) < max(min_exposures, 1):
+        return result
+
+    diff = rates[1] - rates[0]
+    variance = sum(rates[i] * (1 - rates[i]) / exposures[i] for i in range(2))
+    if variance > 0:
+        z = diff / math.sqrt(variance)
+        result['z'] = z
+        result['p_value'] = math.erfc(abs(z) / math.sqrt(2))
+        result['sequential_p_value'] = min(min_p_value, sequential_p_value(diff, variance, tau))
+
+    if result['sequential_p_value'] < alpha:
+        result['significant'] = True
+        result['winner'] = VARIANTS[1] if diff > 0 else VARIANTS[0]
+    return result
+
+
+def sequential_p_value(diff: float, variance: float, tau: float) -> float:
+    """1 / отношение правдоподобия mSPRT для текущей оценки разницы"""
+    tau2 = tau * tau
+    log_ratio = (0.5 * math.log(variance / (variance + tau2))
+                 + tau2 * diff * diff / (2 * variance * (variance + tau2)))
+    return min(1.0, math.exp(-log_ratio))
+
+
+class _Experiment:
+    """Состояние эксперимента в процессе: только события, еще не записанные в БД"""
+
+    __slots__ = ('id', 'rule_ids', 'conversion_action', 'new_exposures', 'conversions',
+                 'prior_conversions')
+
+    def __init__(self, row: Dict[str, Any]):
+        self.id: int = row['id']
+        self.rule_ids: Tuple[int, int] = (row['rule_a_id'], row['rule_b_id'])
+        self.conversion_action: str = row['conversion_action']
+        # user_id -> вариант первого показа в текущей пачке
+        self.new_exposures: Dict[int, int] = {}
+        # Конверсии после показа в пачке (или пользователей, показанных раньше)
+        self.conversions: Set[int] = set()
+        # Действия до первого показа в пачке: засчитываются, только если
+        # пользователь был показан в прошлых пачках (см. record_experiment_events)
+        self.prior_conversions: Set[int] = set()
+
+
+class ABTestingEngine:
+    """A/B тестирование правил адаптации
+
+    Пользователь детерминированно (по хешу) попадает в вариант A или B
+    эксперимента; если под его контекст подходит правило одного из вариантов,
+    он видит только правило своего варианта и считается показанным.
+    Конверсия - действие conversion_action показанного пользователя.
+
+    Показы и конверсии копятся в памяти и раз в AB_FLUSH_INTERVAL секунд
+    записываются в ab_exposures (по строке на пользователя - каждый
+    учитывается один раз, даже если его видели несколько процессов);
+    счетчики ab_experiments увеличиваются на фактически записанное. Результаты
+    считаются по этим счетчикам, без пересчета событий. В памяти процесса
+    только события с последней записи: кто уже показан или конвертирован,
+    решает БД, а вариант пользователя вычисляется по хешу.
+    """
+
+    def __init__(self, db, flush_interval: float = settings.AB_FLUSH_INTERVAL):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._experiments: Dict[int, _Experiment] = {}
+        self._stop = threading.Event()
+
+        # Счетчики
+        self.flushes = 0
+
+        self.reload()
+        self._thread = threading.Thread(target=self._run, name='ab-testing-flush', daemon=True)
+        self._thread.start()
+
+    def reload(self) -> None:
+        """Перечитать список запущенных экспериментов"""
+        rows = self.db.get_experiments(status='running')
+        with self._lock:
+            running = {}
+            for row in rows:
+                running[row['id']] = self._experiments.get(row['id']) or _Experiment(row)
+            self._experiments = running
+
+    def apply(self, user_id: int, rules: List[Dict]) -> Tuple[List[Dict], List[Dict[str, Any]]]:
+        """
+        Оставить в подобранных правилах только варианты пользователя.
+        Возвращает правила и назначения [{'experiment_id', 'variant'}].
+        """
+        if not self._experiments or not rules:
+            return rules, []
+
+        matched = {rule['id'] for rule in rules}
+        hidden: Set[int] = set()
+        assignments = []
+        with self._lock:
+            for experiment in self._experiments.values():
+                if not matched.intersection(experiment.rule_ids):
+                    continue
+                variant = assign_variant(experiment.id, user_id)
+                hidden.add(experiment.rule_ids[1 - variant])
+                assignments.append({'experiment_id': experiment.id, 'variant': VARIANTS[variant]})
+                if user_id not in experiment.new_exposures:
+                    experiment.new_exposures[user_id] = variant
+                    # Действие до первого показа в пачке - конверсия, только
+                    # если пользователь был показан раньше
+                    if user_id in experiment.conversions:
+                        experiment.conversions.discard(user_id)
+                        experiment.prior_conversions.add(user_id)
+
+        if not hidden:
+            return rules, assignments
+        return [rule for rule in rules if rule['id'] not in hidden], assignments
+
+    def record_actions(self, events: Iterable[Tuple[int, str]]) -> None:
+        """Учесть действия пользователей (user_id, action) для конверсий"""
+        if not self._experiments:
+            return
+        with self._lock:
+            for user_id, action in events:
+                for experiment in self._experiments.values():
+                    # Показ мог быть в другом процессе или в прошлой пачке -
+                    # конверсия засчитается при записи, только если показ есть в БД
+                    if action == experiment.conversion_action:
+                        experiment.conversions.add(user_id)
+
+    def flush(self) -> int:
+        """Записать накопленные показы и конверсии (возвращает число экспериментов)"""
+        with self._flush_lock:
+            with self._lock:
+                pending = []
+                for experiment in self._experiments.values():
+                    if experiment.new_exposures or experiment.conversions or experiment.prior_conversions:
+                        pending.append((experiment.id, experiment.new_exposures, experiment.conversions,
+                                        experiment.prior_conversions))
+                        experiment.new_exposures = {}
+                        experiment.conversions = set()
+                        experiment.prior_conversions = set()
+
+            for experiment_id, exposures, conversions, prior_conversions in pending:
+                try:
+                    row = self.db.record_experiment_events(experiment_id, exposures, conversions,
+                                                           prior_conversions)
+                    if row is not None:
+                        self._update_p_value(row)
+                except Exception as e:
+                    print(f"[ABTestingEngine] Ошибка записи эксперимента {experiment_id}: {e}")
+                    with self._lock:
+                        experiment = self._experiments.get(experiment_id)
+                        if experiment is not None:
+                            for user_id, variant in exposures.items():
+                                experiment.new_exposures.setdefault(user_id, variant)
+                            experiment.conversions.update(conversions)
+                            experiment.prior_conversions.update(prior_conversions)
+            self.flushes += 1
+            return len(pending)
+
+    def _update_p_value(self, row: Dict[str, Any]) -> None:
+        """Сохранить последовательное p-значение по новым счетчикам эксперимента"""
+        results = compute_results((row['exposures_a'], row['exposures_b']),
+                                  (row['conversions_a'], row['conversions_b']),
+                                  row['min_p_value'])
+        if results['sequential_p_value'] < row['min_p_value']:
+            self.db.update_experiment_p_value(row['id'], results['sequential_p_value'])
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            self.reload()
+
+    def close(self) -> None:
+        """Остановить фоновую запись и записать остаток"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+    def start_experiment(self, rule_a_id: int, rule_b_id: int,
+                         conversion_action: str = settings.AB_DEFAULT_CONVERSION_ACTION) -> int:
+        """Запустить эксперимент: правило A против правила B"""
+        if rule_a_id == rule_b_id:
+            raise ValueError('Variants must be different rules')
+        for rule_id in (rule_a_id, rule_b_id):
+            if self.db.get_rule_by_id(rule_id) is None:
+                raise ValueError(f'Rule {rule_id} not found')
+        experiment_id = self.db.add_experiment(rule_a_id, rule_b_id, conversion_action)
+        self.reload()
+        return experiment_id
+
+    def stop_experiment(self, experiment_id: int) -> bool:
+        """Остановить эксперимент (результаты сохраняются)"""
+        self.flush()
+        stopped = self.db.stop_experiment(experiment_id)
+        self.reload()
+        return stopped
+
+    def get_results(self, experiment_id: int) -> Optional[Dict[str, Any]]:
+        """Результаты эксперимента по сохраненным счетчикам"""
+        row = self.db.get_experiment(experiment_id)
+        return _experiment_results(row) if row else None
+
+    def list_results(self) -> List[Dict[str, Any]]:
+        """Результаты всех экспериментов"""
+        return [_experiment_results(row) for row in self.db.get_experiments()]
+
+
+def _experiment_results(row: Dict[str, Any]) -> Dict[str, Any]:
+    results = compute_results((row['exposures_a'], row['exposures_b']),
+                              (row['conversions_a'], row['conversions_b']),
+                              row['min_p_value'])
+    results.update({
+        'experiment_id': row['id'],
+        'rule_a_id': row['rule_a_id'],
+        'rule_b_id': row['rule_b_id'],
+        'conversion_action': row['conversion_action'],
+        'status': row['status'],
+        'created_at': row['created_at']
+    })
+    return results
+
+
+_engines: Dict[str, ABTestingEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_ab_testing(db) -> ABTestingEngine:
+    """Получить общий для процесса движок A/B тестов для файла БД"""
+    engine = _engines.get(db.db_path)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(db.db_path)
+            if engine is None:
+                engine = ABTestingEngine(db)
+                _engines[db.db_path] = engine
+    return engine
+
+
+@atexit.register
+def close_all() -> None:
+    """Записать накопленные показы и конверсии при завершении процесса"""
+    for engine in list(_engines.values()):
+        engine.close()
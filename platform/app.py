@@ -1,241 +1,185 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response
 from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import Markup
 from functools import wraps
 from datetime import datetime
-import sqlite3
-import json
 import os
+from database import DatabaseManager, RULE_FIELDS, COMPONENT_FIELDS
+from assets import build_assets, init_assets
+from caching import CachedBody, get_fragment_cache
+from columnar import get_snapshot
+from compaction import get_compactor
+from controllers import AdaptationController, TestingManager
+from data_collector import DataCollector
+from ingestion import BulkIngestionError, ingest_interactions
+from metrics import init_metrics
+from ml_engine import MLEngine
+from ml_model import get_model
+from templating import configure_templates, precompile_templates
+import settings
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
+configure_templates(app)
+init_assets(app)
+init_metrics(app)
 
-DB_PATH = 'adaptive_ui.db'
+DB_PATH = settings.DATABASE_PATH
 
+# Единый слой доступа к данным (схема создается в init_db)
+db = DatabaseManager(DB_PATH, initialize=False)
+fragment_cache = get_fragment_cache(DB_PATH)
 
-def init_db():
-    """Инициализация базы данных"""
-    if not os.path.exists(DB_PATH):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS adaptation_rules (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                conditions JSON NOT NULL,
-                actions JSON NOT NULL,
-                priority INTEGER NOT NULL,
-                enabled BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS components (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                type TEXT NOT NULL,
-                description TEXT,
-                html_template TEXT,
-                css_styles TEXT,
-                js_script TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Добавляем тестовые данные
-        cursor.execute('''
-            INSERT INTO components (name, type, description, html_template, css_styles)
-            VALUES ('Quick Tasks Widget', 'widget', 'Быстрый доступ к задачам',
-                    '<div class="quick-tasks"><h3>Мои задачи</h3><ul><li>Задача 1</li></ul></div>',
-                    '.quick-tasks { background: #f0f0f0; padding: 10px; border-radius: 5px; }')
-        ''')
-
-        cursor.execute('''
-            INSERT INTO components (name, type, description, html_template, css_styles)
-            VALUES ('CTA Button', 'button', 'Call-to-action кнопка',
-                    '<button class="cta-btn">Купить сейчас</button>',
-                    '.cta-btn { background: #007bff; color: white; padding: 10px 20px; border: none; border-radius: 4px; cursor: pointer; }')
-        ''')
-
-        cursor.execute('''
-            INSERT INTO components (name, type, description, html_template, css_styles)
-            VALUES ('User Card', 'card', 'Карточка пользователя',
-                    '<div class="user-card"><img src="avatar.jpg"><h4>Имя</h4><p>Описание</p></div>',
-                    '.user-card { border: 1px solid #ddd; padding: 15px; border-radius: 8px; text-align: center; }')
-        ''')
-
-        conn.commit()
-        conn.close()
-        print("[INIT] База данных инициализирована")
-
-
-def get_db_connection():
-    """Получить соединение с БД"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
-def get_all_rules():
-    """Получить все правила"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM adaptation_rules ORDER BY priority DESC')
-    rules = cursor.fetchall()
-    conn.close()
-    return [dict(rule) for rule in rules]
-
-
-def get_rule_by_id(rule_id):
-    """Получить правило по ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM adaptation_rules WHERE id=?', (rule_id,))
-    rule = cursor.fetchone()
-    conn.close()
-    return dict(rule) if rule else None
-
-
-def create_rule(name, description, conditions, actions, priority):
-    """Создать правило"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    conditions_json = json.dumps(conditions)
-    actions_json = json.dumps(actions)
-    cursor.execute('''
-        INSERT INTO adaptation_rules (name, description, conditions, actions, priority)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (name, description, conditions_json, actions_json, priority))
-    conn.commit()
-    rule_id = cursor.lastrowid
-    conn.close()
-    return rule_id
-
-
-def update_rule(rule_id, name, description, conditions, actions, priority, enabled):
-    """Обновить правило"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    conditions_json = json.dumps(conditions)
-    actions_json = json.dumps(actions)
-    cursor.execute('''
-        UPDATE adaptation_rules 
-        SET name=?, description=?, conditions=?, actions=?, priority=?, enabled=?, updated_at=CURRENT_TIMESTAMP
-        WHERE id=?
-    ''', (name, description, conditions_json, actions_json, priority, enabled, rule_id))
-    conn.commit()
-    conn.close()
-    return True
-
-
-def delete_rule(rule_id):
-    """Удалить правило"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM adaptation_rules WHERE id=?', (rule_id,))
-    conn.commit()
-    conn.close()
-    return True
-
-
-def toggle_rule(rule_id):
-    """Включить/выключить правило"""
-    rule = get_rule_by_id(rule_id)
-    if not rule:
-        return False
-
-    new_status = not rule['enabled']
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE adaptation_rules SET enabled=? WHERE id=?', (new_status, rule_id))
-    conn.commit()
-    conn.close()
-    return True
-
-
-def get_all_components():
-    """Получить все компоненты"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM components ORDER BY created_at DESC')
-    components = cursor.fetchall()
-    conn.close()
-    return [dict(comp) for comp in components]
-
-
-def get_component_by_id(component_id):
-    """Получить компонент по ID"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM components WHERE id=?', (component_id,))
-    component = cursor.fetchone()
-    conn.close()
-    return dict(component) if component else None
-
-
-def create_component(name, comp_type, description, html_template, css_styles, js_script=""):
-    """Создать компонент"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO components (name, type, description, html_template, css_styles, js_script)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (name, comp_type, description, html_template, css_styles, js_script))
-    conn.commit()
-    component_id = cursor.lastrowid
-    conn.close()
-    return component_id
-
-
-def update_component(component_id, name, comp_type, description, html_template, css_styles, js_script=""):
-    """Обновить компонент"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE components 
-        SET name=?, type=?, description=?, html_template=?, css_styles=?, js_script=?
-        WHERE id=?
-    ''', (name, comp_type, description, html_template, css_styles, js_script, component_id))
-    conn.commit()
-    conn.close()
-    return True
-
-
-def delete_component(component_id):
-    """Удалить компонент"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM components WHERE id=?', (component_id,))
-    conn.commit()
-    conn.close()
-    return True
+MAX_PAGE_SIZE = 1000
 
+_adaptation_controller = None
+_data_collector = None
+_testing_manager = None
 
-def get_statistics():
-    """Получить статистику"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# Тестовые компоненты для новой базы данных
+DEFAULT_COMPONENTS = [
+    ('Quick Tasks Widget', 'widget', 'Быстрый доступ к задачам',
+     '<div class="quick-tasks"><h3>Мои задачи</h3><ul><li>Задача 1</li></ul></div>',
+     '.quick-tasks { background: #f0f0f0; padding: 10px; border-radius: 5px; }'),
+    ('CTA Button', 'button', 'Call-to-action кнопка',
+     '<button class="cta-btn">Купить сейчас</button>',
+     '.cta-btn { background: #007bff; color: white; padding: 10px 20px; border: none; border-radius: 4px; cursor: pointer; }'),
+    ('User Card', 'card', 'Карточка пользователя',
+     '<div class="user-card"><img src="avatar.jpg"><h4>Имя</h4><p>Описание</p></div>',
+     '.user-card { border: 1px solid #ddd; padding: 15px; border-radius: 8px; text-align: center; }'),
+]
 
-    cursor.execute('SELECT COUNT(*) as count FROM adaptation_rules')
-    total_rules = cursor.fetchone()['count']
 
-    cursor.execute('SELECT COUNT(*) as count FROM adaptation_rules WHERE enabled = 1')
-    active_rules = cursor.fetchone()['count']
-
-    cursor.execute('SELECT COUNT(*) as count FROM components')
-    total_components = cursor.fetchone()['count']
-
-    conn.close()
+def init_db():
+    """Инициализация базы данных"""
+    is_new = not os.path.exists(DB_PATH)
+    db.init_database()
 
-    return {
-        'total_rules': total_rules,
-        'active_rules': active_rules,
-        'total_components': total_components
-    }
+    if is_new:
+        for component in DEFAULT_COMPONENTS:
+            db.add_component(*component)
+        print("[INIT] База данных инициализирована")
 
+    # Сжатие старых событий и сроки хранения (settings.INTERACTION_*_RETENTION_DAYS)
+    get_compactor(db).start()
+
+    # Веса модели открываются один раз на процесс (memory map, общий для воркеров)
+    get_model(settings.ML_MODEL_PATH)
+
+    # Статика с хешем в имени (кешируется браузером навсегда) и шаблоны
+    if settings.ASSETS_BUILD_ON_START:
+        build_assets()
+    precompile_templates(app)
+
+
+def get_adaptation_controller():
+    """Контроллер адаптации (создается при первом обращении)"""
+    global _adaptation_controller
+    if _adaptation_controller is None:
+        _adaptation_controller = AdaptationController(db, MLEngine())
+    return _adaptation_controller
+
+
+def get_data_collector():
+    """Сборщик данных о поведении (создается при первом обращении)"""
+    global _data_collector
+    if _data_collector is None:
+        _data_collector = DataCollector(db)
+    return _data_collector
+
+
+def get_testing_manager():
+    """Менеджер A/B тестов (None, если тестирование выключено)"""
+    global _testing_manager
+    if _testing_manager is None and settings.ENABLE_A_B_TESTING:
+        _testing_manager = TestingManager(db)
+    return _testing_manager
+
+
+def parse_fields(allowed):
+    """Разобрать ?fields=a,b,c (id включается всегда); ValueError при неизвестном поле"""
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    fields = ['id']
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in allowed:
+            raise ValueError(f'Unknown field: {name}')
+        fields.append(name)
+    return tuple(fields)
+
+
+def parse_list_args(allowed):
+    """Разобрать параметры списочного API: fields, after_id, limit"""
+    fields = parse_fields(allowed)
+    after_id = request.args.get('after_id', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    return fields, after_id, limit
+
+
+def page_headers(rows, limit):
+    """Заголовок с курсором следующей страницы (если страница заполнена)"""
+    if limit is not None and len(rows) == limit:
+        return {'X-Next-After-Id': str(rows[-1]['id'])}
+    return {}
+
+
+def stream_json_array(items):
+    """
+    JSON-массив, отдаваемый по мере чтения items (dict или sqlite3.Row):
+    ни список строк, ни тело ответа целиком в памяти не собираются, первый
+    байт уходит клиенту до чтения последней строки
+    """
+    dumps = app.json.dumps
+    batch = settings.API_STREAM_BATCH_ROWS
+
+    def generate():
+        # Пачка строк сериализуется одним вызовом dumps: без скобок массива
+        # это готовый фрагмент тела
+        rows = []
+        separator = '['
+        for item in items:
+            rows.append(dict(item))
+            if len(rows) >= batch:
+                yield separator + dumps(rows)[1:-1]
+                rows = []
+                separator = ','
+        if rows:
+            yield separator + dumps(rows)[1:-1] + ']'
+        else:
+            yield '[]' if separator == '[' else ']'
+
+    return Response(generate(), mimetype='application/json')
+
+
+def cached_response(key, builder, mimetype):
+    """Ответ из кеша компонентов с ETag (304 при совпадении If-None-Match)"""
+    cached = db.components_cache.get_or_build(key, builder, db.get_components_version())
+    response = Response(cached.body, mimetype=mimetype, headers=cached.headers)
+    response.set_etag(cached.etag)
+    # Клиент хранит ответ, но перепроверяет его при каждом запросе
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def stats_version(stats):
+    """Версия блока статистики: счетчики меняются только вместе с данными"""
+    return tuple(sorted(stats.items()))
+
+
+def render_fragment(name, version, context_builder):
+    """
+    Фрагмент страницы templates/fragments/<name>.html из кеша: данные читаются
+    и фрагмент отрисовывается, только если для этой версии данных его еще нет
+    """
+    return fragment_cache.get_or_build(
+        (name, version),
+        lambda: Markup(render_template(f'fragments/{name}.html', **context_builder())))
 
 
 def login_required(f):
@@ -283,33 +227,23 @@ def logout():
 @login_required
 def dashboard():
     """Дашборд"""
-    stats = get_statistics()
-    rules = get_all_rules()
+    stats = db.get_statistics()
 
-    for rule in rules:
-        if isinstance(rule.get('conditions'), str):
-            rule['conditions'] = json.loads(rule['conditions'])
-        if isinstance(rule.get('actions'), str):
-            rule['actions'] = json.loads(rule['actions'])
-
-    return render_template('dashboard.html',
-                           stats=stats,
-                           rules=rules,
-                           username=session.get('username'))
+    # Правила читаются и таблица перерисовывается только после их изменения
+    return render_template(
+        'dashboard.html',
+        stats_block=render_fragment('dashboard_stats', stats_version(stats),
+                                    lambda: {'stats': stats}),
+        rules_block=render_fragment('recent_rules', db.rule_store.version,
+                                    lambda: {'rules': db.rule_store.all()}),
+        username=session.get('username'))
 
 
 @app.route('/rules')
 @login_required
 def rules():
     """Управление правилами"""
-    rules_list = get_all_rules()
-
-    for rule in rules_list:
-        if isinstance(rule.get('conditions'), str):
-            rule['conditions'] = json.loads(rule['conditions'])
-        if isinstance(rule.get('actions'), str):
-            rule['actions'] = json.loads(rule['actions'])
-
+    rules_list = db.rule_store.all()
     return render_template('rules.html', rules=rules_list)
 
 
@@ -334,18 +268,13 @@ def edit_rule(rule_id):
             'layout': request.form.get('layout')
         }
 
-        update_rule(rule_id, name, description, conditions, actions, priority, enabled)
+        db.update_rule(rule_id, name, description, conditions, actions, priority, enabled)
         return redirect(url_for('rules'))
 
-    rule = get_rule_by_id(rule_id)
+    rule = db.rule_store.get(rule_id)
     if not rule:
         return redirect(url_for('rules'))
 
-    if isinstance(rule.get('conditions'), str):
-        rule['conditions'] = json.loads(rule['conditions'])
-    if isinstance(rule.get('actions'), str):
-        rule['actions'] = json.loads(rule['actions'])
-
     return render_template('edit_rule.html', rule=rule)
 
 
@@ -353,7 +282,7 @@ def edit_rule(rule_id):
 @login_required
 def delete_rule_route(rule_id):
     """Удалить правило"""
-    delete_rule(rule_id)
+    db.delete_rule(rule_id)
     return redirect(url_for('rules'))
 
 
@@ -361,7 +290,7 @@ def delete_rule_route(rule_id):
 @login_required
 def toggle_rule_route(rule_id):
     """Включить/выключить правило"""
-    toggle_rule(rule_id)
+    db.toggle_rule(rule_id)
     return redirect(url_for('rules'))
 
 
@@ -385,7 +314,7 @@ def create_rule_page():
             'layout': request.form.get('layout')
         }
 
-        create_rule(name, description, conditions, actions, priority)
+        db.add_rule(name, description, conditions, actions, priority)
         return redirect(url_for('rules'))
 
     return render_template('create_rule.html')
@@ -395,8 +324,11 @@ def create_rule_page():
 @login_required
 def components():
     """Библиотека компонентов"""
-    components_list = get_all_components()
-    return render_template('components.html', components=components_list)
+    return cached_response(
+        'page',
+        lambda: CachedBody(render_template('components.html',
+                                           components=db.get_components()).encode('utf-8')),
+        'text/html')
 
 
 @app.route('/components/create', methods=['GET', 'POST'])
@@ -404,20 +336,14 @@ def create_component_page():
     """Создание нового компонента"""
     if request.method == 'POST':
         try:
-            conn = get_db_connection()
-            conn.execute('''
-                INSERT INTO components (name, type, description, html_template, css_styles, js_script)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
+            db.add_component(
                 request.form.get('name'),
                 request.form.get('type'),
                 request.form.get('description'),
                 request.form.get('html_template'),
                 request.form.get('css_styles'),
                 request.form.get('js_script', '')
-            ))
-            conn.commit()
-            conn.close()
+            )
             return redirect(url_for('components'))
         except Exception as e:
             print(f"Error creating component: {e}")
@@ -429,7 +355,7 @@ def create_component_page():
 @login_required
 def view_component(component_id):
     """Просмотреть компонент"""
-    component = get_component_by_id(component_id)
+    component = db.get_component_by_id(component_id)
     if not component:
         return redirect(url_for('components'))
 
@@ -448,11 +374,11 @@ def edit_component(component_id):
         css_styles = request.form.get('css_styles')
         js_script = request.form.get('js_script', '')
 
-        update_component(component_id, name, comp_type, description,
-                         html_template, css_styles, js_script)
+        db.update_component(component_id, name, comp_type, description,
+                            html_template, css_styles, js_script)
         return redirect(url_for('components'))
 
-    component = get_component_by_id(component_id)
+    component = db.get_component_by_id(component_id)
     if not component:
         return redirect(url_for('components'))
 
@@ -463,7 +389,7 @@ def edit_component(component_id):
 @login_required
 def delete_component_route(component_id):
     """Удалить компонент"""
-    delete_component(component_id)
+    db.delete_component(component_id)
     return redirect(url_for('components'))
 
 
@@ -471,57 +397,192 @@ def delete_component_route(component_id):
 @login_required
 def analytics():
     """Аналитика и отчеты"""
-    stats = get_statistics()
-    rules = get_all_rules()
+    stats = db.get_statistics()
+    snapshot = get_snapshot()
+    testing = get_testing_manager()
 
     report = {
-        'summary': stats,
-        'rules': rules,
+        'experiments': testing.list_experiments() if testing else [],
         'timestamp': datetime.now().isoformat()
     }
 
-    return render_template('analytics.html', report=report)
+    # Снимок неизменен до следующей выгрузки - его время создания и есть версия
+    snapshot_version = snapshot.manifest['created_at'] if snapshot else None
+    return render_template(
+        'analytics.html',
+        report=report,
+        summary_block=render_fragment('analytics_summary', stats_version(stats),
+                                      lambda: {'stats': stats}),
+        interactions_block=render_fragment(
+            'analytics_interactions', snapshot_version,
+            lambda: {'interactions': snapshot.summary() if snapshot else None}))
 
 
 # ==================== API ENDPOINTS ====================
 
 @app.route('/api/rules', methods=['GET'])
 def api_get_rules():
-    """API: Получить все правила"""
-    rules = get_all_rules()
-    for rule in rules:
-        if isinstance(rule.get('conditions'), str):
-            rule['conditions'] = json.loads(rule['conditions'])
-        if isinstance(rule.get('actions'), str):
-            rule['actions'] = json.loads(rule['actions'])
-    return jsonify(rules)
+    """API: Получить все правила (?fields=&after_id=&limit=)"""
+    try:
+        fields, after_id, limit = parse_list_args(RULE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Правила уже разобраны и лежат в памяти процесса (RuleStore)
+    if after_id is None and limit is None:
+        rules = db.rule_store.all()
+    else:
+        rules = db.rule_store.page(after_id, limit)
+    stream = len(rules) > settings.API_STREAM_MIN_ROWS
+    rules = (rule.to_dict() for rule in rules)
+    if fields:
+        rules = ({name: rule[name] for name in fields} for rule in rules)
+    if stream:
+        # Длинный список (только без limit) отдается потоком
+        return stream_json_array(rules)
+    rules = list(rules)
+    response = jsonify(rules)
+    response.headers.update(page_headers(rules, limit))
+    return response
 
 
 @app.route('/api/rules', methods=['POST'])
 def api_create_rule():
     """API: Создать правило"""
     data = request.json
-    rule_id = create_rule(
-        data.get('name'),
-        data.get('description'),
-        data.get('conditions'),
-        data.get('actions'),
-        data.get('priority', 1)
-    )
+    try:
+        rule_id = db.add_rule(
+            data.get('name'),
+            data.get('description'),
+            data.get('conditions'),
+            data.get('actions'),
+            data.get('priority', 1)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify({'rule_id': rule_id, 'status': 'created'})
 
 
 @app.route('/api/components', methods=['GET'])
 def api_get_components():
-    """API: Получить все компоненты"""
-    components = get_all_components()
-    return jsonify(components)
+    """API: Получить все компоненты (?fields=&after_id=&limit=)"""
+    try:
+        fields, after_id, limit = parse_list_args(COMPONENT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if limit is None and db.get_statistics()['total_components'] > settings.API_STREAM_MIN_ROWS:
+        # Длинный список не кешируется целиком, а читается keyset-страницами потоком
+        return stream_json_array(db.iter_components(fields, after_id))
+
+    def build():
+        components = db.get_components(fields, after_id, limit)
+        return CachedBody(app.json.dumps(components).encode('utf-8'),
+                          page_headers(components, limit))
+
+    return cached_response(('api', fields, after_id, limit), build, 'application/json')
+
+
+@app.route('/api/components/<int:component_id>', methods=['GET'])
+def api_get_component(component_id):
+    """API: Получить компонент (?fields=)"""
+    try:
+        fields = parse_fields(COMPONENT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    component = db.get_component_by_id(component_id, fields)
+    if not component:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(component)
+
+
+@app.route('/api/user/adapt', methods=['POST'])
+async def api_adapt_user():
+    """API: Адаптировать интерфейс для пользователя"""
+    data = request.get_json(silent=True) or {}
+    try:
+        user_id = int(data['user_id'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'user_id is required'}), 400
+
+    result = await get_adaptation_controller().handle_user_login_async(user_id)
+    return jsonify(result)
+
+
+@app.route('/api/user/context/<int:user_id>', methods=['GET'])
+async def api_get_user_context(user_id):
+    """API: Получить контекст пользователя"""
+    result = await get_adaptation_controller().gather_context_async(user_id)
+    return jsonify(result)
+
+
+@app.route('/api/interactions/bulk', methods=['POST'])
+def api_ingest_interactions():
+    """API: Принять поток событий NDJSON (одно событие JSON на строку)"""
+    try:
+        result = ingest_interactions(get_data_collector(), request.stream)
+    except BulkIngestionError as e:
+        # Уже записанные пачки остаются в БД - клиент повторяет только остаток
+        return jsonify(dict(e.result, error=str(e))), 503
+    return jsonify(result)
+
+
+@app.route('/api/experiments', methods=['GET'])
+def api_get_experiments():
+    """API: Получить A/B эксперименты с результатами"""
+    testing = get_testing_manager()
+    if testing is None:
+        return jsonify({'error': 'A/B testing is disabled'}), 404
+    return jsonify(testing.list_experiments())
+
+
+@app.route('/api/experiments', methods=['POST'])
+def api_start_experiment():
+    """API: Запустить A/B эксперимент (rule_a_id, rule_b_id, conversion_action)"""
+    testing = get_testing_manager()
+    if testing is None:
+        return jsonify({'error': 'A/B testing is disabled'}), 404
+
+    data = request.get_json(silent=True) or {}
+    try:
+        rule_a_id = int(data['rule_a_id'])
+        rule_b_id = int(data['rule_b_id'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'rule_a_id and rule_b_id are required'}), 400
+    conversion_action = data.get('conversion_action', settings.AB_DEFAULT_CONVERSION_ACTION)
+    if not isinstance(conversion_action, str) or not conversion_action:
+        return jsonify({'error': 'conversion_action must be a non-empty string'}), 400
+
+    try:
+        experiment_id = testing.start_experiment(rule_a_id, rule_b_id, conversion_action)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'experiment_id': experiment_id, 'status': 'running'})
+
+
+@app.route('/api/experiments/<int:experiment_id>', methods=['GET'])
+def api_get_experiment(experiment_id):
+    """API: Результаты A/B эксперимента"""
+    testing = get_testing_manager()
+    results = testing.get_results(experiment_id) if testing else None
+    if results is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(results)
+
+
+@app.route('/api/experiments/<int:experiment_id>/stop', methods=['POST'])
+def api_stop_experiment(experiment_id):
+    """API: Остановить A/B эксперимент"""
+    testing = get_testing_manager()
+    if testing is None or not testing.stop_experiment(experiment_id):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'experiment_id': experiment_id, 'status': 'stopped'})
 
 
 @app.route('/api/statistics', methods=['GET'])
 def api_get_statistics():
     """API: Получить статистику"""
-    stats = get_statistics()
+    stats = db.get_statistics()
     return jsonify(stats)
 
 
@@ -0,0 +1,7 @@
+"""Точка входа для ASGI-сервера: uvicorn asgi:asgi_app"""
+from asgiref.wsgi import WsgiToAsgi
+from app import app, init_db
+
+init_db()
+
+asgi_app = WsgiToAsgi(app)
@@ -0,0 +1,234 @@
+"""Сборка статики: минификация, имена с хешем содержимого и сжатые копии .gz
+
+Сборка при выкладке (один раз, до запуска воркеров) из каталога platform:
+    python assets.py
+Прежние версии файлов с хешем сохраняются в каталоге сборки.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import Dict, Optional
+from flask import request, send_from_directory, url_for
+from werkzeug.security import safe_join
+import settings
+
+# Исходная статика приложения и каталог сборки внутри нее
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, settings.ASSETS_DIST_DIR)
+MANIFEST_FILE = 'manifest.json'
+# Временные каталоги сборок (у каждой сборки свой)
+BUILD_TMP_PREFIX = f'.{settings.ASSETS_DIST_DIR}-build-'
+# Собираемые файлы (пути относительно каталога статики)
+ASSET_EXTENSIONS = ('.css', '.js')
+# Ответ .gz отдается, только если он заметно меньше исходного
+GZIP_MIN_RATIO = 0.9
+
+_CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|/\*.*?\*/''', re.S)
+_CSS_TIGHT = re.compile(r'\s*([{};,>])\s*')
+
+
+def _tighten_css(code: str) -> str:
+    code = re.sub(r'\s+', ' ', code)
+    code = _CSS_TIGHT.sub(r'\1', code)
+    return re.sub(r':\s+', ':', code).replace(';}', '}')
+
+
+def minify_css(source: str) -> str:
+    """Убрать комментарии и лишние пробелы (строки в кавычках не меняются)"""
+    parts = []
+    code = []
+    position = 0
+    for match in _CSS_TOKENS.finditer(source):
+        code.append(source[position:match.start()])
+        position = match.end()
+        if match.group(1) is None:
+            # Комментарий
+            code.append(' ')
+            continue
+        parts.append(_tighten_css(''.join(code)))
+        parts.append(match.group(1))
+        code = []
+    code.append(source[position:])
+    parts.append(_tighten_css(''.join(code)))
+    return ''.join(parts).strip() + '\n'
+
+
+def minify_js(source: str) -> str:
+    """
+    Консервативная минификация: убираются отступы, пустые строки и строки
+    комментариев //. Переводы строк сохраняются (автоматическая вставка
+    точек с запятой работает как прежде), многострочные шаблонные строки
+    не меняются.
+    """
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        # Нечетное число обратных кавычек - строка шаблона продолжается
+        if (line.count('`') - line.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def build_assets(static_dir: str = STATIC_DIR, dist_dir: str = DIST_DIR) -> Dict[str, str]:
+    """
+    Собрать статику в dist_dir: каждый .css/.js минифицируется, получает
+    в имени хеш содержимого (style.3f2a9c1b04de.css) и сжатую копию .gz.
+    Возвращает манифест {исходный путь: собранный путь} (пути от dist_dir).
+
+    Каждая сборка идет в свой временный каталог, после чего файлы только
+    добавляются в dist_dir: прежние версии с хешем остаются (их адреса
+    есть в закешированных страницах), а параллельные сборки воркеров
+    не мешают друг другу. Манифест заменяется последним одной операцией.
+    """
+    os.makedirs(dist_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=BUILD_TMP_PREFIX, dir=os.path.dirname(dist_dir))
+    try:
+        manifest, original_size, built_size, gzip_size = _build_into(static_dir, dist_dir, tmp_dir)
+
+        # Файлы с хешем в имени не меняются: уже существующие не трогаются
+        for root, _, files in os.walk(tmp_dir):
+            for filename in files:
+                built_path = os.path.join(root, filename)
+                target = os.path.join(dist_dir, os.path.relpath(built_path, tmp_dir))
+                if os.path.exists(target):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(built_path, target)
+
+        manifest_path = os.path.join(tmp_dir, MANIFEST_FILE)
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(manifest_path, os.path.join(dist_dir, MANIFEST_FILE))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"[assets] Собрано файлов: {len(manifest)}, байт: {original_size} -> {built_size} "
+          f"(gzip {gzip_size})")
+    return manifest
+
+
+def _build_into(static_dir: str, dist_dir: str, tmp_dir: str):
+    """Собрать файлы в tmp_dir: (манифест, байт исходных, байт собранных, байт gzip)"""
+    manifest: Dict[str, str] = {}
+    original_size = built_size = gzip_size = 0
+
+    for root, dirs, files in os.walk(static_dir):
+        # Не собирать результат прошлых и идущих сборок
+        dirs[:] = [d for d in dirs
+                   if os.path.join(root, d) != dist_dir and not d.startswith(BUILD_TMP_PREFIX)]
+        for filename in sorted(files):
+            name, ext = os.path.splitext(filename)
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            source_path = os.path.join(root, filename)
+            relative = os.path.relpath(source_path, static_dir).replace(os.sep, '/')
+            with open(source_path, encoding='utf-8') as f:
+                source = f.read()
+
+            data = MINIFIERS[ext](source).encode('utf-8')
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            built = f'{os.path.dirname(relative)}/{name}.{digest}{ext}'.lstrip('/')
+            built_path = os.path.join(tmp_dir, built)
+            os.makedirs(os.path.dirname(built_path), exist_ok=True)
+            with open(built_path, 'wb') as f:
+                f.write(data)
+
+            # mtime=0 - одинаковое содержимое дает одинаковый .gz
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data) * GZIP_MIN_RATIO:
+                with open(built_path + '.gz', 'wb') as f:
+                    f.write(compressed)
+                gzip_size += len(compressed)
+            else:
+                gzip_size += len(data)
+
+            manifest[relative] = built
+            original_size += len(source.encode('utf-8'))
+            built_size += len(data)
+
+    return manifest, original_size, built_size, gzip_size
+
+
+class AssetManifest:
+    """Соответствие исходных путей статики собранным (перечитывается после новой сборки)"""
+
+    def __init__(self, dist_dir: str):
+        self.dist_dir = dist_dir
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._entries: Dict[str, str] = {}
+
+    def get(self, filename: str) -> Optional[str]:
+        """Собранный путь файла (None - файл не собран)"""
+        try:
+            version = os.stat(os.path.join(self.dist_dir, MANIFEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    with open(os.path.join(self.dist_dir, MANIFEST_FILE), encoding='utf-8') as f:
+                        self._entries = json.load(f)
+                    self._version = version
+        return self._entries.get(filename)
+
+
+def init_assets(app, dist_dir: str = DIST_DIR) -> None:
+    """
+    Подключить собранную статику: в шаблонах asset_url('css/style.css')
+    дает адрес версии с хешем, которая отдается с Cache-Control: immutable
+    (и сжатой, если клиент принимает gzip). Без сборки asset_url ведет на
+    исходный файл.
+    """
+    manifest = AssetManifest(dist_dir)
+    dist_root = os.path.abspath(dist_dir)
+
+    def asset_url(filename: str) -> str:
+        built = manifest.get(filename)
+        if built is None:
+            return url_for('static', filename=filename)
+        return url_for('asset', filename=built)
+
+    @app.route(f'{settings.ASSETS_URL_PATH}/<path:filename>', endpoint='asset')
+    def asset(filename):
+        """Собранный файл статики (имя меняется вместе с содержимым)"""
+        gzipped = safe_join(dist_root, filename + '.gz')
+        if 'gzip' in request.accept_encodings and gzipped and os.path.isfile(gzipped):
+            response = send_from_directory(dist_root, filename + '.gz',
+                                           mimetype=_mimetype(filename), conditional=True)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = send_from_directory(dist_root, filename, conditional=True)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.max_age = settings.ASSETS_MAX_AGE
+        response.cache_control.immutable = True
+        return response
+
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+def _mimetype(filename: str) -> str:
+    if filename.endswith('.css'):
+        return 'text/css'
+    if filename.endswith('.js'):
+        return 'text/javascript'
+    return 'application/octet-stream'
+
+
+if __name__ == '__main__':
+    build_assets()
@@ -0,0 +1,315 @@
+import atexit
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+from caching import get_behavior_cache
+import settings
+
+# Скользящие окна: (название, длина в секундах, размер корзины в секундах).
+# Размер корзины каждого окна делит размер самой крупной корзины (1 ч).
+WINDOWS: Tuple[Tuple[str, int, int], ...] = (
+    ('5m', 300, 60),
+    ('1h', 3600, 300),
+    ('24h', 86400, 3600),
+)
+_COARSEST_BUCKET = max(bucket for _, _, bucket in WINDOWS)
+_LONGEST_WINDOW = max(span for _, span, _ in WINDOWS)
+
+# Метрики корзины
+METRICS = ('events', 'clicks', 'page_views', 'interaction_time')
+CLICK_ACTIONS = frozenset({'click'})
+VIEW_ACTIONS = frozenset({'view', 'page_view'})
+
+# Слот корзины в снимке: номер окна, номер корзины, значения METRICS
+_SLOT_SIZE = 2 + len(METRICS)
+
+
+class _UserWindows:
+    """Кольца корзин одного пользователя и текущие суммы по окнам"""
+
+    __slots__ = ('last_ts', 'anchor_ts', 'buckets', 'totals')
+
+    def __init__(self):
+        self.last_ts: Optional[int] = None
+        # Последнее событие до крупной корзины, в которую попало last_ts
+        self.anchor_ts: Optional[int] = None
+        # buckets[w][slot] = [номер корзины, *METRICS] или None
+        self.buckets = [[None] * (span // bucket) for _, span, bucket in WINDOWS]
+        self.totals = [[0.0] * len(METRICS) for _ in WINDOWS]
+
+    def _expire(self, window: int, bucket_no: int) -> None:
+        """Вычесть корзины, выпавшие из окна к корзине bucket_no"""
+        ring = self.buckets[window]
+        totals = self.totals[window]
+        oldest = bucket_no - len(ring)
+        for slot, entry in enumerate(ring):
+            if entry is not None and entry[0] <= oldest:
+                for i in range(len(METRICS)):
+                    totals[i] -= entry[i + 1]
+                ring[slot] = None
+
+    def add(self, ts: int, values: Tuple[float, ...]) -> None:
+        for window, (_, _, size) in enumerate(WINDOWS):
+            ring = self.buckets[window]
+            bucket_no = ts // size
+            slot = bucket_no % len(ring)
+            entry = ring[slot]
+            if entry is None or entry[0] != bucket_no:
+                self._expire(window, bucket_no)
+                entry = ring[slot]
+                if entry is not None:
+                    # Событие старше окна - не учитываем
+                    continue
+                entry = ring[slot] = [bucket_no] + [0.0] * len(METRICS)
+            totals = self.totals[window]
+            for i, value in enumerate(values, 1):
+                entry[i] += value
+                totals[i - 1] += value
+
+    def read(self, now: int) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for window, (name, _, size) in enumerate(WINDOWS):
+            self._expire(window, now // size)
+            result[name] = dict(zip(METRICS, self.totals[window]))
+        return result
+
+    def drop_since(self, since_ts: int) -> None:
+        """Убрать корзины, начинающиеся не раньше since_ts (их события будут переиграны)"""
+        for window, (_, _, size) in enumerate(WINDOWS):
+            ring = self.buckets[window]
+            totals = self.totals[window]
+            for slot, entry in enumerate(ring):
+                if entry is not None and entry[0] * size >= since_ts:
+                    for i in range(len(METRICS)):
+                        totals[i] -= entry[i + 1]
+                    ring[slot] = None
+        if self.last_ts is not None and self.last_ts >= since_ts:
+            # since_ts - начало крупной корзины last_ts, предыдущее событие - anchor_ts
+            self.last_ts = self.anchor_ts
+
+    def dump(self) -> bytes:
+        """Компактный снимок: только непустые корзины"""
+        packed = array('d', [-1.0 if self.anchor_ts is None else self.anchor_ts])
+        for window, ring in enumerate(self.buckets):
+            for entry in ring:
+                if entry is not None:
+                    packed.append(window)
+                    packed.extend(entry)
+        return packed.tobytes()
+
+    @classmethod
+    def load(cls, last_ts: Optional[int], state: bytes) -> '_UserWindows':
+        windows = cls()
+        windows.last_ts = last_ts
+        packed = array('d')
+        packed.frombytes(state)
+        windows.anchor_ts = None if packed[0] < 0 else int(packed[0])
+        for offset in range(1, len(packed), _SLOT_SIZE):
+            window = int(packed[offset])
+            entry = [int(packed[offset + 1])] + list(packed[offset + 2:offset + _SLOT_SIZE])
+            ring = windows.buckets[window]
+            ring[entry[0] % len(ring)] = entry
+            totals = windows.totals[window]
+            for i in range(len(METRICS)):
+                totals[i] += entry[i + 1]
+        return windows
+
+
+class BehaviorAggregator:
+    """Потоковые счетчики поведения пользователей в скользящих окнах
+
+    Источник событий - user_interactions: фоновый поток каждые sync_interval
+    секунд дочитывает события с id больше последнего учтенного и добавляет
+    их в корзины окон 5 мин / 1 ч / 24 ч. Поэтому в каждом процессе окна
+    учитывают события всех процессов, а чтение признаков не зависит от длины
+    истории. Пользователи с новыми событиями сбрасываются из кеша признаков.
+
+    Снимок (непустые корзины измененных пользователей и id последнего
+    учтенного события) периодически сохраняется в behavior_windows; пишет
+    его только процесс, дочитавший события дальше сохраненного снимка. При
+    старте загружается снимок и дочитываются события после него; без снимка
+    (или если он старше самого длинного окна) переигрываются последние 24 часа.
+    """
+
+    def __init__(self, db, checkpoint_interval: float = settings.BEHAVIOR_CHECKPOINT_INTERVAL,
+                 sync_interval: float = settings.BEHAVIOR_SYNC_INTERVAL,
+                 session_gap: int = settings.BEHAVIOR_SESSION_GAP):
+        self.db = db
+        self.checkpoint_interval = checkpoint_interval
+        self.sync_interval = sync_interval
+        self.session_gap = session_gap
+        self.features_cache = get_behavior_cache(db.db_path)
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._users: Dict[int, _UserWindows] = {}
+        self._dirty: Set[int] = set()
+        # id последнего учтенного события
+        self._last_id = 0
+        self._stop = threading.Event()
+
+        # Счетчики
+        self.events = 0
+        self.replayed = 0
+        self.syncs = 0
+        self.checkpoints = 0
+
+        self._restore()
+        self._thread = threading.Thread(target=self._run, name='behavior-sync', daemon=True)
+        self._thread.start()
+
+    def _restore(self) -> None:
+        checkpoint_ts, last_id, states = self.db.get_behavior_checkpoint()
+        now = int(time.time())
+        if last_id and checkpoint_ts >= now - _LONGEST_WINDOW:
+            for user_id, last_ts, state in states:
+                self._users[user_id] = _UserWindows.load(last_ts, state)
+            self._last_id = last_id
+            self.replayed = self.sync()
+        else:
+            # Снимка нет или все его корзины уже вне окон
+            self._last_id, events = self.db.get_interaction_events_since(now - _LONGEST_WINDOW)
+            for _, user_id, action, ts in events:
+                self._apply(user_id, ts, 1, action in CLICK_ACTIONS, action in VIEW_ACTIONS)
+            self.replayed = self.events = len(events)
+        self._dirty.update(self._users)
+        print(f"[BehaviorAggregator] Восстановлено пользователей: {len(self._users)}, "
+              f"переиграно событий: {self.replayed}")
+
+    def _apply(self, user_id: int, ts: int, events: int, clicks: int, page_views: int) -> None:
+        """Добавить события пользователя с одним временем ts"""
+        windows = self._users.get(user_id)
+        if windows is None:
+            windows = self._users[user_id] = _UserWindows()
+
+        # Время взаимодействия - промежутки между событиями одной сессии
+        gap = 0
+        if windows.last_ts is not None and 0 < ts - windows.last_ts <= self.session_gap:
+            gap = ts - windows.last_ts
+        if windows.last_ts is None or ts > windows.last_ts:
+            if windows.last_ts is not None and ts // _COARSEST_BUCKET != windows.last_ts // _COARSEST_BUCKET:
+                windows.anchor_ts = windows.last_ts
+            windows.last_ts = ts
+
+        windows.add(ts, (events, clicks, page_views, gap))
+        self._dirty.add(user_id)
+
+    def sync(self, batch: int = settings.BEHAVIOR_SYNC_BATCH) -> int:
+        """Учесть события, записанные в БД после последнего учтенного (возвращает их число)"""
+        applied = 0
+        changed: Set[int] = set()
+        with self._sync_lock:
+            while True:
+                events = self.db.get_interaction_events_after(self._last_id, batch)
+                if not events:
+                    break
+                with self._lock:
+                    for _, user_id, action, ts in events:
+                        self._apply(user_id, ts, 1, action in CLICK_ACTIONS, action in VIEW_ACTIONS)
+                        changed.add(user_id)
+                    self._last_id = events[-1][0]
+                    self.events += len(events)
+                applied += len(events)
+                if len(events) < batch:
+                    break
+            self.syncs += 1
+        if changed:
+            self.features_cache.invalidate_many(changed)
+        return applied
+
+    def get_features(self, user_id: int) -> Dict[str, Dict[str, float]]:
+        """Метрики пользователя по окнам: {'5m': {'events': ..., ...}, '1h': ..., '24h': ...}"""
+        now = int(time.time())
+        with self._lock:
+            windows = self._users.get(user_id)
+            if windows is None:
+                return {name: dict.fromkeys(METRICS, 0.0) for name, _, _ in WINDOWS}
+            return windows.read(now)
+
+    def checkpoint(self) -> int:
+        """Сохранить снимок измененных пользователей (возвращает число записанных)"""
+        with self._lock:
+            checkpoint_ts = int(time.time())
+            last_id = self._last_id
+            expired_before = checkpoint_ts - _LONGEST_WINDOW
+            states: List[Tuple[int, Optional[int], bytes]] = []
+            removed: List[int] = []
+            for user_id in self._dirty:
+                windows = self._users[user_id]
+                if windows.last_ts is not None and windows.last_ts < expired_before:
+                    # Все корзины пользователя вне окон
+                    del self._users[user_id]
+                    removed.append(user_id)
+                else:
+                    states.append((user_id, windows.last_ts, windows.dump()))
+            self._dirty.clear()
+
+        try:
+            saved = self.db.save_behavior_checkpoint(checkpoint_ts, last_id, states, removed)
+        except Exception as e:
+            with self._lock:
+                self._dirty.update(user_id for user_id, _, _ in states)
+                self._dirty.update(user_id for user_id in removed if user_id in self._users)
+            print(f"[BehaviorAggregator] Ошибка сохранения снимка: {e}")
+            return 0
+        if not saved:
+            # Снимок другого процесса учитывает не меньше событий - изменения уже в нем
+            return 0
+        self.checkpoints += 1
+        return len(states)
+
+    def _run(self) -> None:
+        next_checkpoint = time.monotonic() + self.checkpoint_interval
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"[BehaviorAggregator] Ошибка чтения событий: {e}")
+            if time.monotonic() >= next_checkpoint:
+                self.checkpoint()
+                next_checkpoint = time.monotonic() + self.checkpoint_interval
+
+    def close(self) -> None:
+        """Остановить фоновый поток, учесть последние события и записать снимок"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self.sync()
+        self.checkpoint()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Получить счетчики агрегатора"""
+        return {
+            'users': len(self._users),
+            'dirty': len(self._dirty),
+            'last_event_id': self._last_id,
+            'events': self.events,
+            'replayed': self.replayed,
+            'syncs': self.syncs,
+            'checkpoints': self.checkpoints
+        }
+
+
+_aggregators: Dict[str, BehaviorAggregator] = {}
+_aggregators_lock = threading.Lock()
+
+
+def get_behavior_aggregator(db) -> BehaviorAggregator:
+    """Получить общий для процесса агрегатор поведения для файла БД"""
+    aggregator = _aggregators.get(db.db_path)
+    if aggregator is None:
+        with _aggregators_lock:
+            aggregator = _aggregators.get(db.db_path)
+            if aggregator is None:
+                aggregator = BehaviorAggregator(db)
+                _aggregators[db.db_path] = aggregator
+    return aggregator
+
+
+@atexit.register
+def close_all() -> None:
+    """Сохранить снимки всех агрегаторов при завершении процесса"""
+    for aggregator in list(_aggregators.values()):
+        aggregator.close()
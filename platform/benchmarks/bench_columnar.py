@@ -0,0 +1,65 @@
+"""Бенчмарк колоночного снимка: выгрузка и агрегаты против GROUP BY в SQLite
+
+Запуск из каталога platform (база и снимок создаются во временном каталоге):
+    python -m benchmarks.bench_columnar --events 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from columnar import InteractionSnapshot, export_interactions
+from database import DatabaseManager
+from benchmarks.bench_suite import seed_database
+
+
+# Объем синтетических данных: события распределены по этим пользователям и компонентам
+SEED_USERS = 50_000
+SEED_COMPONENTS = 200
+
+
+def timed(label: str, func):
+    started = time.perf_counter()
+    result = func()
+    print(f"{label:<28} {time.perf_counter() - started:>8.3f} s")
+    return result
+
+
+def run(events: int) -> None:
+    workdir = tempfile.mkdtemp()
+    db = DatabaseManager(os.path.join(workdir, 'bench.db'))
+    snapshot_path = os.path.join(workdir, 'snapshot')
+
+    timed('seed', lambda: seed_database(db, components=SEED_COMPONENTS, users=SEED_USERS,
+                                        interactions=events))
+    timed('export', lambda: export_interactions(db, snapshot_path))
+    snapshot = InteractionSnapshot(snapshot_path)
+
+    by_action = timed('snapshot: by action', snapshot.count_by_action)
+    by_component = timed('snapshot: by component', snapshot.count_by_component)
+    timed('snapshot: by hour', snapshot.count_by_hour)
+    timed('snapshot: by hour of day', snapshot.count_by_hour_of_day)
+
+    sql_by_action = timed('sqlite: by action', lambda: db.execute_query(
+        'SELECT action, COUNT(*) AS n FROM user_interactions GROUP BY action'))
+    sql_by_component = timed('sqlite: by component', lambda: db.execute_query(
+        'SELECT component_id, COUNT(*) AS n FROM user_interactions '
+        'WHERE component_id IS NOT NULL GROUP BY component_id'))
+    timed('sqlite: by hour', lambda: db.execute_query(
+        "SELECT strftime('%Y-%m-%d %H', timestamp) AS hour, COUNT(*) AS n "
+        "FROM user_interactions GROUP BY hour"))
+
+    if by_action != {row['action']: row['n'] for row in sql_by_action}:
+        raise AssertionError("Агрегаты по действиям расходятся с SQLite")
+    if dict(by_component) != {row['component_id']: row['n'] for row in sql_by_component}:
+        raise AssertionError("Агрегаты по компонентам расходятся с SQLite")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=1_000_000)
+    args = parser.parse_args()
+    run(args.events)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Бенчмарк POST /api/interactions/bulk: пропускная способность приема NDJSON
+
+Запуск из каталога platform (база создается во временном каталоге):
+    python -m benchmarks.bench_ingestion --events 200000
+"""
+import argparse
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import settings
+
+
+def make_body(count: int, seed: int = 42) -> bytes:
+    """Сгенерировать тело NDJSON из count событий"""
+    rng = random.Random(seed)
+    actions = ('click', 'view', 'scroll', 'purchase')
+    lines = []
+    for _ in range(count):
+        event = {'user_id': rng.randint(1, 10_000), 'action': rng.choice(actions)}
+        if rng.random() < 0.5:
+            event['component_id'] = rng.randint(1, 50)
+        if rng.random() < 0.2:
+            event['metadata'] = {'page': '/catalog'}
+        lines.append(json.dumps(event))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def run(events: int, chunk_size: int) -> None:
+    settings.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    settings.INTERACTION_BULK_CHUNK_SIZE = chunk_size
+    import app as app_module
+    from ingestion import ingest_interactions
+
+    app_module.init_db()
+    collector = app_module.get_data_collector()
+    body = make_body(events)
+
+    # Разбор и запись без HTTP
+    started = time.perf_counter()
+    result = ingest_interactions(collector, io.BytesIO(body), chunk_size)
+    direct_time = time.perf_counter() - started
+
+    # Через Flask test client
+    client = app_module.app.test_client()
+    started = time.perf_counter()
+    response = client.post('/api/interactions/bulk', input_stream=io.BytesIO(body),
+                           content_type='application/x-ndjson',
+                           headers={'Content-Length': str(len(body))})
+    http_time = time.perf_counter() - started
+
+    if response.status_code != 200 or response.get_json()['accepted'] != events:
+        raise AssertionError(f"Не все события приняты: {response.status_code} {response.get_data()[:200]}")
+    if result['accepted'] != events:
+        raise AssertionError(f"Не все события приняты: {result['accepted']} из {events}")
+
+    print(f"{'path':>8} {'events':>10} {'seconds':>8} {'events/s':>10}")
+    print(f"{'direct':>8} {events:>10} {direct_time:>8.3f} {events / direct_time:>10.0f}")
+    print(f"{'http':>8} {events:>10} {http_time:>8.3f} {events / http_time:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200_000)
+    parser.add_argument('--chunk-size', type=int, default=settings.INTERACTION_BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+    run(args.events, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Бенчмарк накладных расходов метрик на пути адаптации (цель - меньше 2%)
+
+Запуск из каталога platform (база создается во временном каталоге):
+    python -m benchmarks.bench_metrics --logins 3000
+
+Разница полного времени входа с метриками и без сопоставима с шумом
+машины, поэтому накладные расходы считаются напрямую: число наблюдений
+каждого вида на один вход умножается на измеренную цену наблюдения
+(разница вызова с инструментированием и без него) и делится на время входа.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Callable, Dict
+
+
+def overhead_us(plain: Callable[[], object], instrumented: Callable[[], object],
+                calls: int, rounds: int = 9) -> float:
+    """
+    Цена инструментирования одного вызова, мкс: раунды без метрик и с ними
+    чередуются, чтобы фоновая нагрузка машины попадала в обе серии
+    """
+    best = [float('inf'), float('inf')]
+    for _ in range(rounds):
+        for i, func in enumerate((plain, instrumented)):
+            started = time.perf_counter()
+            for _ in range(calls):
+                func()
+            best[i] = min(best[i], time.perf_counter() - started)
+    return (best[1] - best[0]) / calls * 1e6
+
+
+def observation_costs(calls: int) -> Dict[str, float]:
+    """Цена одного наблюдения, мкс: SQL-запрос и вызов функции/обработчика"""
+    from metrics import ML_PREDICT_DURATION, InstrumentedConnection, timed
+
+    queries = []
+    for factory in (sqlite3.Connection, InstrumentedConnection):
+        conn = sqlite3.connect(':memory:', factory=factory)
+        conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, value INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1, 1)')
+        queries.append(lambda conn=conn: conn.execute(
+            'SELECT value FROM t WHERE id = ?', (1,)).fetchone())
+
+    def noop():
+        return None
+
+    return {
+        'db': overhead_us(queries[0], queries[1], calls),
+        'call': overhead_us(noop, timed(ML_PREDICT_DURATION, 'bench')(noop), calls),
+    }
+
+
+def run(logins: int) -> None:
+    import settings
+    if not settings.METRICS_ENABLED:
+        raise SystemExit('METRICS_ENABLED=0: нечего измерять')
+    settings.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    import app as app_module
+    from metrics import (DB_QUERY_DURATION, ML_PREDICT_DURATION, REQUEST_DURATION,
+                         TEMPLATE_RENDER_DURATION)
+
+    app_module.init_db()
+    for i in range(20):
+        app_module.db.add_rule(f'rule {i}', '', {'device_type': ('mobile', 'desktop')[i % 2]},
+                               {'layout': 'compact'}, i % 5)
+    client = app_module.app.test_client()
+    controller = app_module.get_adaptation_controller()
+
+    def observations() -> Dict[str, int]:
+        def total(histogram):
+            return sum(sum(counts[:-1]) for counts in histogram.collect().values())
+        return {
+            'db': total(DB_QUERY_DURATION),
+            # Обработчики запроса и шаблона устроены как timed: два perf_counter и observe
+            'call': total(ML_PREDICT_DURATION) + total(REQUEST_DURATION)
+                    + total(TEMPLATE_RENDER_DURATION)
+        }
+
+    paths = {
+        'controller': lambda user_id: controller.handle_user_login(user_id),
+        'api': lambda user_id: client.post('/api/user/adapt', json={'user_id': user_id}),
+    }
+    costs = observation_costs(50_000)
+    print(f"цена наблюдения: SQL {costs['db']:.2f} мкс, вызов {costs['call']:.2f} мкс")
+
+    for name, path in paths.items():
+        for user_id in range(200):
+            path(user_id)  # прогрев
+        before = observations()
+        started = time.perf_counter()
+        for user_id in range(logins):
+            path(user_id % 500)
+        login_us = (time.perf_counter() - started) / logins * 1e6
+        after = observations()
+
+        per_login = {kind: (after[kind] - before[kind]) / logins for kind in costs}
+        overhead_us = sum(per_login[kind] * costs[kind] for kind in costs)
+        print(f"{name:<12} вход {login_us:>8.1f} мкс, наблюдений на вход: "
+              f"SQL {per_login['db']:.1f}, вызовов {per_login['call']:.1f}; "
+              f"накладные расходы {overhead_us:.2f} мкс ({overhead_us / login_us * 100:.2f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=3000)
+    args = parser.parse_args()
+    run(args.logins)
+
+
+if __name__ == '__main__':
+    main()
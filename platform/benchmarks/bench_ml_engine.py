@@ -0,0 +1,70 @@
+"""Бенчмарк MLEngine: predict_next_action в цикле против predict_batch
+
+Запуск из каталога platform:
+    python -m benchmarks.bench_ml_engine --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import time
+from typing import List
+import numpy as np
+from ml_engine import MLEngine
+from models import GeoPoint, UserBehavior
+
+
+def make_behaviors(count: int, seed: int = 42) -> List[UserBehavior]:
+    """Сгенерировать синтетическое поведение пользователей"""
+    rng = random.Random(seed)
+    point = GeoPoint(55.7558, 37.6173)
+    return [
+        UserBehavior(
+            user_id=i,
+            page_views=rng.randint(0, 20),
+            clicks=rng.randint(0, 10),
+            geolocation=point,
+            effective_score=rng.uniform(0.3, 0.95),
+            interaction_time=rng.uniform(0, 3600)
+        )
+        for i in range(count)
+    ]
+
+
+def run(sizes: List[int]) -> None:
+    engine = MLEngine()
+    print(f"{'users':>10} {'scalar, s':>10} {'batch, s':>10} {'arrays, s':>10} {'speedup':>8}")
+
+    for size in sizes:
+        behaviors = make_behaviors(size)
+
+        started = time.perf_counter()
+        scalar = [engine.predict_next_action(b) for b in behaviors]
+        scalar_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        batch = engine.predict_batch(behaviors)
+        batch_time = time.perf_counter() - started
+
+        if scalar != batch:
+            raise AssertionError(f"predict_batch расходится со скалярным путем при N={size}")
+
+        # Только векторная часть: данные уже лежат в массивах
+        effective_score = np.array([b.effective_score for b in behaviors])
+        clicks = np.array([b.clicks for b in behaviors], dtype=np.float64)
+        interaction_time = np.array([b.interaction_time for b in behaviors])
+        started = time.perf_counter()
+        engine.score_batch(effective_score, clicks, interaction_time).argmax(axis=1)
+        arrays_time = time.perf_counter() - started
+
+        print(f"{size:>10} {scalar_time:>10.3f} {batch_time:>10.3f} {arrays_time:>10.4f} "
+              f"{scalar_time / batch_time:>7.1f}x")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+    run(args.sizes)
+
+
+if __name__ == '__main__':
+    main()
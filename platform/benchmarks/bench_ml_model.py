@@ -0,0 +1,73 @@
+"""Бенчмарк обучаемой модели: обучение, точность и стоимость прогноза (один вызов и пакет)
+
+Запуск из каталога platform (база и модель создаются во временном каталоге):
+    python -m benchmarks.bench_ml_model --users 10000 --days 30
+"""
+import argparse
+import os
+import tempfile
+import time
+from database import DatabaseManager
+from ml_engine import MLEngine
+from ml_model import TrainedModel, save_model, train
+from training import build_training_set
+from benchmarks.bench_ml_engine import make_behaviors
+from benchmarks.bench_suite import seed_database
+
+
+def per_call_us(func, calls: int) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def run(users: int, days: int, calls: int, batch: int) -> None:
+    workdir = tempfile.mkdtemp()
+    db = DatabaseManager(os.path.join(workdir, 'bench.db'))
+    model_path = os.path.join(workdir, 'ml_model')
+
+    started = time.perf_counter()
+    events = seed_database(db, users=users, days=days, history='behavioral')
+    print(f"seed: {events} событий за {time.perf_counter() - started:.1f} с")
+
+    started = time.perf_counter()
+    samples, _, _ = build_training_set(db, os.path.join(workdir, 'samples.bin'), workers=1)
+    print(f"dataset: {len(samples)} примеров за {time.perf_counter() - started:.2f} с")
+    arrays, metrics = train(samples)
+    save_model(arrays, metrics, model_path)
+    print(f"train: {metrics['train_seconds']:.2f} с, точность {metrics['accuracy']:.3f} "
+          f"(всегда самый частый класс: {metrics['baseline_accuracy']:.3f}), "
+          f"log loss {metrics['log_loss']:.3f} (частоты классов: {metrics['baseline_log_loss']:.3f})")
+    print(f"доли классов: {metrics['class_share']}")
+
+    started = time.perf_counter()
+    TrainedModel(model_path)
+    print(f"load: {(time.perf_counter() - started) * 1e3:.2f} мс")
+
+    heuristic = MLEngine(model_path=os.path.join(workdir, 'missing'))
+    trained = MLEngine(model_path=model_path)
+    behaviors = make_behaviors(max(calls, batch))
+    print(f"{'engine':<10}{'call, us':>10}{f'batch {batch}, us/row':>22}")
+    for name, engine in (('heuristic', heuristic), ('trained', trained)):
+        call_us = per_call_us(lambda i: engine.predict_next_action(behaviors[i]), calls)
+        started = time.perf_counter()
+        predicted = engine.predict_batch(behaviors[:batch])
+        batch_us = (time.perf_counter() - started) / batch * 1e6
+        if predicted != [engine.predict_next_action(b) for b in behaviors[:batch]]:
+            raise AssertionError(f"predict_batch расходится с predict_next_action ({name})")
+        print(f"{name:<10}{call_us:>10.2f}{batch_us:>22.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--calls', type=int, default=100_000)
+    parser.add_argument('--batch', type=int, default=100_000)
+    args = parser.parse_args()
+    run(args.users, args.days, args.calls, args.batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Бенчмарк списочного API: потоковый JSON из курсора против fetchall + dict + тело целиком
+
+Запуск из каталога platform (база создается во временном каталоге):
+    python -m benchmarks.bench_streaming --components 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+import settings
+from benchmarks.bench_suite import seed_database
+
+
+def consume(func):
+    """(секунды до первого куска, секунды всего, байт ответа)"""
+    started = time.perf_counter()
+    first = None
+    size = 0
+    for chunk in func():
+        if first is None:
+            first = time.perf_counter() - started
+        size += len(chunk)
+    return first, time.perf_counter() - started, size
+
+
+def measure(func):
+    """consume() + пик памяти Python в MB (отдельный прогон: tracemalloc замедляет выделения)"""
+    first, total, size = consume(func)
+    tracemalloc.start()
+    consume(func)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, total, size, peak / 1024 / 1024
+
+
+def run(components: int) -> None:
+    settings.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    import app as app_module
+
+    app_module.init_db()
+    db = app_module.db
+    started = time.perf_counter()
+    # Шаблоны в несколько сотен байт
+    seed_database(db, components=components, template_bytes=300)
+    print(f"seed: {components} компонентов за {time.perf_counter() - started:.1f} с")
+    client = app_module.app.test_client()
+
+    def fetchall():
+        # Прежний путь: весь результат списком строк, копия в dict и тело целиком
+        with db.pool.connection() as conn:
+            rows = conn.execute('SELECT * FROM components ORDER BY created_at DESC').fetchall()
+        components = [dict(row) for row in rows]
+        del rows
+        yield app_module.app.json.dumps(components).encode('utf-8')
+
+    def streamed():
+        response = client.get('/api/components', buffered=False)
+        try:
+            yield from response.response
+        finally:
+            response.close()
+
+    results = {}
+    print(f"{'variant':<10}{'first byte, ms':>16}{'total, s':>10}{'body, MB':>10}{'peak, MB':>10}")
+    for name, func in (('fetchall', fetchall), ('streamed', streamed)):
+        first, total, size, peak = measure(func)
+        results[name] = size
+        print(f"{name:<10}{first * 1e3:>16.1f}{total:>10.2f}{size / 1024 / 1024:>10.1f}{peak:>10.1f}")
+    if abs(results['fetchall'] - results['streamed']) > components * 2:
+        raise AssertionError(f"Размеры ответов расходятся: {results}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--components', type=int, default=50_000)
+    args = parser.parse_args()
+    run(args.components)
+
+
+if __name__ == '__main__':
+    main()
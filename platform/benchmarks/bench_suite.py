@@ -0,0 +1,376 @@
+"""Нагрузочный набор: заполнение базы и задержки основных эндпоинтов и контроллеров
+
+Запуск из каталога platform (база создается во временном каталоге,
+результат - JSON для сравнения между коммитами):
+    python -m benchmarks.bench_suite --interactions 1000000 --threads 4 --output result.json
+    python -m benchmarks.bench_suite --compare before.json after.json
+
+Заполненную базу можно переиспользовать между запусками: --db bench.db
+(заполняется, только если файла еще нет). Данные детерминированы (--seed).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from models import SQLITE_TIMESTAMP_FORMAT
+
+# Сценарии: имя -> что измеряется
+SCENARIOS = (
+    'api_rules', 'api_components', 'api_statistics', 'dashboard',
+    'handle_user_login', 'track_user_action', 'predict_next_action',
+)
+DEVICE_TYPES = ('mobile', 'desktop', 'tablet')
+TIMES_OF_DAY = ('morning', 'afternoon', 'evening', 'night')
+USER_TYPES = ('new', 'returning', '')
+ACTIONS = ('click', 'view', 'scroll', 'purchase', 'login')
+LAYOUTS = ('compact', 'relaxed', 'grid')
+THEMES = ('light', 'dark')
+
+
+# ==================== Заполнение базы ====================
+
+def seed_database(db, rules: int = 0, components: int = 0, users: int = 0, interactions: int = 0,
+                  seed: int = 42, batch: int = 50_000, days: int = 30, template_bytes: int = 0,
+                  history: str = 'uniform') -> int:
+    """
+    Заполнить базу синтетическими правилами, компонентами, пользователями и
+    событиями за последние days дней; возвращает число событий.
+    template_bytes - дополнительный текст в шаблоне каждого компонента.
+    history: 'uniform' - interactions событий в случайное время,
+    'behavioral' - история каждого пользователя по дням с закономерностями
+    (behavioral_events; interactions не используется).
+    """
+    if history not in ('uniform', 'behavioral'):
+        raise ValueError(f"Неизвестный вид истории: {history}")
+    rng = random.Random(seed)
+    for i in range(rules):
+        conditions = {'device_type': rng.choice(DEVICE_TYPES)}
+        if rng.random() < 0.5:
+            conditions['time_of_day'] = rng.choice(TIMES_OF_DAY)
+        if rng.random() < 0.3:
+            conditions['user_type'] = rng.choice(USER_TYPES)
+        db.add_rule(f'Правило {i}', f'Синтетическое правило {i}', conditions,
+                    {'layout': rng.choice(LAYOUTS), 'theme': rng.choice(THEMES)},
+                    rng.randint(1, 10))
+
+    padding = ('Описание компонента. ' * (template_bytes // 20 + 1))[:template_bytes]
+    with db.pool.connection() as conn:
+        for start in range(0, components, batch):
+            conn.executemany(
+                'INSERT INTO components (name, type, description, html_template, css_styles, js_script) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                ((f'Компонент {i}', 'widget', f'Синтетический компонент {i}',
+                  f'<div class="component-{i}"><h3>Компонент {i}</h3>{padding}</div>',
+                  f'.component-{i} {{ padding: {i % 20}px; }}', '')
+                 for i in range(start, min(start + batch, components))))
+            conn.commit()
+        conn.executemany(
+            'INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)',
+            ((f'user{i}', 'seed', 'user') for i in range(1, users + 1)))
+        conn.commit()
+
+    if history == 'behavioral':
+        events = behavioral_events(rng, users, days)
+    else:
+        events = uniform_events(rng, interactions, users, components, days)
+    total = 0
+    rows = []
+    for row in events:
+        rows.append(row)
+        if len(rows) >= batch:
+            total += db.record_interactions(rows)
+            rows = []
+    total += db.record_interactions(rows)
+
+    db.rebuild_statistics()
+    return total
+
+
+def uniform_events(rng: random.Random, count: int, users: int, components: int,
+                   days: int) -> Iterator[Tuple]:
+    """События случайных пользователей в случайное время за последние days дней"""
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    for _ in range(count):
+        ts = start + timedelta(seconds=rng.randint(0, days * 86400))
+        yield (rng.randint(1, users), rng.choice(ACTIONS),
+               rng.randint(1, components) if components and rng.random() < 0.6 else None,
+               '{}', ts.strftime(SQLITE_TIMESTAMP_FORMAT))
+
+
+def behavioral_events(rng: random.Random, users: int, days: int) -> Iterator[Tuple]:
+    """
+    История с закономерностями (для обучения модели): у пользователя скрытые
+    активность и склонность к покупкам; активный сегодня чаще возвращается
+    завтра, а много кликающий чаще покупает
+    """
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) \
+        - timedelta(days=days)
+    for user_id in range(1, users + 1):
+        activity = rng.uniform(0.1, 0.9)
+        buyer = rng.betavariate(1, 6)
+        events_today = 0
+        for day in range(days):
+            # Возврат зависит от активности вчера
+            p_active = 1 / (1 + math.exp(-(6 * activity - 4 + 1.2 * math.log1p(events_today))))
+            if rng.random() >= p_active:
+                events_today = 0
+                continue
+            events_today = 1 + int(rng.expovariate(1 / (1 + 6 * activity)))
+            ts = start + timedelta(days=day, seconds=rng.randint(0, 80_000))
+            clicks = 0
+            for _ in range(events_today):
+                roll = rng.random()
+                if roll < 0.3 + buyer:
+                    action = 'click'
+                    clicks += 1
+                elif roll < 0.85:
+                    action = 'view'
+                else:
+                    action = 'scroll'
+                yield (user_id, action, None, '{}', ts.strftime(SQLITE_TIMESTAMP_FORMAT))
+                ts += timedelta(seconds=rng.randint(5, 600))
+            if rng.random() < min(1.0, 2 * buyer * clicks / events_today):
+                yield (user_id, 'purchase', None, '{}', ts.strftime(SQLITE_TIMESTAMP_FORMAT))
+
+
+# ==================== Генератор нагрузки ====================
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Перцентиль отсортированной выборки (ближайший ранг)"""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run_load(make_operation: Callable[[int], Callable[[int], Any]], threads: int,
+             duration: float, warmup: int = 50) -> Dict[str, float]:
+    """
+    Выполнять операцию в threads потоках в течение duration секунд.
+    make_operation(thread_index) вызывается в каждом потоке и возвращает
+    функцию одной операции (номер итерации -> результат), так что у потока
+    может быть свое состояние (например, свой test client Flask).
+    """
+    latencies: List[List[float]] = [[] for _ in range(threads)]
+    errors: List[BaseException] = []
+    barrier = threading.Barrier(threads + 1)
+    # Срок задает главный поток сразу после барьера
+    deadline = [float('inf')]
+
+    def worker(index: int) -> None:
+        try:
+            operation = make_operation(index)
+            for i in range(warmup):
+                operation(i)
+        except BaseException as e:
+            errors.append(e)
+            barrier.abort()
+            return
+        barrier.wait()
+        samples = latencies[index]
+        i = index
+        try:
+            while True:
+                started = time.perf_counter()
+                if started >= deadline[0]:
+                    break
+                operation(i)
+                samples.append(time.perf_counter() - started)
+                i += threads
+        except BaseException as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    started = time.perf_counter()
+    try:
+        barrier.wait()
+        started = time.perf_counter()
+        deadline[0] = started + duration
+    except threading.BrokenBarrierError:
+        pass
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+
+    samples = sorted(value for thread_samples in latencies for value in thread_samples)
+    if not samples:
+        raise RuntimeError('Ни одной операции за время измерения')
+    return {
+        'operations': len(samples),
+        'throughput_per_s': round(len(samples) / elapsed, 1),
+        'mean_ms': round(sum(samples) / len(samples) * 1e3, 4),
+        'p50_ms': round(percentile(samples, 0.50) * 1e3, 4),
+        'p90_ms': round(percentile(samples, 0.90) * 1e3, 4),
+        'p99_ms': round(percentile(samples, 0.99) * 1e3, 4),
+        'max_ms': round(samples[-1] * 1e3, 4),
+    }
+
+
+# ==================== Сценарии ====================
+
+def build_scenarios(app_module, users: int) -> Dict[str, Callable[[int], Callable[[int], Any]]]:
+    """Фабрики операций для каждого сценария (см. run_load)"""
+    from models import GeoPoint, UserBehavior
+
+    app = app_module.app
+    controller = app_module.get_adaptation_controller()
+    collector = app_module.get_data_collector()
+    engine = controller.ml_engine
+
+    def http_get(path: str, login: bool = False):
+        def make(thread_index: int):
+            client = app.test_client()
+            if login:
+                client.post('/login', data={'username': 'bench', 'password': 'bench'})
+
+            def operation(i: int):
+                response = client.get(path)
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {path}: {response.status_code}")
+                return response.get_data()
+            return operation
+        return make
+
+    def user_id(i: int) -> int:
+        return i % users + 1
+
+    def login(thread_index: int):
+        return lambda i: controller.handle_user_login(user_id(i))
+
+    def track(thread_index: int):
+        return lambda i: collector.track_user_action(user_id(i), ACTIONS[i % len(ACTIONS)],
+                                                     i % 50 + 1)
+
+    def predict(thread_index: int):
+        rng = random.Random(thread_index)
+        point = GeoPoint(55.7558, 37.6173)
+        behaviors = [UserBehavior(user_id=i, page_views=rng.randint(0, 20),
+                                  clicks=rng.randint(0, 10), geolocation=point,
+                                  effective_score=rng.uniform(0.3, 0.95),
+                                  interaction_time=rng.uniform(0, 3600))
+                     for i in range(1024)]
+        return lambda i: engine.predict_next_action(behaviors[i % len(behaviors)])
+
+    return {
+        'api_rules': http_get('/api/rules'),
+        'api_components': http_get('/api/components'),
+        'api_statistics': http_get('/api/statistics'),
+        'dashboard': http_get('/dashboard', login=True),
+        'handle_user_login': login,
+        'track_user_action': track,
+        'predict_next_action': predict,
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Текущий коммит (None вне репозитория git)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import settings
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+    is_new = not os.path.exists(db_path)
+    settings.DATABASE_PATH = db_path
+    import app as app_module
+
+    app_module.init_db()
+    sizes = {'rules': args.rules, 'components': args.components, 'users': args.users,
+             'interactions': args.interactions}
+    seed_time = None
+    if is_new:
+        started = time.perf_counter()
+        seed_database(app_module.db, seed=args.seed, **sizes)
+        seed_time = round(time.perf_counter() - started, 3)
+        print(f"[bench] База заполнена за {seed_time} с: {sizes}")
+    else:
+        print(f"[bench] Используется заполненная база {db_path}")
+
+    factories = build_scenarios(app_module, args.users)
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'scenario':<22}{'ops/s':>10}{'mean, ms':>11}{'p50, ms':>10}{'p90, ms':>10}"
+          f"{'p99, ms':>10}{'max, ms':>10}")
+    for name in args.scenarios:
+        result = results[name] = run_load(factories[name], args.threads, args.duration)
+        print(f"{name:<22}{result['throughput_per_s']:>10.0f}{result['mean_ms']:>11.3f}"
+              f"{result['p50_ms']:>10.3f}{result['p90_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+              f"{result['max_ms']:>10.3f}")
+
+    return {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'threads': args.threads,
+        'duration_s': args.duration,
+        'seed': args.seed,
+        'sizes': sizes,
+        'seed_time_s': seed_time,
+        'results': results,
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """Сравнить два JSON-результата: пропускная способность и p50/p99"""
+    with open(before_path, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_path, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"{'scenario':<22}{'ops/s':>28}{'p50, ms':>28}{'p99, ms':>28}")
+    for name, new in after['results'].items():
+        old = before['results'].get(name)
+        if old is None:
+            continue
+        cells = []
+        for key in ('throughput_per_s', 'p50_ms', 'p99_ms'):
+            change = (new[key] / old[key] - 1) * 100 if old[key] else 0.0
+            cells.append(f"{old[key]:.4g} -> {new[key]:.4g} ({change:+.0f}%)")
+        print(f"{name:<22}" + ''.join(f"{cell:>28}" for cell in cells))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, default=200)
+    parser.add_argument('--components', type=int, default=100)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--interactions', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='Файл базы (заполняется, если его нет)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Секунд нагрузки на сценарий')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--output', help='Файл для результата в JSON')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Сравнить два файла результатов и выйти')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    result = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"[bench] Результат записан в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Бенчмарк шаблонов: компиляция, загрузка из байт-кода и рендеринг каждой страницы
+
+Запуск из каталога platform:
+    python -m benchmarks.bench_templates --renders 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Any, Dict
+from jinja2 import FileSystemBytecodeCache
+from flask import render_template
+
+
+def sample_contexts() -> Dict[str, Dict[str, Any]]:
+    """Контекст для каждого шаблона (как в маршрутах app.py)"""
+    rules = [{
+        'id': i,
+        'name': f'Правило {i}',
+        'description': 'Компактный вид для мобильных' if i % 2 else '',
+        'conditions': {'device_type': 'mobile', 'time_of_day': 'morning', 'user_type': 'new'},
+        'actions': {'layout': 'compact', 'theme': 'dark'},
+        'priority': i % 5,
+        'enabled': bool(i % 3)
+    } for i in range(1, 51)]
+    components = [{
+        'id': i,
+        'name': f'Компонент {i}',
+        'type': 'widget',
+        'description': 'Быстрый доступ к задачам',
+        'html_template': '<div class="quick-tasks"><h3>Мои задачи</h3><ul><li>Задача 1</li></ul></div>' * 2,
+        'css_styles': '.quick-tasks { background: #f0f0f0; padding: 10px; }',
+        'js_script': 'console.log("ready");',
+        'created_at': '2026-01-01 12:00:00'
+    } for i in range(1, 31)]
+    stats = {'total_rules': 50, 'active_rules': 33, 'total_users': 12000, 'total_components': 30}
+    experiment = {
+        'experiment_id': 1, 'rule_a_id': 1, 'rule_b_id': 2, 'conversion_action': 'click',
+        'status': 'running', 'winner': 'B', 'sequential_p_value': 0.01,
+        'variants': {'A': {'exposures': 5000, 'conversions': 900, 'rate': 0.18},
+                     'B': {'exposures': 5100, 'conversions': 1100, 'rate': 0.2157}}
+    }
+    interactions = {
+        'events': 1_000_000, 'users': 50_000, 'created_at': '2026-01-01T12:00:00',
+        'by_action': {'click': 400_000, 'view': 350_000, 'scroll': 250_000},
+        'top_components': [(i, 10_000 - i) for i in range(1, 11)],
+        'by_hour_of_day': [40_000 + h for h in range(24)]
+    }
+    return {
+        'login.html': {},
+        'dashboard.html': {'stats': stats, 'rules': rules, 'username': 'admin'},
+        'rules.html': {'rules': rules},
+        'create_rule.html': {},
+        'edit_rule.html': {'rule': rules[0]},
+        'components.html': {'components': components},
+        'create_component.html': {},
+        'view_component.html': {'component': components[0]},
+        'edit_component.html': {'component': components[0]},
+        'analytics.html': {'username': 'admin', 'report': {
+            'summary': stats, 'rules': rules, 'interactions': interactions,
+            'experiments': [experiment]}},
+    }
+
+
+def timed_us(func, repeat: int) -> float:
+    """Среднее время вызова, мкс"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def run(renders: int) -> None:
+    from app import app
+
+    contexts = sample_contexts()
+    cache_dir = tempfile.mkdtemp()
+
+    def fresh_env(bytecode_cache=None, auto_reload=False):
+        env = app.create_jinja_environment()
+        env.auto_reload = auto_reload
+        env.bytecode_cache = bytecode_cache
+        return env
+
+    # Прогрев байт-кода: как после первого запуска в режиме production
+    warm = fresh_env(FileSystemBytecodeCache(cache_dir))
+    for name in contexts:
+        warm.get_template(name)
+
+    print(f"{'template':<24}{'compile, us':>14}{'bytecode, us':>14}"
+          f"{'render reload, us':>20}{'render, us':>13}")
+    totals = [0.0, 0.0, 0.0, 0.0]
+    with app.test_request_context():
+        for name, context in contexts.items():
+            # Загрузка без кеша: разбор и компиляция исходника
+            compile_us = timed_us(lambda: fresh_env().get_template(name), 20)
+            # Загрузка из байт-кода (новый процесс с заполненным TEMPLATE_CACHE_DIR)
+            cache = FileSystemBytecodeCache(cache_dir)
+            bytecode_us = timed_us(lambda: fresh_env(cache).get_template(name), 20)
+
+            # Рендер через render_template: с проверкой файла на каждом вызове и без нее
+            app.jinja_env.auto_reload = True
+            reload_us = timed_us(lambda: render_template(name, **context), renders)
+            app.jinja_env.auto_reload = False
+            render_us = timed_us(lambda: render_template(name, **context), renders)
+
+            row = (compile_us, bytecode_us, reload_us, render_us)
+            totals = [total + value for total, value in zip(totals, row)]
+            print(f"{name:<24}{compile_us:>14.0f}{bytecode_us:>14.0f}{reload_us:>20.1f}{render_us:>13.1f}")
+    print(f"{'total':<24}{totals[0]:>14.0f}{totals[1]:>14.0f}{totals[2]:>20.1f}{totals[3]:>13.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=2000)
+    args = parser.parse_args()
+    run(args.renders)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Бенчмарк сборки обучающей выборки: потоковый конвейер по процессам против fetchall в память
+
+Запуск из каталога platform (база создается во временном каталоге):
+    python -m benchmarks.bench_training --events 2000000 --workers 1 2 4
+
+Каждый вариант запускается в отдельном процессе, чтобы пиковая память
+(ru_maxrss процесса и его воркеров) не смешивалась между вариантами.
+"""
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+
+def measure(db_path: str, mode: str, workers: int) -> None:
+    """Один вариант в текущем процессе: печатает JSON с временем и пиковой памятью"""
+    import settings
+    # Отображенные в память страницы файла базы тоже попадают в RSS - без mmap
+    # пиковая память показывает только данные процесса
+    settings.DB_MMAP_SIZE = 0
+    from database import DatabaseManager
+    from ml_model import DAY, EVENT_ACTIONS, daily_samples
+    from training import build_training_set
+
+    db = DatabaseManager(db_path, initialize=False)
+    started = time.perf_counter()
+    if mode == 'fetchall':
+        # Вся история одним запросом в список строк, затем в массив
+        last_day = db.get_last_interaction_ts() // DAY
+        count = sum(db.get_event_row_counts())
+        rows = next(db.iter_user_events(-(1 << 63), (1 << 63) - 1, EVENT_ACTIONS, count + 1))
+        events = np.array(rows, dtype=np.int64)
+        del rows
+        samples = len(daily_samples(events[:, 0], events[:, 1], events[:, 2], last_day,
+                                    events[:, 3]))
+        events = int(np.where(events[:, 3] > 0, events[:, 3], 1).sum())
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'samples.bin')
+        result, events, _ = build_training_set(db, path, workers)
+        samples = len(result)
+        del result
+        os.remove(path)
+    seconds = time.perf_counter() - started
+
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    print(json.dumps({'events': events, 'samples': samples, 'seconds': seconds,
+                      'peak_mb': peak_kb / 1024}))
+
+
+def run(events: int, workers_list) -> None:
+    from database import DatabaseManager
+    from benchmarks.bench_columnar import SEED_COMPONENTS, SEED_USERS
+    from benchmarks.bench_suite import seed_database
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    started = time.perf_counter()
+    seed_database(DatabaseManager(db_path), components=SEED_COMPONENTS, users=SEED_USERS,
+                  interactions=events)
+    # WAL после заполнения переносится в файл базы: его индекс отображается
+    # в память и раздувал бы пиковую память первых вариантов
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    print(f"seed: {events} событий за {time.perf_counter() - started:.1f} с "
+          f"(CPU: {os.cpu_count()})")
+
+    variants = [('fetchall', 1)] + [('pipeline', workers) for workers in workers_list]
+    print(f"{'variant':<14}{'events/s':>12}{'seconds':>10}{'samples':>10}{'peak RSS, MB':>14}")
+    for mode, workers in variants:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_training', '--measure', mode,
+             '--db', db_path, '--workers', str(workers)],
+            capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        name = mode if mode == 'fetchall' else f'{mode} x{workers}'
+        print(f"{name:<14}{result['events'] / result['seconds']:>12.0f}{result['seconds']:>10.2f}"
+              f"{result['samples']:>10}{result['peak_mb']:>14.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=2_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--measure', choices=('fetchall', 'pipeline'), help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.db, args.measure, args.workers[0])
+    else:
+        run(args.events, args.workers)
+
+
+if __name__ == '__main__':
+    main()
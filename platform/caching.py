@@ -0,0 +1,233 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+import settings
+
+
+class CachedBody:
+    """Сериализованный ответ, его строгий ETag и дополнительные заголовки"""
+
+    __slots__ = ('body', 'etag', 'headers')
+
+    def __init__(self, body: bytes, headers: Optional[Dict[str, str]] = None):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.headers = headers or {}
+
+
+class VersionedCache:
+    """Кеш значений, построенных для версии данных
+
+    Версия передается при каждом чтении из общего для всех процессов
+    источника (счетчик в БД, который увеличивают триггеры), поэтому запись
+    в другом процессе тоже делает значения прежней версии невидимыми.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._version = 0
+        self._entries: Dict[Hashable, Tuple[int, Any]] = {}
+
+        # Счетчики кеша
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self) -> int:
+        """Последняя версия данных, для которой строились значения"""
+        return self._version
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any], version: int) -> Any:
+        """Получить значение по ключу для версии данных version, построив его при промахе"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        value = builder()
+        with self._lock:
+            if version != self._version:
+                # Данные изменились - значения прежней версии больше не нужны
+                self._version = version
+                self._entries.clear()
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (version, value)
+        return value
+
+    def get_stats(self) -> Dict[str, int]:
+        """Получить счетчики кеша"""
+        return {
+            'version': self._version,
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class TTLCache:
+    """LRU-кеш с ограниченным временем жизни записей
+
+    Хранит не более max_entries записей: при переполнении вытесняется
+    давно не использованная. Запись старше ttl секунд считается промахом.
+    Значение, построенное в get_or_build, не сохраняется, если ключ был
+    сброшен (invalidate) во время построения: оно посчитано по старым данным.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        # Идущие построения: ключ -> поколение (invalidate удаляет ключ)
+        self._building: Dict[Hashable, int] = {}
+        self._generation = 0
+
+        # Счетчики кеша
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение по ключу (None - нет или устарело)"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Сохранить значение по ключу"""
+        with self._lock:
+            self._put(key, value)
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        """Сохранить значение (вызывается под _lock)"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_build(self, key: Hashable, builder: Callable[[], Any]) -> Any:
+        """Получить значение по ключу, построив его при промахе"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            self._generation += 1
+            generation = self._building[key] = self._generation
+        try:
+            value = builder()
+        except BaseException:
+            with self._lock:
+                if self._building.get(key) == generation:
+                    del self._building[key]
+            raise
+        with self._lock:
+            # Ключ сброшен или его уже строит более позднее обращение - не сохраняем
+            if self._building.get(key) == generation:
+                del self._building[key]
+                self._put(key, value)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удалить запись по ключу"""
+        self.invalidate_many((key,))
+
+    def invalidate_many(self, keys: Iterable[Hashable]) -> None:
+        """Удалить записи по набору ключей"""
+        with self._lock:
+            for key in keys:
+                self._building.pop(key, None)
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self) -> None:
+        """Очистить кеш"""
+        with self._lock:
+            self._building.clear()
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Получить счетчики кеша"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations
+        }
+
+
+_versioned_caches: Dict[Tuple[str, str], VersionedCache] = {}
+_versioned_caches_lock = threading.Lock()
+
+
+def get_versioned_cache(db_path: str, name: str) -> VersionedCache:
+    """Получить общий для процесса кеш данных таблицы name в файле БД"""
+    key = (db_path, name)
+    cache = _versioned_caches.get(key)
+    if cache is None:
+        with _versioned_caches_lock:
+            cache = _versioned_caches.get(key)
+            if cache is None:
+                cache = VersionedCache()
+                _versioned_caches[key] = cache
+    return cache
+
+
+_behavior_caches: Dict[str, TTLCache] = {}
+_behavior_caches_lock = threading.Lock()
+
+
+def get_behavior_cache(db_path: str) -> TTLCache:
+    """Получить общий для процесса кеш признаков поведения пользователей"""
+    cache = _behavior_caches.get(db_path)
+    if cache is None:
+        with _behavior_caches_lock:
+            cache = _behavior_caches.get(db_path)
+            if cache is None:
+                cache = TTLCache(settings.BEHAVIOR_CACHE_SIZE, settings.BEHAVIOR_CACHE_TTL)
+                _behavior_caches[db_path] = cache
+    return cache
+
+
+_fragment_caches: Dict[str, TTLCache] = {}
+_fragment_caches_lock = threading.Lock()
+
+
+def get_fragment_cache(db_path: str) -> TTLCache:
+    """
+    Получить общий для процесса кеш отрисованных фрагментов страниц.
+    Ключ фрагмента включает версию его данных, поэтому после изменения
+    данных старые записи не выдаются и вытесняются как давно не используемые.
+    """
+    cache = _fragment_caches.get(db_path)
+    if cache is None:
+        with _fragment_caches_lock:
+            cache = _fragment_caches.get(db_path)
+            if cache is None:
+                cache = TTLCache(settings.FRAGMENT_CACHE_SIZE, settings.FRAGMENT_CACHE_TTL)
+                _fragment_caches[db_path] = cache
+    return cache
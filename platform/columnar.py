@@ -0,0 +1,191 @@
+"""Колоночный снимок истории взаимодействий для аналитики
+
+Выгрузка (например, из cron) из каталога platform:
+    python columnar.py
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import settings
+
+# Столбцы снимка: имя -> тип NumPy. action хранится кодами словаря из manifest.json,
+# component_id = -1 - событие без компонента, timestamp - unix-время (UTC)
+COLUMNS: Dict[str, Any] = {
+    'id': np.int64,
+    'user_id': np.int64,
+    'action': np.uint32,
+    'component_id': np.int64,
+    'timestamp': np.int64,
+}
+MANIFEST_FILE = 'manifest.json'
+NO_COMPONENT = -1
+
+
+def export_interactions(db, path: str = settings.ANALYTICS_SNAPSHOT_PATH,
+                        chunk_size: int = settings.ANALYTICS_EXPORT_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Выгрузить user_interactions в колоночный снимок: по файлу .npy на столбец
+    и manifest.json. Строки читаются пачками и пишутся прямо в memmap-файлы,
+    снимок собирается во временном каталоге и заменяет прежний целиком.
+    """
+    started = time.perf_counter()
+    count, max_id = db.get_interaction_bounds()
+
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = {name: np.lib.format.open_memmap(os.path.join(tmp_path, f'{name}.npy'), mode='w+',
+                                               dtype=dtype, shape=(count,))
+               for name, dtype in COLUMNS.items()}
+    actions: Dict[str, int] = {}
+    rows = 0
+
+    for chunk in db.iter_interaction_chunks(max_id, chunk_size):
+        # Пачки, зафиксированные после подсчета, могут добавить строки с id <= max_id
+        end = min(rows + len(chunk), count)
+        if end == rows:
+            break
+        chunk = chunk[:end - rows]
+        ids, user_ids, action_names, component_ids, timestamps = zip(*chunk)
+
+        columns['id'][rows:end] = ids
+        columns['user_id'][rows:end] = user_ids
+        columns['action'][rows:end] = [actions.setdefault(action, len(actions)) for action in action_names]
+        columns['component_id'][rows:end] = [NO_COMPONENT if component_id is None else component_id
+                                             for component_id in component_ids]
+        columns['timestamp'][rows:end] = timestamps
+        rows = end
+
+    for column in columns.values():
+        column.flush()
+    del columns
+
+    manifest = {
+        'rows': rows,
+        'max_id': max_id,
+        'actions': sorted(actions, key=actions.get),
+        'columns': {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+        'created_at': datetime.now().isoformat()
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    old_path = f'{path}.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+    print(f"[columnar] Выгружено событий: {rows} за {time.perf_counter() - started:.2f} с")
+    return manifest
+
+
+class InteractionSnapshot:
+    """Колоночный снимок, открытый через memory map
+
+    Столбцы не читаются в память целиком: агрегаты считаются векторно
+    (np.bincount/np.unique) по страницам файлов, которые подгружает ОС.
+    """
+
+    def __init__(self, path: str = settings.ANALYTICS_SNAPSHOT_PATH):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self.actions: List[str] = self.manifest['actions']
+        self.rows: int = self.manifest['rows']
+        self.columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')[:self.rows]
+                        for name in COLUMNS}
+        self._summary: Optional[Dict[str, Any]] = None
+
+    def _mask(self, since: Optional[int], until: Optional[int]) -> Optional[np.ndarray]:
+        """Маска событий в интервале [since, until) unix-времени"""
+        if since is None and until is None:
+            return None
+        timestamp = self.columns['timestamp']
+        mask = np.ones(self.rows, dtype=bool)
+        if since is not None:
+            mask &= timestamp >= since
+        if until is not None:
+            mask &= timestamp < until
+        return mask
+
+    def _column(self, name: str, mask: Optional[np.ndarray]) -> np.ndarray:
+        column = self.columns[name]
+        return column if mask is None else column[mask]
+
+    def count_by_action(self, since: Optional[int] = None,
+                        until: Optional[int] = None) -> Dict[str, int]:
+        """Число событий по действиям"""
+        codes = self._column('action', self._mask(since, until))
+        counts = np.bincount(codes, minlength=len(self.actions))
+        return {action: int(count) for action, count in zip(self.actions, counts) if count}
+
+    def count_by_component(self, since: Optional[int] = None, until: Optional[int] = None,
+                           top: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Число событий по компонентам (без событий без компонента), по убыванию"""
+        component_ids = self._column('component_id', self._mask(since, until))
+        values, counts = np.unique(component_ids[component_ids != NO_COMPONENT], return_counts=True)
+        order = np.argsort(-counts, kind='stable')[:top]
+        return [(int(values[i]), int(counts[i])) for i in order]
+
+    def count_by_hour(self, since: Optional[int] = None,
+                      until: Optional[int] = None) -> Dict[int, int]:
+        """Число событий по часам: {начало часа (unix-время): число}"""
+        hours = self._column('timestamp', self._mask(since, until)) // 3600
+        values, counts = np.unique(hours, return_counts=True)
+        return {int(hour) * 3600: int(count) for hour, count in zip(values, counts)}
+
+    def count_by_hour_of_day(self, since: Optional[int] = None,
+                             until: Optional[int] = None) -> List[int]:
+        """Число событий по часу суток (UTC), 24 значения"""
+        hours = self._column('timestamp', self._mask(since, until)) // 3600 % 24
+        return np.bincount(hours, minlength=24).tolist()
+
+    def summary(self) -> Dict[str, Any]:
+        """Сводка для аналитического отчета (снимок неизменен - считается один раз)"""
+        if self._summary is None:
+            self._summary = {
+                'events': self.rows,
+                'users': int(np.unique(self.columns['user_id']).size),
+                'by_action': self.count_by_action(),
+                'top_components': self.count_by_component(top=10),
+                'by_hour_of_day': self.count_by_hour_of_day(),
+                'created_at': self.manifest['created_at']
+            }
+        return self._summary
+
+
+_snapshots: Dict[str, Tuple[Tuple[int, int], InteractionSnapshot]] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(path: str = settings.ANALYTICS_SNAPSHOT_PATH) -> Optional[InteractionSnapshot]:
+    """Открытый снимок (переоткрывается после новой выгрузки); None - снимка нет"""
+    try:
+        stat = os.stat(os.path.join(path, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+
+    # Новая выгрузка - новый файл манифеста
+    version = (stat.st_ino, stat.st_mtime_ns)
+    entry = _snapshots.get(path)
+    if entry is None or entry[0] != version:
+        with _snapshots_lock:
+            entry = _snapshots.get(path)
+            if entry is None or entry[0] != version:
+                entry = (version, InteractionSnapshot(path))
+                _snapshots[path] = entry
+    return entry[1]
+
+
+if __name__ == '__main__':
+    from database import DatabaseManager
+
+    export_interactions(DatabaseManager(settings.DATABASE_PATH))
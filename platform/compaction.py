@@ -0,0 +1,79 @@
+"""Сжатие и сроки хранения событий user_interactions
+
+Разовый запуск (например, из cron) из каталога platform:
+    python compaction.py
+"""
+import threading
+from typing import Dict, Optional
+import settings
+
+
+class InteractionCompactor:
+    """Фоновый запуск DatabaseManager.compact_interactions раз в interval секунд"""
+
+    def __init__(self, db, interval: float = settings.INTERACTION_COMPACTION_INTERVAL):
+        self.db = db
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Счетчики
+        self.runs = 0
+        self.failures = 0
+        self.last_result: Dict[str, int] = {}
+
+    def start(self) -> None:
+        """Запустить фоновый поток (первое сжатие - сразу)"""
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._run, name='interaction-compactor', daemon=True)
+            self._thread.start()
+
+    def run_once(self) -> Dict[str, int]:
+        """Выполнить сжатие сейчас"""
+        try:
+            self.last_result = self.db.compact_interactions()
+        except Exception as e:
+            self.failures += 1
+            print(f"[InteractionCompactor] Ошибка сжатия событий: {e}")
+            return {}
+        self.runs += 1
+        return self.last_result
+
+    def _run(self) -> None:
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self) -> None:
+        """Остановить фоновый поток"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self) -> Dict:
+        """Получить счетчики"""
+        return {'runs': self.runs, 'failures': self.failures, 'last_result': self.last_result}
+
+
+_compactors: Dict[str, InteractionCompactor] = {}
+_compactors_lock = threading.Lock()
+
+
+def get_compactor(db) -> InteractionCompactor:
+    """Получить общий для процесса компактор событий для файла БД"""
+    compactor = _compactors.get(db.db_path)
+    if compactor is None:
+        with _compactors_lock:
+            compactor = _compactors.get(db.db_path)
+            if compactor is None:
+                compactor = InteractionCompactor(db)
+                _compactors[db.db_path] = compactor
+    return compactor
+
+
+if __name__ == '__main__':
+    from database import DatabaseManager
+
+    InteractionCompactor(DatabaseManager(settings.DATABASE_PATH)).run_once()
@@ -0,0 +1,141 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+from metrics import InstrumentedConnection
+import settings
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений SQLite
+
+    Соединения открываются лениво (не больше max_size), PRAGMA настраиваются
+    один раз при открытии, после использования соединение возвращается в пул.
+    """
+
+    def __init__(self, db_path: str, max_size: int = settings.DB_POOL_SIZE,
+                 timeout: float = settings.DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: List[sqlite3.Connection] = []
+        self._opened = 0
+        self._cond = threading.Condition(threading.Lock())
+
+        # Счетчики пула
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _open(self) -> sqlite3.Connection:
+        """Открыть и настроить новое соединение"""
+        # С метриками время каждого запроса попадает в db_query_duration_seconds
+        factory = InstrumentedConnection if settings.METRICS_ENABLED else sqlite3.Connection
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                               check_same_thread=False,
+                               cached_statements=settings.DB_STATEMENT_CACHE_SIZE,
+                               factory=factory)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={int(settings.DB_MMAP_SIZE)}')
+        conn.execute(f'PRAGMA cache_size={int(settings.DB_CACHE_SIZE)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Взять соединение из пула"""
+        with self._cond:
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+
+            if self._opened < self.max_size:
+                self._opened += 1
+                self.misses += 1
+                open_new = True
+            else:
+                open_new = False
+                self.waits += 1
+                started = time.perf_counter()
+                deadline = started + self.timeout
+                while not self._idle:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self.wait_time += time.perf_counter() - started
+                        raise PoolTimeoutError(
+                            f"Нет свободных соединений с {self.db_path} "
+                            f"({self.max_size}) за {self.timeout} с")
+                    self._cond.wait(remaining)
+                self.wait_time += time.perf_counter() - started
+                self.hits += 1
+                return self._idle.pop()
+
+        if open_new:
+            try:
+                return self._open()
+            except Exception:
+                with self._cond:
+                    self._opened -= 1
+                    self._cond.notify()
+                raise
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Вернуть соединение в пул"""
+        if conn.in_transaction:
+            # Незафиксированные изменения откатываются, как при close()
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Контекстный менеджер: взять соединение и вернуть его после использования"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self) -> None:
+        """Закрыть все свободные соединения"""
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close()
+                self._opened -= 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Получить счетчики пула"""
+        with self._cond:
+            return {
+                'size': self._opened,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'wait_time': self.wait_time
+            }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Получить общий для процесса пул соединений для файла БД"""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[db_path] = pool
+    return pool
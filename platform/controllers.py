@@ -1,11 +1,52 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from models import AdaptationRule, ComponentUI, UserContext, Statistics
 from database import DatabaseManager
 from ml_engine import MLEngine
 from data_collector import DataCollector
+from ab_testing import get_ab_testing
+from infrastructure import ExternalSourceConnector
+from columnar import get_snapshot
+import asyncio
 import json
+import threading
+import settings
 from datetime import datetime
 
+# Типы пользователей, которые используются в условиях правил
+USER_TYPES = ('new', 'regular', 'vip')
+
+
+def resolve_user_type(context: UserContext, customer_status: Optional[str]) -> str:
+    """
+    Тип пользователя для условий правил: статус клиента из CRM, если это
+    один из USER_TYPES, иначе new/regular по контексту
+    """
+    if customer_status in USER_TYPES:
+        return customer_status
+    return 'new' if context.is_new_user else 'regular'
+
+
+# Рекомендации, если данных для прогноза не хватило (деградированный режим)
+FALLBACK_RECOMMENDATIONS = [{
+    'type': 'navigation_widget',
+    'content': 'Рекомендуемые разделы',
+    'priority': 2
+}]
+
+# Потоки для блокирующих этапов асинхронной адаптации
+_stage_executor = ThreadPoolExecutor(max_workers=settings.ADAPTATION_WORKERS,
+                                     thread_name_prefix='adaptation')
+# Места для этапов: освобождаются, когда поток этапа действительно завершился
+_stage_slots = threading.BoundedSemaphore(settings.ADAPTATION_MAX_IN_FLIGHT)
+
+
+def _run_in_slot(func: Callable, *args) -> Any:
+    try:
+        return func(*args)
+    finally:
+        _stage_slots.release()
+
 
 class AdminPanelController:
     """Контроллер панели администратора"""
@@ -25,9 +66,15 @@ class AdminPanelController:
         stats = self.db.get_statistics()
         rules = self.db.get_rules()
 
+        # Распределение событий - по колоночному снимку, без запросов к БД
+        snapshot = get_snapshot()
+
         report = {
             'summary': stats,
             'rules': rules,
+            'interactions': snapshot.summary() if snapshot else None,
+            'experiments': (get_ab_testing(self.db).list_results()
+                            if settings.ENABLE_A_B_TESTING else []),
             'timestamp': datetime.now().isoformat()
         }
 
@@ -45,17 +92,26 @@ class AdaptationController:
         self.db = db
         self.ml_engine = ml_engine
         self.data_collector = DataCollector(db)
+        self.rule_index = db.rule_index
+        self.external_source = ExternalSourceConnector()
 
     def handle_user_login(self, user_id: int) -> Dict[str, Any]:
         """Обработать вход пользователя"""
         # Собрать контекст пользователя
-        behavior = self.data_collector.collect_user_behavior(user_id)
+        context = self.data_collector.context_sensor.get_current_context(user_id)
+        behavior = self.data_collector.collect_user_behavior(user_id, context)
 
         # Предсказать действие
         predicted_action = self.ml_engine.predict_next_action(behavior)
 
-        # Получить рекомендации адаптации
-        rules = self.db.get_rules(enabled_only=True)
+        # Получить рекомендации адаптации (правила, подходящие под контекст)
+        try:
+            status = self.external_source.fetch_customer_status(user_id)
+        except Exception as e:
+            print(f"[AdaptationController] Статус клиента не получен: {e!r}")
+            status = None
+        rules = self.rule_index.match(context, resolve_user_type(context, status))
+        rules, experiments = self.apply_experiments(user_id, rules)
         recommendations = self.ml_engine.generate_recommendations(behavior, rules)
 
         # Применить правила
@@ -68,9 +124,115 @@ class AdaptationController:
             'predicted_action': predicted_action.value,
             'recommendations': recommendations,
             'layout': layout,
+            'matched_rules': [rule['id'] for rule in rules],
+            'experiments': experiments,
             'context': behavior.to_dict()
         }
 
+    def apply_experiments(self, user_id: int, rules: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Оставить правила варианта пользователя в запущенных A/B экспериментах"""
+        ab_testing = self.data_collector.ab_testing
+        if ab_testing is None:
+            return rules, []
+        return ab_testing.apply(user_id, rules)
+
+    async def _run_stage(self, name: str, degraded: List[str],
+                         func: Callable, *args) -> Any:
+        """
+        Выполнить блокирующий этап в пуле потоков с таймаутом этапа.
+        Таймаут ограничивает только ожидание ответа: поток этапа продолжает
+        работу до конца и занимает место в пуле. Поэтому число выполняемых
+        этапов ограничено ADAPTATION_MAX_IN_FLIGHT - когда мест нет (например,
+        база отвечает медленно), этап сразу считается невыполненным.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            if not _stage_slots.acquire(blocking=False):
+                raise RuntimeError(f"выполняется этапов: {settings.ADAPTATION_MAX_IN_FLIGHT}")
+            try:
+                future = loop.run_in_executor(_stage_executor, _run_in_slot, func, *args)
+            except BaseException:
+                _stage_slots.release()
+                raise
+            return await asyncio.wait_for(future, settings.ADAPTATION_STAGE_TIMEOUTS[name])
+        except Exception as e:
+            degraded.append(name)
+            print(f"[AdaptationController] Этап '{name}' не выполнен: {e!r}")
+            return None
+
+    async def gather_context_async(self, user_id: int) -> Dict[str, Any]:
+        """Собрать контекст и статус клиента параллельно"""
+        degraded: List[str] = []
+        context, status = await asyncio.gather(
+            self._run_stage('context', degraded,
+                            self.data_collector.context_sensor.get_current_context, user_id),
+            self._run_stage('customer_status', degraded,
+                            self.external_source.fetch_customer_status, user_id)
+        )
+        return {
+            'user_id': user_id,
+            'context': context.to_dict() if context else None,
+            'customer_status': status,
+            'degraded': degraded
+        }
+
+    async def handle_user_login_async(self, user_id: int) -> Dict[str, Any]:
+        """
+        Обработать вход пользователя асинхронно: контекст -> поведение -> прогноз,
+        статус клиента и синхронизация правил выполняются параллельно, у каждого
+        этапа свой таймаут. При сбое этапа ответ строится в деградированном режиме.
+        """
+        degraded: List[str] = []
+
+        async def predict():
+            context = await self._run_stage(
+                'context', degraded, self.data_collector.context_sensor.get_current_context, user_id)
+            if context is None:
+                return None, None, None
+            behavior = await self._run_stage(
+                'behavior', degraded, self.data_collector.collect_user_behavior, user_id, context)
+            if behavior is None:
+                return context, None, None
+            predicted_action = await self._run_stage(
+                'prediction', degraded, self.ml_engine.predict_next_action, behavior)
+            return context, behavior, predicted_action
+
+        (context, behavior, predicted_action), status, _ = await asyncio.gather(
+            predict(),
+            self._run_stage('customer_status', degraded,
+                            self.external_source.fetch_customer_status, user_id),
+            self._run_stage('rules', degraded, self.rule_index.invalidate)
+        )
+
+        # Правила уже синхронизированы этапом 'rules' (или берутся как есть)
+        rules: List[Dict] = []
+        if context is not None:
+            rules = self.rule_index.match(context, resolve_user_type(context, status),
+                                          sync=False)
+        rules, experiments = self.apply_experiments(user_id, rules)
+
+        if predicted_action is not None:
+            recommendations = self.ml_engine.generate_recommendations(behavior, rules)
+        else:
+            recommendations = list(FALLBACK_RECOMMENDATIONS)
+
+        layout = self.generate_layout(recommendations, rules)
+
+        asyncio.get_running_loop().run_in_executor(
+            _stage_executor, self.data_collector.track_user_action, user_id, 'login')
+
+        return {
+            'user_id': user_id,
+            'predicted_action': predicted_action.value if predicted_action else None,
+            'recommendations': recommendations,
+            'layout': layout,
+            'matched_rules': [rule['id'] for rule in rules],
+            'experiments': experiments,
+            'customer_status': status,
+            'context': behavior.to_dict() if behavior else None,
+            'degraded': degraded
+        }
+
     def generate_layout(self, recommendations: List[Dict],
                        rules: List[Dict]) -> Dict[str, Any]:
         """Сгенерировать макет интерфейса"""
@@ -131,14 +293,38 @@ class TestingManager:
 
     def __init__(self, db: DatabaseManager):
         self.db = db
+        self.engine = get_ab_testing(db)
+
+    def start_experiment(self, rule_id_a: int, rule_id_b: int,
+                         conversion_action: str = settings.AB_DEFAULT_CONVERSION_ACTION) -> int:
+        """Запустить A/B эксперимент: правило A против правила B"""
+        experiment_id = self.engine.start_experiment(rule_id_a, rule_id_b, conversion_action)
+        print(f"[TestingManager] Эксперимент {experiment_id} запущен: правило {rule_id_a} против {rule_id_b}")
+        return experiment_id
+
+    def stop_experiment(self, experiment_id: int) -> bool:
+        """Остановить A/B эксперимент"""
+        return self.engine.stop_experiment(experiment_id)
+
+    def get_results(self, experiment_id: int) -> Optional[Dict[str, Any]]:
+        """Результаты A/B эксперимента"""
+        return self.engine.get_results(experiment_id)
+
+    def list_experiments(self) -> List[Dict[str, Any]]:
+        """Все A/B эксперименты с результатами"""
+        return self.engine.list_results()
 
     def compare_variants(self, rule_id_a: int, rule_id_b: int) -> Dict[str, Any]:
-        """Сравнить варианты адаптации"""
+        """Сравнить варианты адаптации (по последнему эксперименту с этими правилами)"""
         rule_a = self.db.get_rule_by_id(rule_id_a)
         rule_b = self.db.get_rule_by_id(rule_id_b)
 
+        comparison = next((results for results in self.engine.list_results()
+                           if (results['rule_a_id'], results['rule_b_id']) == (rule_id_a, rule_id_b)),
+                          None)
+
         return {
             'variant_a': rule_a,
             'variant_b': rule_b,
-            'comparison': 'Results available after sufficient data collection'
-        }
\ No newline at end of file
+            'comparison': comparison
+        }
@@ -1,7 +1,14 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime
+import json
 import random
-from models import UserContext, DeviceType, TimeOfDay, GeoPoint, UserBehavior, UserAction
+from models import UserContext, DeviceType, TimeOfDay, GeoPoint, UserBehavior, UserAction, UserInteraction
+from ab_testing import get_ab_testing
+from behavior_aggregator import get_behavior_aggregator
+from caching import get_behavior_cache
+from database import format_timestamp
+from write_buffer import get_write_buffer
+import settings
 
 
 class ContextSensor:
@@ -70,29 +77,53 @@ class DataCollector:
     def __init__(self, database_manager):
         self.db = database_manager
         self.context_sensor = ContextSensor()
+        self.behavior_cache = get_behavior_cache(database_manager.db_path)
+        self.aggregator = get_behavior_aggregator(database_manager)
+        self.write_buffer = (get_write_buffer(database_manager)
+                             if settings.INTERACTION_BUFFER_ENABLED else None)
+        self.ab_testing = get_ab_testing(database_manager) if settings.ENABLE_A_B_TESTING else None
+
+    def _build_behavior_features(self, user_id: int) -> Dict[str, Any]:
+        """Признаки поведения: счетчики скользящих окон и оценки модели"""
+        return {
+            'windows': self.aggregator.get_features(user_id),
+            # Оценки модели(модель)
+            'effective_score': random.uniform(0.3, 0.95),
+            'interaction_time': random.uniform(30, 3600)
+        }
 
-    def collect_user_behavior(self, user_id: int) -> UserBehavior:
+    def collect_user_behavior(self, user_id: int,
+                              context: Optional[UserContext] = None) -> UserBehavior:
         """Собрать данные о поведении пользователя"""
 
-        context = self.context_sensor.get_current_context(user_id)
-
-        # Получить данные о взаимодействиях из БД(модель)
-        interactions = self.db.execute_query(
-            'SELECT * FROM user_interactions WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100',
-            (user_id,)
-        )
-
-        # Рассчитать метрики(модель)
-        page_views = len(context.view_history)
-        clicks = len(context.click_data)
-        effective_score = random.uniform(0.3, 0.95)
-        interaction_time = random.uniform(30, 3600)
+        if context is None:
+            context = self.context_sensor.get_current_context(user_id)
+
+        # Признаки кешируются до нового действия пользователя или истечения TTL
+        features = self.behavior_cache.get_or_build(
+            user_id, lambda: self._build_behavior_features(user_id))
+        windows = features['windows']
+        day = windows['24h']
+
+        if day['events']:
+            # Метрики за последние сутки из потоковых счетчиков
+            page_views = int(day['page_views'])
+            clicks = int(day['clicks'])
+            interaction_time = day['interaction_time']
+        else:
+            # Нет событий за сутки - метрики по контексту(модель)
+            page_views = len(context.view_history)
+            clicks = len(context.click_data)
+            interaction_time = features['interaction_time']
+        effective_score = features['effective_score']
 
         interaction_map = {
             'page_views': page_views,
             'clicks': clicks,
             'time_spent': int(interaction_time)
         }
+        for name, metrics in windows.items():
+            interaction_map[f'events_{name}'] = int(metrics['events'])
 
         return UserBehavior(
             user_id=user_id,
@@ -107,12 +138,41 @@ class DataCollector:
     def track_user_action(self, user_id: int, action: str,
                          component_id: Optional[int] = None) -> None:
         """Отследить действие пользователя"""
-        self.db.record_interaction(
-            user_id=user_id,
-            action=action,
-            component_id=component_id,
-            metadata={
-                'timestamp': datetime.now().isoformat(),
-                'session_id': f'session_{user_id}_{datetime.now().timestamp()}'
-            }
-        )
\ No newline at end of file
+        metadata = {
+            'timestamp': datetime.now().isoformat(),
+            'session_id': f'session_{user_id}_{datetime.now().timestamp()}'
+        }
+        # Окна обновит агрегатор, когда событие дойдет до БД (он же еще раз
+        # сбросит кеш признаков во всех процессах); здесь кеш сбрасывается сразу
+        timestamp = format_timestamp()
+        if self.ab_testing is not None:
+            self.ab_testing.record_actions(((user_id, action),))
+
+        if self.write_buffer is not None:
+            # Запись отложена: событие попадет в БД со следующей пачкой
+            self.write_buffer.add(user_id, action, component_id, metadata, timestamp)
+        else:
+            self.db.record_interaction(
+                user_id=user_id,
+                action=action,
+                component_id=component_id,
+                metadata=metadata,
+                timestamp=timestamp
+            )
+        self.behavior_cache.invalidate(user_id)
+
+    def track_user_actions(self, interactions: List[UserInteraction]) -> int:
+        """Записать пачку действий одной транзакцией, минуя буфер (возвращает число записанных)"""
+        timestamp = format_timestamp()
+        if self.ab_testing is not None:
+            self.ab_testing.record_actions(
+                (interaction.user_id, interaction.action) for interaction in interactions)
+
+        rows = [
+            (interaction.user_id, interaction.action, interaction.component_id,
+             json.dumps(interaction.metadata) if interaction.metadata else '{}', timestamp)
+            for interaction in interactions
+        ]
+        written = self.db.record_interactions(rows)
+        self.behavior_cache.invalidate_many({interaction.user_id for interaction in interactions})
+        return written
@@ -1,20 +1,349 @@
 import sqlite3
 import json
-from typing import List, Dict, Optional, Any
-from datetime import datetime
+import re
+from typing import List, Dict, Optional, Any, Iterable, Iterator, Sequence, Set, Tuple
+from datetime import date, datetime, timedelta, timezone
 import os
+from connection_pool import get_pool
+from models import SQLITE_TIMESTAMP_FORMAT
+from rule_index import get_rule_index
+from rule_store import get_rule_store
+from caching import get_versioned_cache
+import settings
+
+# Столбцы, доступные для проекции в списочных запросах
+RULE_FIELDS = ('id', 'name', 'description', 'conditions', 'actions', 'priority',
+               'enabled', 'created_at', 'updated_at')
+COMPONENT_FIELDS = ('id', 'name', 'type', 'description', 'html_template',
+                    'css_styles', 'js_script', 'created_at')
+
+# Типы сущностей репозитория и их таблицы
+ENTITY_TABLES = {
+    'user': 'users',
+    'rule': 'adaptation_rules',
+    'component': 'components',
+    'interaction': 'user_interactions',
+}
+
+# События хранятся в партициях user_interactions_<ГГГГММ> (или <ГГГГММДД> по дням)
+# и в user_interactions_legacy (события до партиционирования); представление
+# user_interactions объединяет их для чтения
+INTERACTION_COLUMNS = 'id, user_id, action, component_id, timestamp, metadata'
+LEGACY_INTERACTIONS_TABLE = 'user_interactions_legacy'
+PARTITION_PREFIX = 'user_interactions_'
+_PARTITION_NAME = re.compile(r'^user_interactions_(\d{6}|\d{8})$')
+
+# Свернуть события до cutoff в дневные агрегаты
+COMPACT_INTERACTIONS_SQL = '''
+    INSERT INTO interaction_daily (day, user_id, action, component_id, events)
+    SELECT date(timestamp), user_id, action, COALESCE(component_id, 0), COUNT(*)
+    FROM {table}
+    WHERE timestamp < ?
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (day, user_id, action, component_id)
+    DO UPDATE SET events = events + excluded.events
+'''
+
+
+def partition_key(timestamp: str, period: str) -> str:
+    """Ключ партиции для времени события 'ГГГГ-ММ-ДД ЧЧ:ММ:СС'"""
+    if period == 'day':
+        return timestamp[0:4] + timestamp[5:7] + timestamp[8:10]
+    return timestamp[0:4] + timestamp[5:7]
+
+
+def partition_bounds(key: str) -> Tuple[str, str]:
+    """Границы партиции [начало, конец) в формате времени событий"""
+    year, month = int(key[0:4]), int(key[4:6])
+    if len(key) == 8:
+        start = date(year, month, int(key[6:8]))
+        end = start + timedelta(days=1)
+    else:
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
+    return f'{start} 00:00:00', f'{end} 00:00:00'
+
+
+def format_timestamp(ts: Optional[float] = None) -> str:
+    """Время в формате CURRENT_TIMESTAMP SQLite (UTC); ts - unix-время, по умолчанию текущее"""
+    moment = datetime.now(timezone.utc) if ts is None else datetime.fromtimestamp(ts, timezone.utc)
+    return moment.strftime(SQLITE_TIMESTAMP_FORMAT)
+
+
+# Текущие значения счетчиков хранятся в строке statistics с id = 1.
+# Пересчет счетчиков с нуля (при миграции и для восстановления):
+CREATE_STATISTICS_ROW_SQL = '''
+    INSERT OR IGNORE INTO statistics
+    (id, total_rules, active_rules, total_users, total_components, metrics)
+    VALUES (1, 0, 0, 0, 0, '{}')
+'''
+
+REBUILD_STATISTICS_SQL = '''
+    UPDATE statistics
+    SET total_rules = (SELECT COUNT(*) FROM adaptation_rules),
+        active_rules = (SELECT COUNT(*) FROM adaptation_rules WHERE enabled = 1),
+        total_users = (SELECT COUNT(*) FROM interaction_users),
+        total_components = (SELECT COUNT(*) FROM components)
+    WHERE id = 1
+'''
+
+STATISTICS_QUERY = '''
+    SELECT total_rules, active_rules, total_users, total_components
+    FROM statistics WHERE id = 1
+'''
+
+# Версионированные миграции схемы: (версия, описание, SQL-операторы).
+# Применяются по порядку поверх базовой схемы, каждая в своей транзакции;
+# новые миграции добавляются только в конец списка.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'Индексы для горячих запросов', [
+        # История пользователя: WHERE user_id = ? ORDER BY timestamp DESC
+        'CREATE INDEX IF NOT EXISTS idx_user_interactions_user_ts '
+        'ON user_interactions (user_id, timestamp)',
+        # Включенные правила по приоритету
+        'CREATE INDEX IF NOT EXISTS idx_adaptation_rules_enabled_priority '
+        'ON adaptation_rules (enabled, priority)',
+        # Список компонентов по дате создания
+        'CREATE INDEX IF NOT EXISTS idx_components_created_at '
+        'ON components (created_at)',
+    ]),
+    (2, 'Инкрементальные счетчики в таблице statistics', [
+        'ALTER TABLE statistics ADD COLUMN total_components INTEGER DEFAULT 0',
+        CREATE_STATISTICS_ROW_SQL,
+        # Пересчет в том виде, в каком он был до партиционирования (миграция 5)
+        '''UPDATE statistics
+           SET total_rules = (SELECT COUNT(*) FROM adaptation_rules),
+               active_rules = (SELECT COUNT(*) FROM adaptation_rules WHERE enabled = 1),
+               total_users = (SELECT COUNT(DISTINCT user_id) FROM user_interactions),
+               total_components = (SELECT COUNT(*) FROM components)
+           WHERE id = 1''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_rule_insert
+           AFTER INSERT ON adaptation_rules BEGIN
+               UPDATE statistics
+               SET total_rules = total_rules + 1,
+                   active_rules = active_rules + (NEW.enabled = 1)
+               WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_rule_delete
+           AFTER DELETE ON adaptation_rules BEGIN
+               UPDATE statistics
+               SET total_rules = total_rules - 1,
+                   active_rules = active_rules - (OLD.enabled = 1)
+               WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_rule_enabled
+           AFTER UPDATE OF enabled ON adaptation_rules BEGIN
+               UPDATE statistics
+               SET active_rules = active_rules + (NEW.enabled = 1) - (OLD.enabled = 1)
+               WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_component_insert
+           AFTER INSERT ON components BEGIN
+               UPDATE statistics SET total_components = total_components + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_component_delete
+           AFTER DELETE ON components BEGIN
+               UPDATE statistics SET total_components = total_components - 1 WHERE id = 1;
+           END''',
+        # Первое/последнее событие пользователя - проверка по индексу (user_id, timestamp)
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_interaction_insert
+           AFTER INSERT ON user_interactions
+           WHEN NOT EXISTS (SELECT 1 FROM user_interactions
+                            WHERE user_id = NEW.user_id AND id <> NEW.id) BEGIN
+               UPDATE statistics SET total_users = total_users + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_interaction_delete
+           AFTER DELETE ON user_interactions
+           WHEN NOT EXISTS (SELECT 1 FROM user_interactions WHERE user_id = OLD.user_id) BEGIN
+               UPDATE statistics SET total_users = total_users - 1 WHERE id = 1;
+           END''',
+    ]),
+    (3, 'Версии правил для кеша разобранных правил', [
+        # Версия строки правила и общая версия набора правил (statistics.rules_version)
+        'ALTER TABLE adaptation_rules ADD COLUMN version INTEGER NOT NULL DEFAULT 0',
+        'ALTER TABLE statistics ADD COLUMN rules_version INTEGER NOT NULL DEFAULT 0',
+        'CREATE INDEX IF NOT EXISTS idx_adaptation_rules_version ON adaptation_rules (version)',
+        '''CREATE TRIGGER IF NOT EXISTS trg_adaptation_rules_version
+           AFTER UPDATE ON adaptation_rules
+           WHEN NEW.version = OLD.version BEGIN
+               UPDATE adaptation_rules SET version = OLD.version + 1 WHERE id = NEW.id;
+               UPDATE statistics SET rules_version = rules_version + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_rules_version_insert
+           AFTER INSERT ON adaptation_rules BEGIN
+               UPDATE statistics SET rules_version = rules_version + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_rules_version_delete
+           AFTER DELETE ON adaptation_rules BEGIN
+               UPDATE statistics SET rules_version = rules_version + 1 WHERE id = 1;
+           END''',
+    ]),
+    (4, 'Снимки скользящих окон поведения пользователей', [
+        # Хвост событий после снимка: WHERE timestamp >= ?
+        'CREATE INDEX IF NOT EXISTS idx_user_interactions_ts ON user_interactions (timestamp)',
+        '''CREATE TABLE IF NOT EXISTS behavior_windows (
+               user_id INTEGER PRIMARY KEY,
+               last_ts INTEGER,
+               state BLOB NOT NULL
+           )''',
+        '''CREATE TABLE IF NOT EXISTS behavior_checkpoint (
+               id INTEGER PRIMARY KEY CHECK (id = 1),
+               checkpoint_ts INTEGER NOT NULL
+           )''',
+    ]),
+    (5, 'Партиции user_interactions по времени и дневные агрегаты', [
+        # Число пользователей ведется по реестру interaction_users: он переживает
+        # сжатие старых событий и не требует поиска по всем партициям
+        'DROP TRIGGER IF EXISTS trg_statistics_interaction_insert',
+        'DROP TRIGGER IF EXISTS trg_statistics_interaction_delete',
+        'CREATE TABLE IF NOT EXISTS interaction_users (user_id INTEGER PRIMARY KEY)',
+        'INSERT OR IGNORE INTO interaction_users (user_id) SELECT DISTINCT user_id FROM user_interactions',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_interaction_user_insert
+           AFTER INSERT ON interaction_users BEGIN
+               UPDATE statistics SET total_users = total_users + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_interaction_user_delete
+           AFTER DELETE ON interaction_users BEGIN
+               UPDATE statistics SET total_users = total_users - 1 WHERE id = 1;
+           END''',
+        # Сквозные id событий во всех партициях
+        'ALTER TABLE statistics ADD COLUMN interaction_seq INTEGER NOT NULL DEFAULT 0',
+        # Существующие события остаются в user_interactions_legacy, чтение - через представление
+        'ALTER TABLE user_interactions RENAME TO user_interactions_legacy',
+        f'CREATE VIEW user_interactions AS SELECT {INTERACTION_COLUMNS} FROM user_interactions_legacy',
+        '''UPDATE statistics
+           SET total_users = (SELECT COUNT(*) FROM interaction_users),
+               interaction_seq = MAX(
+                   (SELECT COALESCE(MAX(id), 0) FROM user_interactions_legacy),
+                   (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence
+                    WHERE name = 'user_interactions_legacy'))
+           WHERE id = 1''',
+        # Сжатые события: число событий за день (component_id = 0 - без компонента)
+        '''CREATE TABLE IF NOT EXISTS interaction_daily (
+               day TEXT NOT NULL,
+               user_id INTEGER NOT NULL,
+               action TEXT NOT NULL,
+               component_id INTEGER NOT NULL DEFAULT 0,
+               events INTEGER NOT NULL,
+               PRIMARY KEY (day, user_id, action, component_id)
+           ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_interaction_daily_user ON interaction_daily (user_id)',
+    ]),
+    (6, 'A/B эксперименты над правилами адаптации', [
+        # Счетчики вариантов ведутся инкрементально при записи показов и конверсий
+        '''CREATE TABLE IF NOT EXISTS ab_experiments (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               rule_a_id INTEGER NOT NULL,
+               rule_b_id INTEGER NOT NULL,
+               conversion_action TEXT NOT NULL,
+               status TEXT NOT NULL DEFAULT 'running',
+               exposures_a INTEGER NOT NULL DEFAULT 0,
+               conversions_a INTEGER NOT NULL DEFAULT 0,
+               exposures_b INTEGER NOT NULL DEFAULT 0,
+               conversions_b INTEGER NOT NULL DEFAULT 0,
+               min_p_value REAL NOT NULL DEFAULT 1.0,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               stopped_at TIMESTAMP
+           )''',
+        # Показанные пользователи: каждый учитывается один раз (variant: 0 - A, 1 - B)
+        '''CREATE TABLE IF NOT EXISTS ab_exposures (
+               experiment_id INTEGER NOT NULL,
+               user_id INTEGER NOT NULL,
+               variant INTEGER NOT NULL,
+               converted INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (experiment_id, user_id)
+           ) WITHOUT ROWID''',
+    ]),
+    (7, 'Версия набора компонентов для кеша ответов', [
+        # Общая для всех процессов версия: кеш ответов сверяется с ней при чтении
+        'ALTER TABLE statistics ADD COLUMN components_version INTEGER NOT NULL DEFAULT 0',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_components_version_insert
+           AFTER INSERT ON components BEGIN
+               UPDATE statistics SET components_version = components_version + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_components_version_update
+           AFTER UPDATE ON components BEGIN
+               UPDATE statistics SET components_version = components_version + 1 WHERE id = 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_statistics_components_version_delete
+           AFTER DELETE ON components BEGIN
+               UPDATE statistics SET components_version = components_version + 1 WHERE id = 1;
+           END''',
+    ]),
+    (8, 'Снимок окон поведения по id последнего учтенного события', [
+        # Снимки без id (0) не используются: окна переигрываются за последние сутки
+        'ALTER TABLE behavior_checkpoint ADD COLUMN last_event_id INTEGER NOT NULL DEFAULT 0',
+    ]),
+]
+
+# Сколько пользователей передавать в одном запросе WHERE user_id IN (...)
+_EXPERIMENT_CHUNK = 500
+
+
+def _check_rule_json(conditions: Any, actions: Any) -> None:
+    """Условия и действия правила хранятся как JSON-объекты"""
+    for name, value in (('conditions', conditions), ('actions', actions)):
+        if not isinstance(value, dict):
+            raise ValueError(f'{name} must be an object')
+
+
+def build_list_query(table: str, fields: Optional[Tuple[str, ...]], order_by: str,
+                     after_id: Optional[int] = None, limit: Optional[int] = None,
+                     where: Optional[str] = None) -> Tuple[str, tuple]:
+    """
+    Построить SELECT для списка: проекция столбцов и keyset-пагинация.
+    При пагинации (after_id/limit) строки упорядочены по id.
+    """
+    columns = ', '.join(fields) if fields else '*'
+    conditions = [where] if where else []
+    params: List[Any] = []
+    paginated = after_id is not None or limit is not None
+    if after_id is not None:
+        conditions.append('id > ?')
+        params.append(after_id)
+
+    query = f'SELECT {columns} FROM {table}'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id' if paginated else f' ORDER BY {order_by}'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return query, tuple(params)
 
 
 class DatabaseManager:
-    """Менеджер для управления базой данных SQLite"""
+    """
+    Единый слой доступа к данным: схема, миграции, CRUD для маршрутов Flask,
+    контроллеров и infrastructure.Repository. Соединения берутся из общего
+    пула; SQL-тексты постоянны, поэтому подготовленные выражения
+    переиспользуются кешем sqlite3 (cached_statements).
+    """
 
-    def __init__(self, db_path: str = "adaptive_ui.db"):
+    def __init__(self, db_path: str = "adaptive_ui.db", initialize: bool = True,
+                 partition_period: str = settings.INTERACTION_PARTITION_PERIOD):
+        if partition_period not in ('day', 'month'):
+            raise ValueError(f"Неизвестный период партиций: {partition_period}")
         self.db_path = db_path
-        self.init_database()
+        self.partition_period = partition_period
+        # Ключи партиций событий, которые точно существуют
+        self._partitions: Set[str] = set()
+        self.pool = get_pool(db_path)
+        # Разобранные правила и индекс по условиям (синхронизируются по версиям в БД)
+        self.rule_store = get_rule_store(db_path)
+        self.rule_index = get_rule_index(db_path)
+        self.components_cache = get_versioned_cache(db_path, 'components')
+        if initialize:
+            self.init_database()
 
     def init_database(self):
         """Инициализация базы данных"""
-        conn = sqlite3.connect(self.db_path)
+        with self.pool.connection() as conn:
+            self._create_schema(conn)
+            self.migrate(conn)
+
+    def _create_schema(self, conn: sqlite3.Connection):
+        """Создать таблицы"""
         cursor = conn.cursor()
 
         # Таблица пользователей
@@ -82,32 +411,101 @@ class DatabaseManager:
             )
         ''')
 
+        # Таблица примененных миграций
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
         conn.commit()
-        conn.close()
+
+    def get_schema_version(self, conn: sqlite3.Connection) -> int:
+        """Получить номер последней примененной миграции"""
+        row = conn.execute('SELECT MAX(version) FROM schema_migrations').fetchone()
+        return row[0] or 0
+
+    def migrate(self, conn: sqlite3.Connection) -> int:
+        """Применить недостающие миграции (возвращает число примененных)"""
+        if self.get_schema_version(conn) >= MIGRATIONS[-1][0]:
+            return 0
+
+        applied = 0
+        for version, description, statements in MIGRATIONS:
+            # IMMEDIATE: параллельный процесс не применит ту же миграцию дважды
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self.get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute('INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                             (version, description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied += 1
+            print(f"[DatabaseManager] Миграция {version} применена: {description}")
+
+        if applied:
+            # Обновить статистику для планировщика запросов
+            conn.execute('ANALYZE')
+            conn.commit()
+        return applied
+
+    def explain(self, query: str, params: tuple = ()) -> List[str]:
+        """
+        План выполнения запроса (EXPLAIN QUERY PLAN), например:
+        ['SEARCH user_interactions USING INDEX idx_user_interactions_user_ts (user_id=?)']
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + query, params).fetchall()
+        return [row['detail'] for row in rows]
 
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict]:
         """Выполнить SELECT запрос"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        return [dict(row) for row in self.iter_query(query, params)]
+
+    def iter_query(self, query: str, params: tuple = (),
+                   chunk_size: int = settings.DB_FETCH_CHUNK_SIZE) -> Iterator[sqlite3.Row]:
+        """
+        Выполнить SELECT и выдавать строки по мере чтения (fetchmany по
+        chunk_size): в памяти одна пачка, а не весь результат. Строки -
+        sqlite3.Row (кортеж с доступом по имени столбца). Соединение пула
+        занято, пока генератор не исчерпан или не закрыт, - для ответов
+        клиенту, который читает медленно, нужны keyset-страницы (iter_components).
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield from rows
 
     def execute_update(self, query: str, params: tuple = ()) -> int:
         """Выполнить INSERT/UPDATE/DELETE запрос"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        last_id = cursor.lastrowid
-        conn.close()
-        return last_id
+        return self._execute_write(query, params).lastrowid
+
+    def _execute_write(self, query: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Выполнить изменяющий запрос и зафиксировать транзакцию"""
+        with self.pool.connection() as conn:
+            cursor = conn.execute(query, params)
+            conn.commit()
+            return cursor
+
+    def get_pool_stats(self) -> Dict:
+        """Получить счетчики пула соединений"""
+        return self.pool.get_stats()
 
     def add_rule(self, name: str, description: str, conditions: Dict,
                  actions: Dict, priority: int) -> int:
-        """Добавить правило адаптации"""
+        """Добавить правило адаптации (ValueError, если условия или действия - не объекты)"""
+        _check_rule_json(conditions, actions)
         query = '''
             INSERT INTO adaptation_rules 
             (name, description, conditions, actions, priority)
@@ -117,13 +515,44 @@ class DatabaseManager:
         actions_json = json.dumps(actions)
         return self.execute_update(query, (name, description, conditions_json, actions_json, priority))
 
-    def get_rules(self, enabled_only: bool = False) -> List[Dict]:
-        """Получить все правила"""
-        query = 'SELECT * FROM adaptation_rules'
-        if enabled_only:
-            query += ' WHERE enabled = 1'
-        query += ' ORDER BY priority DESC'
-        return self.execute_query(query)
+    def update_rule(self, rule_id: int, name: str, description: str, conditions: Dict,
+                    actions: Dict, priority: int, enabled: bool) -> bool:
+        """Обновить правило адаптации (ValueError, если условия или действия - не объекты)"""
+        _check_rule_json(conditions, actions)
+        query = '''
+            UPDATE adaptation_rules 
+            SET name = ?, description = ?, conditions = ?, actions = ?, priority = ?,
+                enabled = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        '''
+        conditions_json = json.dumps(conditions)
+        actions_json = json.dumps(actions)
+        cursor = self._execute_write(query, (name, description, conditions_json, actions_json,
+                                             priority, enabled, rule_id))
+        return cursor.rowcount > 0
+
+    def toggle_rule(self, rule_id: int) -> bool:
+        """Включить/выключить правило"""
+        query = '''
+            UPDATE adaptation_rules 
+            SET enabled = NOT enabled, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        '''
+        cursor = self._execute_write(query, (rule_id,))
+        return cursor.rowcount > 0
+
+    def delete_rule(self, rule_id: int) -> bool:
+        """Удалить правило"""
+        cursor = self._execute_write('DELETE FROM adaptation_rules WHERE id = ?', (rule_id,))
+        return cursor.rowcount > 0
+
+    def get_rules(self, enabled_only: bool = False, fields: Optional[Tuple[str, ...]] = None,
+                  after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Получить все правила (или страницу правил с выбранными полями)"""
+        query, params = build_list_query('adaptation_rules', fields, 'priority DESC',
+                                         after_id, limit,
+                                         where='enabled = 1' if enabled_only else None)
+        return self.execute_query(query, params)
 
     def get_rule_by_id(self, rule_id: int) -> Optional[Dict]:
         """Получить правило по ID"""
@@ -140,33 +569,550 @@ class DatabaseManager:
             VALUES (?, ?, ?, ?, ?, ?)
         '''
         return self.execute_update(query, (name, comp_type, description,
-                                          html_template, css_styles, js_script))
+                                           html_template, css_styles, js_script))
+
+    def update_component(self, component_id: int, name: str, comp_type: str, description: str,
+                         html_template: str, css_styles: str, js_script: str = "") -> bool:
+        """Обновить компонент"""
+        query = '''
+            UPDATE components 
+            SET name = ?, type = ?, description = ?, html_template = ?, css_styles = ?, js_script = ?
+            WHERE id = ?
+        '''
+        cursor = self._execute_write(query, (name, comp_type, description, html_template,
+                                             css_styles, js_script, component_id))
+        return cursor.rowcount > 0
+
+    def delete_component(self, component_id: int) -> bool:
+        """Удалить компонент"""
+        cursor = self._execute_write('DELETE FROM components WHERE id = ?', (component_id,))
+        return cursor.rowcount > 0
+
+    def get_components_version(self) -> int:
+        """Версия набора компонентов (statistics.components_version, ведут триггеры)"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT components_version FROM statistics WHERE id = 1').fetchone()
+        return row[0] if row else 0
 
-    def get_components(self) -> List[Dict]:
-        """Получить все компоненты"""
-        query = 'SELECT * FROM components ORDER BY created_at DESC'
-        return self.execute_query(query)
+    def get_components(self, fields: Optional[Tuple[str, ...]] = None,
+                       after_id: Optional[int] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Получить все компоненты (или страницу компонентов с выбранными полями)"""
+        query, params = build_list_query('components', fields, 'created_at DESC', after_id, limit)
+        return self.execute_query(query, params)
+
+    def iter_components(self, fields: Optional[Tuple[str, ...]] = None,
+                        after_id: Optional[int] = None,
+                        chunk_size: int = settings.DB_FETCH_CHUNK_SIZE) -> Iterator[Dict]:
+        """
+        Компоненты в порядке get_components, потоком keyset-страниц по
+        chunk_size: соединение пула берется только на чтение страницы, поэтому
+        медленный потребитель (HTTP-клиент) его не держит. Страницы читаются
+        в разных транзакциях - записи между ними могут быть видны частично.
+        """
+        if after_id is not None:
+            keys, order, where, last = ('id',), 'id', 'id > ?', (after_id,)
+        else:
+            keys, order, where, last = (('created_at', 'id'), 'created_at DESC, id DESC',
+                                        '(created_at, id) < (?, ?)', None)
+        # Столбцы ключа читаются, даже если не входят в проекцию
+        extra = [key for key in keys if fields and key not in fields]
+        columns = ', '.join(list(fields) + extra) if fields else '*'
+        while True:
+            query = f'SELECT {columns} FROM components'
+            params = ()
+            if last is not None:
+                query += f' WHERE {where}'
+                params = last
+            query += f' ORDER BY {order} LIMIT ?'
+            with self.pool.connection() as conn:
+                rows = conn.execute(query, params + (chunk_size,)).fetchall()
+            for row in rows:
+                item = dict(row)
+                for key in extra:
+                    del item[key]
+                yield item
+            if len(rows) < chunk_size:
+                return
+            last = tuple(rows[-1][key] for key in keys)
+
+    def get_component_by_id(self, component_id: int,
+                            fields: Optional[Tuple[str, ...]] = None) -> Optional[Dict]:
+        """Получить компонент по ID"""
+        columns = ', '.join(fields) if fields else '*'
+        results = self.execute_query(f'SELECT {columns} FROM components WHERE id = ?',
+                                     (component_id,))
+        return results[0] if results else None
+
+    def find_row(self, table: str, row_id: int) -> Optional[Dict]:
+        """Найти строку любой таблицы сущностей по ID"""
+        if table not in ENTITY_TABLES.values():
+            raise ValueError(f"Неизвестная таблица: {table}")
+        results = self.execute_query(f'SELECT * FROM {table} WHERE id = ?', (row_id,))
+        return results[0] if results else None
+
+    def add_user(self, username: str, password_hash: str, role: str) -> int:
+        """Добавить пользователя"""
+        query = 'INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)'
+        return self.execute_update(query, (username, password_hash, role))
 
     def record_interaction(self, user_id: int, action: str,
                           component_id: Optional[int] = None,
-                          metadata: Optional[Dict] = None) -> int:
-        """Записать взаимодействие пользователя"""
+                          metadata: Optional[Dict] = None,
+                          timestamp: Optional[str] = None) -> int:
+        """Записать взаимодействие пользователя (timestamp - UTC, по умолчанию текущее)"""
+        metadata_json = json.dumps(metadata or {})
+        row = (user_id, action, component_id, metadata_json, timestamp or format_timestamp())
+        return self._insert_interactions([row])
+
+    def record_interactions(self, rows: Iterable[Tuple]) -> int:
+        """
+        Записать пачку взаимодействий одной транзакцией
+        (строки: user_id, action, component_id, metadata_json, timestamp)
+        """
+        rows = list(rows)
+        if rows:
+            self._insert_interactions(rows)
+        return len(rows)
+
+    def _insert_interactions(self, rows: List[Tuple]) -> int:
+        """Разложить события по партициям времени (возвращает id первого события)"""
+        try:
+            return self._insert_into_partitions(rows)
+        except sqlite3.OperationalError as e:
+            if 'no such table' not in str(e):
+                raise
+            # Партицию удалило сжатие в другом процессе - перечитать список партиций
+            self._partitions.clear()
+            return self._insert_into_partitions(rows)
+
+    def _insert_into_partitions(self, rows: List[Tuple]) -> int:
+        with self.pool.connection() as conn:
+            # Блок сквозных id; UPDATE начинает пишущую транзакцию
+            seq = conn.execute(
+                'UPDATE statistics SET interaction_seq = interaction_seq + ? WHERE id = 1 '
+                'RETURNING interaction_seq', (len(rows),)
+            ).fetchall()[0][0]
+            first_id = seq - len(rows) + 1
+
+            by_partition: Dict[str, List[Tuple]] = {}
+            period = self.partition_period
+            for row_id, row in enumerate(rows, first_id):
+                key = partition_key(row[4], period)
+                by_partition.setdefault(key, []).append((row_id,) + tuple(row))
+
+            created = self._create_partitions(conn, by_partition)
+            for key, partition_rows in by_partition.items():
+                conn.executemany(
+                    f'INSERT INTO {PARTITION_PREFIX}{key} '
+                    '(id, user_id, action, component_id, metadata, timestamp) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', partition_rows)
+            conn.commit()
+        self._partitions.update(created)
+        return first_id
+
+    def list_partitions(self, conn: sqlite3.Connection) -> List[str]:
+        """Ключи существующих партиций событий по возрастанию"""
+        names = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'user_interactions_%'"
+        ).fetchall()
+        return sorted(match.group(1) for match in (_PARTITION_NAME.match(row[0]) for row in names)
+                      if match)
+
+    def _create_partitions(self, conn: sqlite3.Connection, keys: Iterable[str]) -> List[str]:
+        """Создать недостающие партиции в текущей транзакции (возвращает их ключи)"""
+        missing = [key for key in keys if key not in self._partitions]
+        if not missing:
+            return []
+
+        existing = set(self.list_partitions(conn))
+        self._partitions.update(existing)
+        created = [key for key in missing if key not in existing]
+        for key in created:
+            table = PARTITION_PREFIX + key
+            conn.execute(f'''
+                CREATE TABLE {table} (
+                    id INTEGER PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    action TEXT NOT NULL,
+                    component_id INTEGER,
+                    timestamp TIMESTAMP NOT NULL,
+                    metadata JSON
+                )
+            ''')
+            conn.execute(f'CREATE INDEX idx_{table}_user_ts ON {table} (user_id, timestamp)')
+            conn.execute(f'CREATE INDEX idx_{table}_ts ON {table} (timestamp)')
+            conn.execute(f'''
+                CREATE TRIGGER trg_{table}_user AFTER INSERT ON {table} BEGIN
+                    INSERT OR IGNORE INTO interaction_users (user_id) VALUES (NEW.user_id);
+                END
+            ''')
+        if created:
+            self._rebuild_interactions_view(conn, sorted(existing.union(created)))
+            print(f"[DatabaseManager] Созданы партиции событий: {', '.join(created)}")
+        return created
+
+    def _rebuild_interactions_view(self, conn: sqlite3.Connection, keys: List[str]) -> None:
+        """Пересоздать представление user_interactions над legacy-таблицей и партициями"""
+        tables = [LEGACY_INTERACTIONS_TABLE] + [PARTITION_PREFIX + key for key in keys]
+        union = ' UNION ALL '.join(f'SELECT {INTERACTION_COLUMNS} FROM {table}' for table in tables)
+        conn.execute('DROP VIEW IF EXISTS user_interactions')
+        conn.execute(f'CREATE VIEW user_interactions AS {union}')
+
+    def compact_interactions(self, now: Optional[datetime] = None,
+                             raw_retention_days: int = settings.INTERACTION_RAW_RETENTION_DAYS,
+                             aggregate_retention_days: int = settings.INTERACTION_AGGREGATE_RETENTION_DAYS
+                             ) -> Dict[str, int]:
+        """
+        Свернуть сырые события старше raw_retention_days в дневные агрегаты
+        (interaction_daily) и удалить агрегаты старше aggregate_retention_days.
+        Полностью устаревшие партиции удаляются целиком; каждая таблица
+        обрабатывается в своей транзакции.
+        """
+        today = (now or datetime.now(timezone.utc)).date()
+        cutoff = f'{today - timedelta(days=raw_retention_days)} 00:00:00'
+        aggregate_cutoff = str(today - timedelta(days=aggregate_retention_days))
+        result = {'compacted': 0, 'dropped_partitions': 0, 'expired_aggregates': 0, 'removed_users': 0}
+
+        with self.pool.connection() as conn:
+            tables = [(LEGACY_INTERACTIONS_TABLE, None)]
+            tables.extend((PARTITION_PREFIX + key, key) for key in self.list_partitions(conn))
+
+            for table, key in tables:
+                drop = False
+                if key is not None:
+                    start, end = partition_bounds(key)
+                    if start >= cutoff:
+                        continue
+                    drop = end <= cutoff
+
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute(COMPACT_INTERACTIONS_SQL.format(table=table), (cutoff,))
+                    if drop:
+                        result['compacted'] += conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                        conn.execute(f'DROP TABLE {table}')
+                        remaining = [k for k in self.list_partitions(conn) if k != key]
+                        self._rebuild_interactions_view(conn, remaining)
+                    else:
+                        result['compacted'] += conn.execute(
+                            f'DELETE FROM {table} WHERE timestamp < ?', (cutoff,)).rowcount
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                if drop:
+                    self._partitions.discard(key)
+                    result['dropped_partitions'] += 1
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result['expired_aggregates'] = conn.execute(
+                    'DELETE FROM interaction_daily WHERE day < ?', (aggregate_cutoff,)).rowcount
+                if result['expired_aggregates']:
+                    # Пользователи, от которых не осталось ни событий, ни агрегатов
+                    result['removed_users'] = conn.execute('''
+                        DELETE FROM interaction_users
+                        WHERE NOT EXISTS (SELECT 1 FROM interaction_daily d
+                                          WHERE d.user_id = interaction_users.user_id)
+                          AND NOT EXISTS (SELECT 1 FROM user_interactions i
+                                          WHERE i.user_id = interaction_users.user_id)
+                    ''').rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        print(f"[DatabaseManager] Сжатие событий: {result}")
+        return result
+
+    def get_behavior_checkpoint(self) -> Tuple[Optional[int], int,
+                                               List[Tuple[int, Optional[int], bytes]]]:
+        """
+        Снимок окон поведения: (время снимка, id последнего учтенного события,
+        строки user_id, last_ts, state); (None, 0, []) - снимка нет
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                row = conn.execute('SELECT checkpoint_ts, last_event_id FROM behavior_checkpoint '
+                                   'WHERE id = 1').fetchone()
+                if row is None:
+                    return None, 0, []
+                states = conn.execute('SELECT user_id, last_ts, state FROM behavior_windows').fetchall()
+            finally:
+                conn.commit()
+        return row[0], row[1], [tuple(state) for state in states]
+
+    def save_behavior_checkpoint(self, checkpoint_ts: int, last_event_id: int,
+                                 states: Iterable[Tuple[int, Optional[int], bytes]],
+                                 removed: Iterable[int] = ()) -> bool:
+        """
+        Сохранить измененные окна поведения одной транзакцией, если сохраненный
+        снимок учитывает меньше событий (last_event_id); False - снимок не записан
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT last_event_id FROM behavior_checkpoint WHERE id = 1').fetchone()
+                if row is not None and row[0] >= last_event_id:
+                    conn.rollback()
+                    return False
+                conn.executemany('INSERT OR REPLACE INTO behavior_windows (user_id, last_ts, state) '
+                                 'VALUES (?, ?, ?)', states)
+                conn.executemany('DELETE FROM behavior_windows WHERE user_id = ?',
+                                 ((user_id,) for user_id in removed))
+                conn.execute('INSERT OR REPLACE INTO behavior_checkpoint (id, checkpoint_ts, last_event_id) '
+                             'VALUES (1, ?, ?)', (checkpoint_ts, last_event_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return True
+
+    def get_interaction_events_since(self, since_ts: int) -> Tuple[int, List[Tuple[int, int, str, int]]]:
+        """
+        События начиная с момента since_ts: (id последнего события базы,
+        строки id, user_id, action, unix-время по времени) из одного снимка
+        """
         query = '''
-            INSERT INTO user_interactions 
-            (user_id, action, component_id, metadata)
-            VALUES (?, ?, ?, ?)
+            SELECT id, user_id, action, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM user_interactions
+            WHERE timestamp >= ?
+            ORDER BY timestamp, id
         '''
-        metadata_json = json.dumps(metadata or {})
-        return self.execute_update(query, (user_id, action, component_id, metadata_json))
+        since = format_timestamp(since_ts)
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN')
+            try:
+                events = [tuple(row) for row in conn.execute(query, (since,))]
+                # id выдаются из interaction_seq в транзакции вставки: все id до него уже видны
+                row = conn.execute('SELECT interaction_seq FROM statistics WHERE id = 1').fetchone()
+            finally:
+                conn.commit()
+        return (row[0] if row else 0), events
+
+    def get_interaction_events_after(self, last_id: int, limit: int) -> List[Tuple[int, int, str, int]]:
+        """
+        Не больше limit событий с id больше last_id: (id, user_id, action,
+        unix-время) по возрастанию id. id выдаются в транзакции вставки, поэтому
+        событие с меньшим id не может появиться после прочитанного большего
+        """
+        query = '''
+            SELECT id, user_id, action, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM user_interactions
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        '''
+        with self.pool.connection() as conn:
+            return [tuple(row) for row in conn.execute(query, (last_id, limit))]
+
+    def add_experiment(self, rule_a_id: int, rule_b_id: int, conversion_action: str) -> int:
+        """Добавить A/B эксперимент"""
+        query = 'INSERT INTO ab_experiments (rule_a_id, rule_b_id, conversion_action) VALUES (?, ?, ?)'
+        return self.execute_update(query, (rule_a_id, rule_b_id, conversion_action))
+
+    def get_experiment(self, experiment_id: int) -> Optional[Dict]:
+        """Получить A/B эксперимент по ID"""
+        results = self.execute_query('SELECT * FROM ab_experiments WHERE id = ?', (experiment_id,))
+        return results[0] if results else None
+
+    def get_experiments(self, status: Optional[str] = None) -> List[Dict]:
+        """Получить A/B эксперименты (новые первыми)"""
+        if status is None:
+            return self.execute_query('SELECT * FROM ab_experiments ORDER BY id DESC')
+        return self.execute_query('SELECT * FROM ab_experiments WHERE status = ? ORDER BY id DESC',
+                                  (status,))
+
+    def stop_experiment(self, experiment_id: int) -> bool:
+        """Остановить A/B эксперимент"""
+        query = '''
+            UPDATE ab_experiments
+            SET status = 'stopped', stopped_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'running'
+        '''
+        return self._execute_write(query, (experiment_id,)).rowcount > 0
+
+    def record_experiment_events(self, experiment_id: int, exposures: Dict[int, int],
+                                 conversions: Iterable[int],
+                                 prior_conversions: Iterable[int] = ()) -> Optional[Dict]:
+        """
+        Записать показы {user_id: вариант} и конверсии пользователей одной
+        транзакцией и увеличить счетчики эксперимента на фактически
+        записанное: повторный показ, повторная конверсия и конверсия без
+        показа не учитываются. prior_conversions - действия, совершенные до
+        показов этой пачки: они учитываются раньше показов, то есть только
+        у пользователей, показанных прежде. Возвращает обновленный эксперимент.
+        """
+        new_exposures = [0, 0]
+        new_conversions = [0, 0]
+
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._convert_exposures(conn, experiment_id, list(prior_conversions), new_conversions)
+                for variant in (0, 1):
+                    rows = [(experiment_id, user_id, variant)
+                            for user_id, user_variant in exposures.items() if user_variant == variant]
+                    if rows:
+                        new_exposures[variant] = conn.executemany(
+                            'INSERT OR IGNORE INTO ab_exposures (experiment_id, user_id, variant) '
+                            'VALUES (?, ?, ?)', rows).rowcount
+                self._convert_exposures(conn, experiment_id, list(conversions), new_conversions)
+
+                conn.execute('''
+                    UPDATE ab_experiments
+                    SET exposures_a = exposures_a + ?, exposures_b = exposures_b + ?,
+                        conversions_a = conversions_a + ?, conversions_b = conversions_b + ?
+                    WHERE id = ?
+                ''', (*new_exposures, *new_conversions, experiment_id))
+                row = conn.execute('SELECT * FROM ab_experiments WHERE id = ?', (experiment_id,)).fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return dict(row) if row else None
+
+    @staticmethod
+    def _convert_exposures(conn: sqlite3.Connection, experiment_id: int, user_ids: List[int],
+                           new_conversions: List[int]) -> None:
+        """Отметить конверсию показанных пользователей (счет по вариантам - в new_conversions)"""
+        for start in range(0, len(user_ids), _EXPERIMENT_CHUNK):
+            chunk = user_ids[start:start + _EXPERIMENT_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            converted = conn.execute(f'''
+                UPDATE ab_exposures SET converted = 1
+                WHERE experiment_id = ? AND converted = 0 AND user_id IN ({placeholders})
+                RETURNING variant
+            ''', (experiment_id, *chunk)).fetchall()
+            for (variant,) in converted:
+                new_conversions[variant] += 1
+
+    def update_experiment_p_value(self, experiment_id: int, p_value: float) -> None:
+        """Учесть очередное последовательное p-значение (хранится минимум)"""
+        self._execute_write('UPDATE ab_experiments SET min_p_value = MIN(min_p_value, ?) WHERE id = ?',
+                            (p_value, experiment_id))
+
+    def get_interaction_bounds(self) -> Tuple[int, int]:
+        """Число событий и максимальный id (граница снимка для выгрузки)"""
+        with self.pool.connection() as conn:
+            count, max_id = conn.execute('SELECT COUNT(*), MAX(id) FROM user_interactions').fetchone()
+        return count, max_id or 0
+
+    def iter_interaction_chunks(self, max_id: int, chunk_size: int = 100000
+                                ) -> Iterator[List[Tuple[int, int, str, Optional[int], int]]]:
+        """
+        События с id <= max_id по возрастанию id пачками по chunk_size:
+        (id, user_id, action, component_id, unix-время)
+        """
+        query = '''
+            SELECT id, user_id, action, component_id, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM user_interactions
+            WHERE id <= ?
+            ORDER BY id
+        '''
+        with self.pool.connection() as conn:
+            cursor = conn.execute(query, (max_id,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+
+    def get_last_interaction_ts(self) -> Optional[int]:
+        """Время последнего события (unix-время, UTC); None - событий нет"""
+        with self.pool.connection() as conn:
+            tables = [LEGACY_INTERACTIONS_TABLE] + [PARTITION_PREFIX + key
+                                                    for key in self.list_partitions(conn)]
+            # MAX по индексу каждой таблицы, а не по представлению
+            values = [conn.execute(f"SELECT CAST(strftime('%s', MAX(timestamp)) AS INTEGER) "
+                                   f"FROM {table}").fetchone()[0] for table in tables]
+        values = [value for value in values if value is not None]
+        return max(values) if values else None
+
+    def get_event_row_counts(self) -> Tuple[int, int]:
+        """
+        Число строк истории событий: (сырые события, строки дневных агрегатов
+        interaction_daily). Проход по индексам всех таблиц - для офлайн-задач.
+        """
+        with self.pool.connection() as conn:
+            raw = conn.execute('SELECT COUNT(*) FROM user_interactions').fetchone()[0]
+            daily = conn.execute('SELECT COUNT(*) FROM interaction_daily').fetchone()[0]
+        return raw, daily
+
+    def split_user_ids(self, parts: int, low: Optional[int] = None,
+                       high: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """
+        Разбить пользователей с событиями (interaction_users) из [low, high] на
+        не более parts диапазонов с близким числом пользователей:
+        [(первый user_id, последний user_id, число пользователей), ...]
+        """
+        bounds = (-(1 << 63) if low is None else low, (1 << 63) - 1 if high is None else high)
+        with self.pool.connection() as conn:
+            count = conn.execute('SELECT COUNT(*) FROM interaction_users WHERE user_id BETWEEN ? AND ?',
+                                 bounds).fetchone()[0]
+            if not count:
+                return []
+            parts = max(1, min(parts, count))
+            # Номер последнего пользователя каждого диапазона
+            ends = {count * (i + 1) // parts - 1 for i in range(parts)}
+            ranges = []
+            first = None
+            cursor = conn.execute('SELECT user_id FROM interaction_users WHERE user_id BETWEEN ? AND ? '
+                                  'ORDER BY user_id', bounds)
+            for position, (user_id,) in enumerate(cursor):
+                if first is None:
+                    first, start = user_id, position
+                if position in ends:
+                    ranges.append((first, user_id, position - start + 1))
+                    first = None
+        return ranges
+
+    def iter_user_events(self, low: int, high: int, actions: Sequence[str],
+                         chunk_size: int = settings.ML_TRAIN_CHUNK_SIZE
+                         ) -> Iterator[List[Tuple[int, int, int, int]]]:
+        """
+        События пользователей low..high по (user_id, timestamp) пачками по
+        chunk_size: (user_id, unix-время, код действия - номер в actions + 1,
+        прочие действия - 0, число событий сжатой строки). Сырые события
+        идут с числом 0; дни, уже свернутые в interaction_daily, - строками
+        агрегатов со временем начала дня и числом событий. Сортировка идет
+        по одному диапазону, поэтому временное B-дерево SQLite не растет
+        с длиной всей истории.
+        """
+        cases = ' '.join('WHEN ? THEN ?' for _ in actions)
+        query = f'''
+            SELECT user_id, CAST(strftime('%s', timestamp) AS INTEGER),
+                   CASE action {cases} ELSE 0 END, 0
+            FROM user_interactions
+            WHERE user_id BETWEEN ? AND ?
+            UNION ALL
+            SELECT user_id, CAST(strftime('%s', day) AS INTEGER),
+                   CASE action {cases} ELSE 0 END, events
+            FROM interaction_daily
+            WHERE user_id BETWEEN ? AND ?
+            ORDER BY 1, 2
+        '''
+        params = tuple(value for code, action in enumerate(actions, 1) for value in (action, code))
+        with self.pool.connection() as conn:
+            cursor = conn.execute(query, params + (low, high) + params + (low, high))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
 
     def get_statistics(self) -> Dict:
-        """Получить общую статистику"""
-        rules_count = self.execute_query('SELECT COUNT(*) as count FROM adaptation_rules')
-        active_rules = self.execute_query('SELECT COUNT(*) as count FROM adaptation_rules WHERE enabled = 1')
-        users_count = self.execute_query('SELECT COUNT(DISTINCT user_id) as count FROM user_interactions')
-
-        return {
-            'total_rules': rules_count[0]['count'],
-            'active_rules': active_rules[0]['count'],
-            'total_users': users_count[0]['count']
-        }
\ No newline at end of file
+        """Получить общую статистику (счетчики ведутся триггерами)"""
+        results = self.execute_query(STATISTICS_QUERY)
+        if not results:
+            return self.rebuild_statistics()
+        return results[0]
+
+    def rebuild_statistics(self) -> Dict:
+        """Пересчитать счетчики статистики полным проходом по таблицам"""
+        with self.pool.connection() as conn:
+            conn.execute(CREATE_STATISTICS_ROW_SQL)
+            conn.execute(REBUILD_STATISTICS_SQL)
+            conn.commit()
+            return dict(conn.execute(STATISTICS_QUERY).fetchone())
\ No newline at end of file
@@ -1,21 +1,52 @@
 from typing import Dict, Any, Optional
 import json
+from database import DatabaseManager, ENTITY_TABLES
+from ml_engine import MLEngine
+import settings
 
 
 class Repository:
-    """Репозиторий для работы с данными"""
+    """Репозиторий для работы с данными (поверх database.DatabaseManager)"""
 
-    def __init__(self, db_manager):
+    def __init__(self, db_manager: DatabaseManager):
         self.db = db_manager
 
     def save_entity(self, entity_type: str, entity_data: Dict) -> int:
-        """Сохранить сущность"""
-        # Реализация сохранения в БД
-        pass
+        """Сохранить сущность (обновить, если в данных есть id)"""
+        data = dict(entity_data)
+        entity_id = data.pop('id', None)
+
+        if entity_type == 'rule':
+            if entity_id is not None:
+                self.db.update_rule(entity_id, data['name'], data.get('description'),
+                                    data['conditions'], data['actions'],
+                                    data['priority'], data.get('enabled', True))
+                return entity_id
+            return self.db.add_rule(data['name'], data.get('description'),
+                                    data['conditions'], data['actions'], data['priority'])
+
+        if entity_type == 'component':
+            args = (data['name'], data['type'], data.get('description'),
+                    data.get('html_template'), data.get('css_styles'), data.get('js_script', ''))
+            if entity_id is not None:
+                self.db.update_component(entity_id, *args)
+                return entity_id
+            return self.db.add_component(*args)
+
+        if entity_type == 'interaction' and entity_id is None:
+            return self.db.record_interaction(data['user_id'], data['action'],
+                                              data.get('component_id'), data.get('metadata'))
+
+        if entity_type == 'user' and entity_id is None:
+            return self.db.add_user(data['username'], data['password_hash'], data['role'])
+
+        raise ValueError(f"Сохранение сущности '{entity_type}' не поддерживается")
 
     def find_entity(self, entity_type: str, entity_id: int) -> Optional[Dict]:
         """Найти сущность"""
-        pass
+        if entity_type not in ENTITY_TABLES:
+            raise ValueError(f"Неизвестный тип сущности: {entity_type}")
+        return self.db.find_row(ENTITY_TABLES[entity_type], entity_id)
 
 
 class ExternalSourceConnector:
@@ -45,7 +76,7 @@ class MLEngineConnector:
 
     def load_model(self, model_path: str) -> bool:
         """Загрузить модель"""
-        return True
+        return self.ml_engine.load_model(model_path)
 
     def predict_interface(self, context: Dict) -> Dict:
         """Предсказать интерфейс"""
@@ -70,17 +101,6 @@ class ContextSensorAPI:
         return {'latitude': 55.7558, 'longitude': 37.6173}
 
 
-class DatabaseManager:
-    """Менеджер базы данных (из database.py)"""
-
-    def __init__(self, db_path: str = "adaptive_ui.db"):
-        from database import DatabaseManager as DBM
-        self.db = DBM(db_path)
-
-    def __getattr__(self, name):
-        return getattr(self.db, name)
-
-
 class ApplicationBootstrapper:
     """Начальная загрузка приложения"""
 
@@ -97,8 +117,8 @@ class ApplicationBootstrapper:
     def init_services(self):
         """Инициализировать сервисы"""
         print("[ApplicationBootstrapper] Инициализация сервисов...")
-        self.services['database'] = Repository(None)
-        self.services['ml_engine'] = MLEngineConnector(None)
+        self.services['database'] = Repository(DatabaseManager(settings.DATABASE_PATH))
+        self.services['ml_engine'] = MLEngineConnector(MLEngine())
         self.services['external_source'] = ExternalSourceConnector()
         print("[ApplicationBootstrapper] Сервисы инициализированы")
 
@@ -0,0 +1,95 @@
+import io
+import json
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple, Union
+from models import UserInteraction
+import settings
+
+# Сколько ошибок разбора возвращать клиенту
+MAX_REPORTED_ERRORS = 100
+
+# Буфер чтения тела запроса
+READ_BUFFER_SIZE = 256 * 1024
+
+_decode = json.JSONDecoder().decode
+
+
+def iter_ndjson(stream: BinaryIO, max_line: int = settings.INTERACTION_BULK_MAX_LINE
+                ) -> Iterator[Tuple[int, Union[Any, ValueError]]]:
+    """
+    Читать NDJSON построчно, не загружая тело целиком.
+    Выдает (номер строки, объект) или (номер строки, ValueError); пустые строки пропускаются.
+    """
+    if isinstance(stream, io.RawIOBase):
+        # Небуферизованный поток (werkzeug LimitedStream) читает строку по кусочкам
+        stream = io.BufferedReader(stream, READ_BUFFER_SIZE)
+
+    line_no = 0
+    while True:
+        line = stream.readline(max_line)
+        if not line:
+            return
+        line_no += 1
+
+        if len(line) >= max_line and not line.endswith(b'\n'):
+            # Дочитать остаток слишком длинной строки
+            while True:
+                rest = stream.readline(max_line)
+                if not rest or rest.endswith(b'\n'):
+                    break
+            yield line_no, ValueError(f'line is longer than {max_line} bytes')
+            continue
+
+        if line.isspace():
+            continue
+        try:
+            yield line_no, _decode(line.decode('utf-8'))
+        except ValueError as e:
+            yield line_no, ValueError(f'invalid JSON: {e}')
+
+
+class BulkIngestionError(Exception):
+    """Ошибка записи пачки; result содержит счетчики уже записанных пачек"""
+
+    def __init__(self, message: str, result: Dict[str, Any]):
+        super().__init__(message)
+        self.result = result
+
+
+def ingest_interactions(collector, stream: BinaryIO,
+                        chunk_size: int = settings.INTERACTION_BULK_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Принять поток событий NDJSON: проверка по models.UserInteraction и запись
+    пачками по chunk_size событий (каждая пачка - отдельная транзакция).
+    Возвращает общие и попачечные счетчики принятых и отклоненных событий.
+    """
+    result: Dict[str, Any] = {'accepted': 0, 'rejected': 0, 'chunks': [], 'errors': []}
+    batch: List[UserInteraction] = []
+    rejected = 0
+
+    def write_chunk() -> None:
+        nonlocal batch, rejected
+        try:
+            accepted = collector.track_user_actions(batch) if batch else 0
+        except Exception as e:
+            raise BulkIngestionError(f'chunk {len(result["chunks"])} failed: {e}', result) from e
+        result['chunks'].append({'accepted': accepted, 'rejected': rejected})
+        result['accepted'] += accepted
+        result['rejected'] += rejected
+        batch = []
+        rejected = 0
+
+    for line_no, item in iter_ndjson(stream):
+        try:
+            if isinstance(item, ValueError):
+                raise item
+            batch.append(UserInteraction.from_dict(item))
+        except ValueError as e:
+            rejected += 1
+            if len(result['errors']) < MAX_REPORTED_ERRORS:
+                result['errors'].append({'line': line_no, 'error': str(e)})
+        if len(batch) + rejected >= chunk_size:
+            write_chunk()
+
+    if batch or rejected:
+        write_chunk()
+    return result
@@ -0,0 +1,270 @@
+"""Гистограммы задержек горячих путей и их выдача в текстовом формате Prometheus (/metrics)"""
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Tuple
+from flask import Response, before_render_template, g, request, template_rendered
+import settings
+
+# Границы корзин, секунды: от 50 мкс (запрос к SQLite) до 10 с (HTTP-запрос)
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[str, ...]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами
+
+    Каждый поток пишет в свою копию счетчиков без блокировок: наблюдение -
+    поиск корзины и два сложения. Копии потоков суммируются только при
+    выдаче метрик (collect). Копии завершившихся потоков сливаются в общие
+    счетчики (_base), поэтому их число не растет с числом созданных потоков.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._buckets = list(self.buckets)
+        self._local = threading.local()
+        # Копии потоков: (поток, метки -> [счетчики корзин..., +Inf, сумма])
+        self._shards: List[Tuple[threading.Thread, Dict[Labels, List[float]]]] = []
+        # Счетчики завершившихся потоков
+        self._base: Dict[Labels, List[float]] = {}
+        self._shards_lock = threading.Lock()
+
+    def _new_counts(self, labels: Labels) -> List[float]:
+        """Счетчики меток в копии текущего потока (первое наблюдение)"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._fold_finished()
+                self._shards.append((threading.current_thread(), shard))
+        counts = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        return counts
+
+    def _fold_finished(self) -> None:
+        """Слить копии завершившихся потоков в _base (вызывается под _shards_lock)"""
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                # Поток больше не пишет в копию - ее можно читать без гонок
+                _merge(self._base, shard)
+        self._shards = alive
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        """Учесть наблюдение (секунды)"""
+        try:
+            counts = self._local.shard[labels]
+        except (AttributeError, KeyError):
+            counts = self._new_counts(labels)
+        counts[bisect_left(self._buckets, value)] += 1
+        counts[-1] += value
+
+    def collect(self) -> Dict[Labels, List[float]]:
+        """Сумма копий всех потоков: метки -> [счетчики корзин..., +Inf, сумма]"""
+        total: Dict[Labels, List[float]] = {}
+        with self._shards_lock:
+            self._fold_finished()
+            _merge(total, self._base)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            _merge(total, shard)
+        return total
+
+    def render(self) -> List[str]:
+        """Строки гистограммы в текстовом формате Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, counts in sorted(self.collect().items()):
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = ','.join(pairs + [f'le="{bound}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            label_text = '{' + ','.join(pairs) + '}' if pairs else ''
+            lines.append(f'{self.name}_sum{label_text} {_format_value(counts[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+def _merge(total: Dict[Labels, List[float]], shard: Dict[Labels, List[float]]) -> None:
+    """Прибавить счетчики копии shard к total"""
+    for labels, counts in list(shard.items()):
+        merged = total.get(labels)
+        if merged is None:
+            total[labels] = list(counts)
+        else:
+            for i, value in enumerate(counts):
+                merged[i] += value
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ('method', 'endpoint', 'status'))
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Время выполнения SQL-запроса (до первой строки результата)',
+    ('query',))
+ML_PREDICT_DURATION = Histogram(
+    'ml_predict_duration_seconds', 'Время прогноза MLEngine', ('method',))
+TEMPLATE_RENDER_DURATION = Histogram(
+    'template_render_duration_seconds', 'Время рендеринга шаблона', ('template',))
+
+HISTOGRAMS = (REQUEST_DURATION, DB_QUERY_DURATION, ML_PREDICT_DURATION, TEMPLATE_RENDER_DURATION)
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ==================== SQL ====================
+
+_WHITESPACE = re.compile(r'\s+')
+# WHERE id IN (?, ?, ...) - одна метка при любом числе параметров
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+# Партиции user_interactions_YYYYMM(DD) - одна метка на все партиции
+_PARTITION = re.compile(r'\b(user_interactions)_\d{6,8}\b')
+_NUMBER = re.compile(r'\b\d+\b')
+MAX_QUERY_LABEL = 200
+
+# Исходный текст запроса -> метки гистограммы (нормализация один раз на текст)
+_query_labels: Dict[str, Labels] = {}
+
+
+def normalize_query(sql: str) -> str:
+    """Текст запроса для метки: без переносов, литералов чисел и списков параметров"""
+    label = _WHITESPACE.sub(' ', sql).strip()
+    label = _PLACEHOLDER_LIST.sub('(?, ...)', label)
+    label = _PARTITION.sub(r'\1_N', label)
+    return _NUMBER.sub('N', label)[:MAX_QUERY_LABEL]
+
+
+def _new_query_labels(sql: str) -> Labels:
+    if len(_query_labels) >= settings.METRICS_MAX_QUERIES:
+        _query_labels.clear()
+    labels = _query_labels[sql] = (normalize_query(sql),)
+    return labels
+
+
+_now = time.perf_counter
+_execute = sqlite3.Connection.execute
+_executemany = sqlite3.Connection.executemany
+_commit = sqlite3.Connection.commit
+_COMMIT_LABELS = ('COMMIT',)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Соединение SQLite, которое учитывает время execute/executemany/commit"""
+
+    def execute(self, sql, parameters=()):
+        started = _now()
+        try:
+            return _execute(self, sql, parameters)
+        finally:
+            DB_QUERY_DURATION.observe(_now() - started,
+                                      _query_labels.get(sql) or _new_query_labels(sql))
+
+    def executemany(self, sql, parameters):
+        started = _now()
+        try:
+            return _executemany(self, sql, parameters)
+        finally:
+            DB_QUERY_DURATION.observe(_now() - started,
+                                      _query_labels.get(sql) or _new_query_labels(sql))
+
+    def commit(self):
+        started = _now()
+        try:
+            return _commit(self)
+        finally:
+            DB_QUERY_DURATION.observe(_now() - started, _COMMIT_LABELS)
+
+
+# ==================== Функции и Flask ====================
+
+def timed(histogram: Histogram, *labels: str) -> Callable:
+    """Декоратор: учитывать время вызова функции в гистограмме"""
+    def decorator(func):
+        if not settings.METRICS_ENABLED:
+            return func
+
+        observe = histogram.observe
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = _now()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(_now() - started, labels)
+        return wrapper
+    return decorator
+
+
+def init_metrics(app) -> None:
+    """
+    Подключить метрики к приложению: время каждого запроса (по endpoint, а не
+    по URL - число меток ограничено) и рендеринга шаблонов, маршрут /metrics
+    """
+    if not settings.METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            REQUEST_DURATION.observe(time.perf_counter() - started,
+                                     (request.method, request.endpoint or 'unmatched',
+                                      str(response.status_code)))
+        return response
+
+    # Шаблоны рендерятся вложенно (фрагменты внутри страницы) - стек на поток
+    render_starts = threading.local()
+
+    def start_render(sender, template, context, **extra):
+        stack = getattr(render_starts, 'stack', None)
+        if stack is None:
+            stack = render_starts.stack = []
+        stack.append(time.perf_counter())
+
+    def observe_render(sender, template, context, **extra):
+        stack = getattr(render_starts, 'stack', None)
+        if stack:
+            TEMPLATE_RENDER_DURATION.observe(time.perf_counter() - stack.pop(),
+                                             (template.name or '<string>',))
+
+    before_render_template.connect(start_render, app, weak=False)
+    template_rendered.connect(observe_render, app, weak=False)
+
+    @app.route('/metrics')
+    def metrics():
+        """Метрики в текстовом формате Prometheus"""
+        return Response(render_metrics(), content_type=CONTENT_TYPE)
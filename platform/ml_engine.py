@@ -1,19 +1,59 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Sequence
 import random
+import numpy as np
 from models import UserBehavior, UserAction, GeoPoint
+from metrics import ML_PREDICT_DURATION, timed
+from ml_model import CLASSES, TrainedModel, behavior_features, feature_matrix, get_model
+import settings
 
+# Порядок столбцов в матрице оценок predict_batch (совпадает с порядком
+# выбора при равенстве в predict_next_action)
+BATCH_ACTIONS = (UserAction.PURCHASE, UserAction.CHURN, UserAction.NAVIGATION)
 
-class MLEngine:
-    """модель движка"""
-
-    def __init__(self):
-        self.model_accuracy = 0.85  # целевая точность 85%
 
+class MLEngine:
+    """
+    модель движка: обученная модель из settings.ML_MODEL_PATH (python training.py),
+    а пока ее нет - эвристики
+    """
+
+    def __init__(self, model_path: str = settings.ML_MODEL_PATH):
+        self.model_path: Optional[str] = None
+        self.model: Optional[TrainedModel] = None
+        # Точность измеряется на отложенной выборке при обучении
+        self.model_accuracy: Optional[float] = None
+        if settings.ENABLE_ML_PREDICTIONS:
+            self.load_model(model_path)
+
+    def load_model(self, model_path: str = settings.ML_MODEL_PATH) -> bool:
+        """Загрузить обученную модель (веса общие для всех экземпляров процесса)"""
+        self.model_path = model_path
+        return self._refresh_model() is not None
+
+    def _refresh_model(self) -> Optional[TrainedModel]:
+        """
+        Текущая модель: get_model сверяет манифест (один stat) и после
+        нового обучения отдает новые веса без перезапуска процесса
+        """
+        if self.model_path is None:
+            return None
+        model = get_model(self.model_path)
+        if model is not self.model:
+            self.model = model
+            self.model_accuracy = model.accuracy if model is not None else None
+        return model
+
+    @timed(ML_PREDICT_DURATION, 'predict_next_action')
     def predict_next_action(self, behavior: UserBehavior) -> UserAction:
         """
         Прогнозирование следующего действия пользователя
         (Purchase, Churn, Navigation)
         """
+        model = self._refresh_model()
+        if model is not None:
+            predicted_action = CLASSES[model.predict_index(behavior_features(behavior))]
+            behavior.predicted_action = predicted_action
+            return predicted_action
 
         # Вычисление вероятностей на основе поведения
         purchase_score = self._calculate_purchase_probability(behavior)
@@ -32,6 +72,57 @@ class MLEngine:
 
         return predicted_action
 
+    @timed(ML_PREDICT_DURATION, 'predict_batch')
+    def predict_batch(self, behaviors: Sequence[UserBehavior]) -> List[UserAction]:
+        """
+        Пакетное прогнозирование следующего действия. Без модели результат
+        совпадает с predict_next_action для каждого элемента; с моделью
+        оценки считаются матрично и при почти равных оценках классов выбор
+        может отличаться от поэлементного.
+        """
+        count = len(behaviors)
+        model = self._refresh_model()
+        if model is not None:
+            events = [b.interaction_map.get('events_24h', b.page_views + b.clicks) for b in behaviors]
+            X = feature_matrix(
+                np.fromiter((b.page_views for b in behaviors), dtype=np.float64, count=count),
+                np.fromiter((b.clicks for b in behaviors), dtype=np.float64, count=count),
+                np.fromiter((b.interaction_time for b in behaviors), dtype=np.float64, count=count),
+                np.array(events, dtype=np.float64).reshape(count))
+            predicted = [CLASSES[i] for i in model.predict_indices(X).tolist()]
+            for behavior, action in zip(behaviors, predicted):
+                behavior.predicted_action = action
+            return predicted
+
+        effective_score = np.fromiter((b.effective_score for b in behaviors), dtype=np.float64, count=count)
+        clicks = np.fromiter((b.clicks for b in behaviors), dtype=np.float64, count=count)
+        interaction_time = np.fromiter((b.interaction_time for b in behaviors), dtype=np.float64, count=count)
+
+        indices = self.score_batch(effective_score, clicks, interaction_time).argmax(axis=1)
+
+        predicted = [BATCH_ACTIONS[i] for i in indices.tolist()]
+        for behavior, action in zip(behaviors, predicted):
+            behavior.predicted_action = action
+
+        return predicted
+
+    def score_batch(self, effective_score: np.ndarray, clicks: np.ndarray,
+                    interaction_time: np.ndarray) -> np.ndarray:
+        """
+        Векторизованный расчет оценок эвристик: матрица (N, 3) со столбцами
+        purchase, churn, navigation (см. BATCH_ACTIONS)
+        """
+        purchase_score = (effective_score * 0.5
+                          + np.minimum(0.3, clicks * 0.05)
+                          + np.minimum(0.2, interaction_time * 0.01))
+
+        churn_score = np.where(clicks == 0, 0.6,
+                               np.where(interaction_time < 60, 0.3, 0.1))
+
+        navigation_score = 1.0 - purchase_score - churn_score
+
+        return np.stack((purchase_score, churn_score, navigation_score), axis=1)
+
     def _calculate_purchase_probability(self, behavior: UserBehavior) -> float:
         """Вычислить вероятность покупки"""
         # Модель
@@ -87,6 +178,7 @@ class MLEngine:
 
         return recommendations
 
-    def get_model_accuracy(self) -> float:
-        """Получить точность модели"""
+    def get_model_accuracy(self) -> Optional[float]:
+        """Получить точность модели (None - модель не обучена)"""
+        self._refresh_model()
         return self.model_accuracy
\ No newline at end of file
@@ -0,0 +1,347 @@
+"""Обучаемая модель прогноза следующего действия: мультиклассовая логистическая регрессия на NumPy
+
+Обучение по истории user_interactions (например, из cron) из каталога platform:
+    python training.py --workers 4
+
+Пример - день активности пользователя: признаки считаются по событиям дня,
+метка - по следующему дню (purchase - была покупка, churn - ни одного
+события, navigation - остальное). Веса сохраняются в settings.ML_MODEL_PATH
+файлами .npy и открываются через memory map: процессы-воркеры делят одни
+страницы файлов, а новая модель подхватывается после следующего обучения.
+"""
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import settings
+from models import UserAction, UserBehavior
+
+# Признаки (порядок столбцов матрицы) и классы (порядок столбцов весов)
+FEATURES = ('page_views', 'clicks', 'interaction_time', 'events')
+CLASSES = (UserAction.PURCHASE, UserAction.CHURN, UserAction.NAVIGATION)
+ARRAYS = ('mean', 'scale', 'weights', 'bias')
+MANIFEST_FILE = 'manifest.json'
+DAY = 86400
+# Пользователи с user_id % TEST_SHARDS == 0 - отложенная выборка для оценки точности
+TEST_SHARDS = 5
+
+CLICK_ACTIONS = ('click',)
+VIEW_ACTIONS = ('view', 'page_view')
+PURCHASE_ACTIONS = ('purchase',)
+
+
+def feature_matrix(page_views: np.ndarray, clicks: np.ndarray, interaction_time: np.ndarray,
+                   events: np.ndarray) -> np.ndarray:
+    """Матрица признаков (N, len(FEATURES)): счетчики в логарифмической шкале"""
+    return np.log1p(np.stack((page_views, clicks, interaction_time, events),
+                             axis=1).astype(np.float64))
+
+
+def behavior_features(behavior: UserBehavior) -> List[float]:
+    """Признаки одного пользователя (как строка feature_matrix)"""
+    events = behavior.interaction_map.get('events_24h', behavior.page_views + behavior.clicks)
+    return [math.log1p(behavior.page_views), math.log1p(behavior.clicks),
+            math.log1p(behavior.interaction_time), math.log1p(events)]
+
+
+# ==================== Обучающая выборка ====================
+
+# Коды действий в выборке событий: номер в EVENT_ACTIONS + 1, прочие - 0
+# (см. DatabaseManager.iter_user_events)
+EVENT_ACTIONS = CLICK_ACTIONS + VIEW_ACTIONS + PURCHASE_ACTIONS
+
+# Пример: признаки, индекс класса (CLASSES) и пользователь (для отложенной выборки)
+SAMPLE_DTYPE = np.dtype([('features', np.float32, (len(FEATURES),)), ('label', np.int8),
+                         ('user_id', np.int64)])
+
+
+def _codes(names: Sequence[str]) -> List[int]:
+    return [EVENT_ACTIONS.index(name) + 1 for name in names]
+
+
+def daily_samples(user_id: np.ndarray, timestamp: np.ndarray, action: np.ndarray,
+                  last_day: int, compacted: Optional[np.ndarray] = None,
+                  session_gap: int = settings.BEHAVIOR_SESSION_GAP) -> np.ndarray:
+    """
+    Примеры по дням активности (массив SAMPLE_DTYPE) из событий, упорядоченных
+    по (user_id, timestamp); все события пользователя должны быть в одной
+    пачке, action - коды EVENT_ACTIONS. Время взаимодействия - сумма пауз
+    между событиями не длиннее session_gap, как в BehaviorAggregator. Дни
+    начиная с last_day (номер дня UTC последнего события истории) не
+    размечаются: следующий день еще не известен.
+
+    compacted - число событий строки дневного агрегата (0 - сырое событие),
+    см. DatabaseManager.iter_user_events. Пауз у свернутых дней нет: их время
+    взаимодействия оценивается по средней паузе на сырое событие пачки.
+    """
+    if not len(user_id):
+        return np.empty(0, dtype=SAMPLE_DTYPE)
+    if compacted is None:
+        compacted = np.zeros(len(user_id), dtype=np.int64)
+    is_compacted = compacted > 0
+    weight = np.where(is_compacted, compacted, 1)
+
+    day = timestamp // DAY
+    new_user = user_id[1:] != user_id[:-1]
+    boundary = np.empty(len(user_id), dtype=bool)
+    boundary[0] = True
+    boundary[1:] = new_user | (day[1:] != day[:-1])
+    starts = np.flatnonzero(boundary)
+
+    gap = np.zeros(len(timestamp), dtype=np.int64)
+    np.subtract(timestamp[1:], timestamp[:-1], out=gap[1:])
+    gap[1:][new_user | is_compacted[1:] | is_compacted[:-1]] = 0
+    gap[(gap <= 0) | (gap > session_gap)] = 0
+
+    def count(names: Sequence[str]) -> np.ndarray:
+        return np.add.reduceat(np.isin(action, _codes(names)) * weight, starts)
+
+    events = np.add.reduceat(weight, starts)
+    interaction_time = np.add.reduceat(gap, starts).astype(np.float64)
+    compacted_events = np.add.reduceat(compacted, starts)
+    if compacted_events.any():
+        raw_events = int(np.count_nonzero(~is_compacted))
+        mean_gap = gap.sum() / raw_events if raw_events else 0.0
+        interaction_time += compacted_events * mean_gap
+    purchases = count(PURCHASE_ACTIONS)
+
+    # Следующий день активности того же пользователя: есть ли он и была ли покупка
+    group_user = user_id[starts]
+    group_day = day[starts]
+    active_next = np.zeros(len(starts), dtype=bool)
+    active_next[:-1] = (group_user[1:] == group_user[:-1]) & (group_day[1:] == group_day[:-1] + 1)
+    purchase_next = np.zeros(len(starts), dtype=bool)
+    purchase_next[:-1] = purchases[1:] > 0
+    labels = np.where(~active_next, CLASSES.index(UserAction.CHURN),
+                      np.where(purchase_next, CLASSES.index(UserAction.PURCHASE),
+                               CLASSES.index(UserAction.NAVIGATION)))
+
+    labeled = group_day < last_day
+    samples = np.empty(int(labeled.sum()), dtype=SAMPLE_DTYPE)
+    samples['features'] = feature_matrix(count(VIEW_ACTIONS), count(CLICK_ACTIONS),
+                                         interaction_time, events)[labeled]
+    samples['label'] = labels[labeled]
+    samples['user_id'] = group_user[labeled]
+    return samples
+
+
+# ==================== Обучение ====================
+
+def _blocks(count: int, block_rows: int) -> Iterator[slice]:
+    for start in range(0, count, block_rows):
+        yield slice(start, min(start + block_rows, count))
+
+
+def fit(X: np.ndarray, y: np.ndarray, mask: Optional[np.ndarray] = None,
+        iterations: int = settings.ML_TRAIN_ITERATIONS,
+        learning_rate: float = settings.ML_TRAIN_LEARNING_RATE,
+        l2: float = settings.ML_TRAIN_L2,
+        block_rows: int = settings.ML_TRAIN_BLOCK_ROWS) -> Dict[str, np.ndarray]:
+    """
+    Градиентный спуск по перекрестной энтропии softmax (признаки стандартизуются).
+    X и y читаются блоками по block_rows строк, поэтому подходят и массивы
+    memory map больше памяти; mask - строки для обучения (None - все).
+    """
+    def rows(block: slice) -> Tuple[np.ndarray, np.ndarray]:
+        features = np.asarray(X[block], dtype=np.float64)
+        labels = np.asarray(y[block], dtype=np.int64)
+        if mask is not None:
+            keep = mask[block]
+            features, labels = features[keep], labels[keep]
+        return features, labels
+
+    blocks = list(_blocks(len(y), block_rows))
+    total = 0
+    sums = np.zeros(X.shape[1])
+    squares = np.zeros(X.shape[1])
+    class_counts = np.zeros(len(CLASSES))
+    for block in blocks:
+        features, labels = rows(block)
+        total += len(labels)
+        sums += features.sum(axis=0)
+        squares += (features ** 2).sum(axis=0)
+        class_counts += np.bincount(labels, minlength=len(CLASSES))
+    if not total:
+        raise ValueError("Нет примеров для обучения")
+    mean = sums / total
+    scale = np.sqrt(np.maximum(squares / total - mean ** 2, 0.0))
+    scale[scale == 0] = 1.0
+
+    weights = np.zeros((len(CLASSES), X.shape[1]))
+    # Начальное смещение - логарифм частот классов
+    bias = np.log(np.maximum(class_counts / total, 1e-9))
+    # Выборка из одного блока не перечитывается на каждом шаге
+    cached = rows(blocks[0]) if len(blocks) == 1 else None
+
+    for _ in range(iterations):
+        grad_weights = np.zeros_like(weights)
+        grad_bias = np.zeros_like(bias)
+        for block in blocks:
+            features, labels = cached or rows(block)
+            # Примеры по столбцам: редукции по короткой оси классов идут по непрерывным строкам
+            Z = np.ascontiguousarray(((features - mean) / scale).T)
+            logits = weights @ Z
+            logits += bias[:, None]
+            logits -= logits.max(axis=0)
+            proba = np.exp(logits)
+            proba /= proba.sum(axis=0)
+            proba[labels, np.arange(len(labels))] -= 1.0
+            grad_weights += proba @ Z.T
+            grad_bias += proba.sum(axis=1)
+        weights -= learning_rate * (grad_weights / total + l2 * weights)
+        bias -= learning_rate * grad_bias / total
+    return {'mean': mean, 'scale': scale, 'weights': weights.T.copy(), 'bias': bias}
+
+
+def _scores(arrays: Dict[str, np.ndarray], X: np.ndarray) -> np.ndarray:
+    return (X - arrays['mean']) / arrays['scale'] @ arrays['weights'] + arrays['bias']
+
+
+def train(samples: np.ndarray, block_rows: int = settings.ML_TRAIN_BLOCK_ROWS
+          ) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """
+    Обучить модель на пользователях обучающей части и измерить точность
+    на отложенных; итоговые веса обучаются на всей выборке.
+    samples - массив SAMPLE_DTYPE (в том числе memory map).
+    """
+    X, y = samples['features'], samples['label']
+    test = np.empty(len(y), dtype=bool)
+    for block in _blocks(len(y), block_rows):
+        test[block] = samples['user_id'][block] % TEST_SHARDS == 0
+    if not test.any() or test.all():
+        raise ValueError("Недостаточно пользователей для отложенной выборки")
+    started = time.perf_counter()
+    arrays = fit(X, y, ~test, block_rows=block_rows)
+
+    train_counts = np.zeros(len(CLASSES), dtype=np.int64)
+    test_counts = np.zeros(len(CLASSES), dtype=np.int64)
+    for block in _blocks(len(y), block_rows):
+        labels = np.asarray(y[block], dtype=np.int64)
+        train_counts += np.bincount(labels[~test[block]], minlength=len(CLASSES))
+        test_counts += np.bincount(labels[test[block]], minlength=len(CLASSES))
+    # Базовая модель - частоты классов обучающей части
+    prior = train_counts / train_counts.sum()
+
+    correct = 0
+    log_loss = 0.0
+    for block in _blocks(len(y), block_rows):
+        keep = test[block]
+        labels = np.asarray(y[block], dtype=np.int64)[keep]
+        scores = _scores(arrays, np.asarray(X[block], dtype=np.float64)[keep])
+        scores -= scores.max(axis=1, keepdims=True)
+        log_proba = scores - np.log(np.exp(scores).sum(axis=1, keepdims=True))
+        correct += int((scores.argmax(axis=1) == labels).sum())
+        log_loss -= float(log_proba[np.arange(len(labels)), labels].sum())
+
+    test_samples = int(test_counts.sum())
+    metrics = {
+        'samples': int(len(y)),
+        'test_samples': test_samples,
+        'accuracy': correct / test_samples,
+        'baseline_accuracy': float(test_counts[prior.argmax()]) / test_samples,
+        'log_loss': log_loss / test_samples,
+        'baseline_log_loss': float(-(test_counts * np.log(np.maximum(prior, 1e-12))).sum()) / test_samples,
+        'class_share': {action.value: float(count) / len(y)
+                        for action, count in zip(CLASSES, train_counts + test_counts)},
+    }
+    arrays = fit(X, y, block_rows=block_rows)
+    metrics['train_seconds'] = round(time.perf_counter() - started, 3)
+    return arrays, metrics
+
+
+def save_model(arrays: Dict[str, np.ndarray], metrics: Dict[str, Any],
+               path: str = settings.ML_MODEL_PATH) -> None:
+    """Записать веса (.npy на массив) и manifest.json; модель заменяется целиком"""
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name in ARRAYS:
+        np.save(os.path.join(tmp_path, f'{name}.npy'), np.ascontiguousarray(arrays[name], dtype=np.float64))
+    manifest = {
+        'features': list(FEATURES),
+        'classes': [action.value for action in CLASSES],
+        'metrics': metrics,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    old_path = f'{path}.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+# ==================== Загруженная модель ====================
+
+class TrainedModel:
+    """Модель, открытая через memory map
+
+    Пакетный прогноз считается по массивам из файлов; для одиночного
+    прогноза стандартизация заранее свернута в веса и смещение, которые
+    лежат списками Python (вызов NumPy на одной строке дороже самих
+    вычислений).
+    """
+
+    def __init__(self, path: str = settings.ML_MODEL_PATH):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if (tuple(self.manifest['features']) != FEATURES
+                or self.manifest['classes'] != [action.value for action in CLASSES]):
+            raise ValueError(f"Модель {path} обучена на других признаках или классах")
+        self.arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                       for name in ARRAYS}
+        self.accuracy: float = self.manifest['metrics']['accuracy']
+
+        weights = np.asarray(self.arrays['weights']) / np.asarray(self.arrays['scale'])[:, None]
+        bias = self.arrays['bias'] - np.asarray(self.arrays['mean']) @ weights
+        # Столбцы весов по классам: [(w_1, ..., w_n), ...]
+        self._columns = [tuple(column) for column in weights.T.tolist()]
+        self._bias = bias.tolist()
+
+    def predict_index(self, features: Sequence[float]) -> int:
+        """Индекс класса (CLASSES) для одной строки признаков"""
+        best = 0
+        best_score = -math.inf
+        for i, (column, bias) in enumerate(zip(self._columns, self._bias)):
+            score = bias
+            for weight, value in zip(column, features):
+                score += weight * value
+            if score > best_score:
+                best, best_score = i, score
+        return best
+
+    def predict_indices(self, X: np.ndarray) -> np.ndarray:
+        """Индексы классов для матрицы признаков (N, len(FEATURES))"""
+        return _scores(self.arrays, X).argmax(axis=1)
+
+
+_models: Dict[str, Tuple[Tuple[int, int], TrainedModel]] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(path: str = settings.ML_MODEL_PATH) -> Optional[TrainedModel]:
+    """Загруженная модель (перезагружается после нового обучения); None - модели нет"""
+    try:
+        stat = os.stat(os.path.join(path, MANIFEST_FILE))
+    except FileNotFoundError:
+        return None
+
+    version = (stat.st_ino, stat.st_mtime_ns)
+    entry = _models.get(path)
+    if entry is None or entry[0] != version:
+        with _models_lock:
+            entry = _models.get(path)
+            if entry is None or entry[0] != version:
+                entry = (version, TrainedModel(path))
+                _models[path] = entry
+                print(f"[MLModel] Загружена модель {path}: точность {entry[1].accuracy:.3f}")
+    return entry[1]
@@ -4,6 +4,9 @@ from enum import Enum
 from datetime import datetime
 import json
 
+# Формат CURRENT_TIMESTAMP SQLite
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
 
 class DeviceType(Enum):
     """Типы устройств"""
@@ -89,20 +92,62 @@ class ComponentUI:
         }
 
 
-@dataclass
 class AdaptationRule:
-    """Правило адаптации интерфейса"""
-    id: int
-    name: str
-    description: str
-    conditions: Dict[str, Any]  # условия срабатывания
-    actions: Dict[str, Any]  # действия при срабатывании
-    priority: int
-    enabled: bool = True
-    created_at: datetime = field(default_factory=datetime.now)
-    updated_at: datetime = field(default_factory=datetime.now)
+    """Правило адаптации интерфейса
+
+    Обычный класс со __slots__ вместо dataclass: правила целиком держатся
+    в памяти процесса (rule_store.RuleStore).
+    """
+
+    __slots__ = ('id', 'name', 'description', 'conditions', 'actions', 'priority',
+                 'enabled', 'created_at', 'updated_at', 'version')
+
+    def __init__(self, id: int, name: str, description: str,
+                 conditions: Dict[str, Any],  # условия срабатывания
+                 actions: Dict[str, Any],  # действия при срабатывании
+                 priority: int, enabled: bool = True,
+                 created_at: Optional[datetime] = None,
+                 updated_at: Optional[datetime] = None,
+                 version: int = 0):
+        self.id = id
+        self.name = name
+        self.description = description
+        self.conditions = conditions
+        self.actions = actions
+        self.priority = priority
+        self.enabled = enabled
+        self.created_at = created_at or datetime.now()
+        self.updated_at = updated_at or datetime.now()
+        self.version = version
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'AdaptationRule':
+        """Создать правило из строки таблицы adaptation_rules"""
+        return cls(
+            id=row['id'],
+            name=row['name'],
+            description=row['description'],
+            # JSON 'null' (правило создано без условий/действий) - пустой объект
+            conditions=(json.loads(row['conditions']) if row['conditions'] else None) or {},
+            actions=(json.loads(row['actions']) if row['actions'] else None) or {},
+            priority=row['priority'],
+            enabled=bool(row['enabled']),
+            created_at=datetime.fromisoformat(row['created_at']) if row['created_at'] else None,
+            updated_at=datetime.fromisoformat(row['updated_at']) if row['updated_at'] else None,
+            version=row['version'] if 'version' in row.keys() else 0
+        )
+
+    def __repr__(self) -> str:
+        return (f"AdaptationRule(id={self.id!r}, name={self.name!r}, "
+                f"priority={self.priority!r}, enabled={self.enabled!r}, version={self.version!r})")
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, AdaptationRule):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
 
     def to_dict(self) -> Dict:
+        """Поля в формате строки таблицы, как их отдает /api/rules (enabled 0/1, время SQLite)"""
         return {
             "id": self.id,
             "name": self.name,
@@ -110,9 +155,9 @@ class AdaptationRule:
             "conditions": self.conditions,
             "actions": self.actions,
             "priority": self.priority,
-            "enabled": self.enabled,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat()
+            "enabled": int(self.enabled),
+            "created_at": self.created_at.strftime(SQLITE_TIMESTAMP_FORMAT),
+            "updated_at": self.updated_at.strftime(SQLITE_TIMESTAMP_FORMAT)
         }
 
 
@@ -141,6 +186,57 @@ class UserBehavior:
         }
 
 
+# Максимальная длина названия действия
+MAX_ACTION_LENGTH = 64
+
+
+@dataclass
+class UserInteraction:
+    """Взаимодействие пользователя с интерфейсом (событие clickstream)"""
+    user_id: int
+    action: str
+    component_id: Optional[int] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'UserInteraction':
+        """Создать из JSON-объекта с проверкой типов (ValueError при ошибке)"""
+        if not isinstance(data, dict):
+            raise ValueError('event must be an object')
+
+        user_id = data.get('user_id')
+        if type(user_id) is not int:
+            raise ValueError('user_id must be an integer')
+        action = data.get('action')
+        if not isinstance(action, str) or not 0 < len(action) <= MAX_ACTION_LENGTH:
+            raise ValueError(f'action must be a non-empty string of at most {MAX_ACTION_LENGTH} characters')
+        component_id = data.get('component_id')
+        if component_id is not None and type(component_id) is not int:
+            raise ValueError('component_id must be an integer')
+        metadata = data.get('metadata')
+        if metadata is None:
+            metadata = {}
+        elif not isinstance(metadata, dict):
+            raise ValueError('metadata must be an object')
+
+        # Время на клиенте сохраняется в metadata, время записи назначает сервер
+        timestamp = data.get('timestamp')
+        if timestamp is not None:
+            if not isinstance(timestamp, str):
+                raise ValueError('timestamp must be a string')
+            metadata = dict(metadata, timestamp=timestamp)
+
+        return cls(user_id, action, component_id, metadata)
+
+    def to_dict(self) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "action": self.action,
+            "component_id": self.component_id,
+            "metadata": self.metadata
+        }
+
+
 @dataclass
 class Statistics:
     """Статистика и метрики"""
@@ -0,0 +1,146 @@
+import threading
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+from models import AdaptationRule, UserContext
+from rule_store import get_rule_store
+
+# Измерения условий, которые задают формы создания/редактирования правил
+CONDITION_KEYS = ('device_type', 'time_of_day', 'user_type')
+
+IndexKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+def _normalize(value: Any) -> Optional[str]:
+    """Пустое значение условия ("Все устройства" и т.п.) - любое значение"""
+    if value in (None, '', 'any', 'all'):
+        return None
+    return str(value)
+
+
+def _rule_key(rule: AdaptationRule) -> IndexKey:
+    return tuple(_normalize(rule.conditions.get(k)) for k in CONDITION_KEYS)
+
+
+def _unknown_conditions(rule: AdaptationRule) -> List[str]:
+    """Заданные условия по измерениям, которых индекс не знает"""
+    return sorted(k for k, v in rule.conditions.items()
+                  if k not in CONDITION_KEYS and _normalize(v) is not None)
+
+
+def _rule_summary(rule: AdaptationRule) -> Dict[str, Any]:
+    return {
+        'id': rule.id,
+        'name': rule.name,
+        'priority': rule.priority,
+        'conditions': rule.conditions,
+        'actions': rule.actions
+    }
+
+
+class RuleIndex:
+    """Индекс включенных правил по измерениям условий
+
+    Правила раскладываются по ключу (device_type, time_of_day, user_type), где
+    None означает "любое значение". Поиск для контекста - не более 8 обращений
+    к словарю, результат для каждой комбинации значений кешируется до
+    следующего изменения правил. Индекс обновляется по изменениям из
+    rule_store.RuleStore, только для затронутых правил. Правило с условием
+    вне CONDITION_KEYS не индексируется (не подходит ни под один контекст),
+    а не применяется шире, чем задано.
+    """
+
+    def __init__(self, db_path: str):
+        self.store = get_rule_store(db_path)
+        self._lock = threading.Lock()
+        self._keys: Dict[int, IndexKey] = {}
+        self._buckets: Dict[IndexKey, Dict[int, AdaptationRule]] = {}
+        self._matches: Dict[IndexKey, List[AdaptationRule]] = {}
+        self.store.add_listener(self._apply)
+
+    def _apply(self, removed: List[int], upserted: List[AdaptationRule]) -> None:
+        """Применить изменения набора правил"""
+        with self._lock:
+            for rule_id in removed:
+                self._remove(rule_id)
+            for rule in upserted:
+                self._remove(rule.id)
+                if rule.enabled:
+                    # Ошибка в одном правиле не должна оставлять без индекса остальные
+                    try:
+                        self._add(rule)
+                    except Exception as e:
+                        print(f"[RuleIndex] Правило {rule.id} пропущено: {e!r}")
+            self._matches.clear()
+
+    def _add(self, rule: AdaptationRule) -> None:
+        if not isinstance(rule.conditions, dict):
+            raise TypeError(f"условия должны быть объектом, а не {type(rule.conditions).__name__}")
+        unknown = _unknown_conditions(rule)
+        if unknown:
+            print(f"[RuleIndex] Правило {rule.id} пропущено: неизвестные условия {unknown}")
+            return
+        key = _rule_key(rule)
+        self._keys[rule.id] = key
+        self._buckets.setdefault(key, {})[rule.id] = rule
+
+    def _remove(self, rule_id: int) -> None:
+        key = self._keys.pop(rule_id, None)
+        if key is None:
+            return
+        bucket = self._buckets[key]
+        bucket.pop(rule_id, None)
+        if not bucket:
+            del self._buckets[key]
+
+    def invalidate(self, rule_id: Optional[int] = None) -> None:
+        """Подтянуть изменения правил (изменившиеся строки находит RuleStore)"""
+        self.store.sync()
+
+    def lookup(self, device_type: Optional[str], time_of_day: Optional[str],
+               user_type: Optional[str], sync: bool = True) -> List[AdaptationRule]:
+        """
+        Найти правила для значений измерений (по убыванию приоритета);
+        sync=False - без обращения к БД, по уже загруженным правилам
+        """
+        if sync:
+            self.store.sync()
+        key = (_normalize(device_type), _normalize(time_of_day), _normalize(user_type))
+        matches = self._matches.get(key)
+        if matches is not None:
+            return matches
+
+        with self._lock:
+            found: List[AdaptationRule] = []
+            for candidate in product(*((value, None) if value is not None else (None,)
+                                       for value in key)):
+                bucket = self._buckets.get(candidate)
+                if bucket:
+                    found.extend(bucket.values())
+            found.sort(key=lambda rule: (-rule.priority, rule.id))
+            self._matches[key] = found
+        return found
+
+    def match(self, context: UserContext, user_type: Optional[str],
+              sync: bool = True) -> List[Dict[str, Any]]:
+        """
+        Найти правила, подходящие под контекст пользователя
+        (user_type - см. controllers.resolve_user_type)
+        """
+        rules = self.lookup(context.device_type.value, context.time_of_day.value, user_type, sync)
+        return [_rule_summary(rule) for rule in rules]
+
+
+_indexes: Dict[str, RuleIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_rule_index(db_path: str) -> RuleIndex:
+    """Получить общий для процесса индекс правил для файла БД"""
+    index = _indexes.get(db_path)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(db_path)
+            if index is None:
+                index = RuleIndex(db_path)
+                _indexes[db_path] = index
+    return index
@@ -0,0 +1,135 @@
+import threading
+from bisect import bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+from connection_pool import get_pool
+from models import AdaptationRule
+
+# Слушатель изменений: (id удаленных правил, новые/измененные правила)
+RuleListener = Callable[[List[int], List[AdaptationRule]], None]
+
+# Сколько id передавать в одном запросе WHERE id IN (...)
+_FETCH_CHUNK = 500
+
+
+class RuleStore:
+    """Разобранные правила адаптации в памяти процесса
+
+    Правила хранятся как models.AdaptationRule (JSON условий и действий
+    разбирается один раз). Перед чтением сверяется statistics.rules_version,
+    который триггеры увеличивают при любом изменении adaptation_rules; если
+    он изменился, перечитываются только строки с новой версией. Так изменения
+    из других процессов тоже видны, а чтение без изменений - один запрос по PK.
+    """
+
+    def __init__(self, db_path: str):
+        self.pool = get_pool(db_path)
+        self._lock = threading.Lock()
+        self._rules: Dict[int, AdaptationRule] = {}
+        self._by_priority: List[AdaptationRule] = []
+        # (правила по возрастанию id, их id) - заменяются целиком
+        self._id_order: Tuple[List[AdaptationRule], List[int]] = ([], [])
+        self._rules_version: Optional[int] = None
+        self._listeners: List[RuleListener] = []
+
+        # Счетчики
+        self.syncs = 0
+        self.reparsed = 0
+
+    def add_listener(self, listener: RuleListener) -> None:
+        """Подписаться на изменения набора правил"""
+        with self._lock:
+            self._listeners.append(listener)
+            rules = list(self._rules.values())
+        if rules:
+            listener([], rules)
+
+    def sync(self) -> None:
+        """Подтянуть изменения правил из БД (перечитываются только измененные строки)"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT rules_version FROM statistics WHERE id = 1').fetchone()
+            rules_version = row[0] if row else None
+            if rules_version is not None and rules_version == self._rules_version:
+                return
+
+            with self._lock:
+                if rules_version is not None and rules_version == self._rules_version:
+                    return
+
+                current = dict(conn.execute('SELECT id, version FROM adaptation_rules').fetchall())
+                removed = [rule_id for rule_id in self._rules if rule_id not in current]
+                changed = [rule_id for rule_id, version in current.items()
+                           if rule_id not in self._rules or self._rules[rule_id].version != version]
+
+                upserted: List[AdaptationRule] = []
+                for start in range(0, len(changed), _FETCH_CHUNK):
+                    chunk = changed[start:start + _FETCH_CHUNK]
+                    placeholders = ', '.join('?' * len(chunk))
+                    rows = conn.execute(
+                        f'SELECT * FROM adaptation_rules WHERE id IN ({placeholders})', chunk
+                    ).fetchall()
+                    upserted.extend(AdaptationRule.from_row(row) for row in rows)
+
+                for rule_id in removed:
+                    del self._rules[rule_id]
+                for rule in upserted:
+                    self._rules[rule.id] = rule
+
+                if removed or upserted:
+                    by_id = sorted(self._rules.values(), key=lambda rule: rule.id)
+                    self._id_order = (by_id, [rule.id for rule in by_id])
+                    self._by_priority = sorted(by_id, key=lambda rule: -rule.priority)
+                    for listener in self._listeners:
+                        listener(removed, upserted)
+
+                self._rules_version = rules_version
+                self.syncs += 1
+                self.reparsed += len(upserted)
+
+    @property
+    def version(self) -> int:
+        """Версия набора правил (statistics.rules_version) после синхронизации"""
+        self.sync()
+        return self._rules_version or 0
+
+    def all(self) -> List[AdaptationRule]:
+        """Все правила по убыванию приоритета"""
+        self.sync()
+        return self._by_priority
+
+    def get(self, rule_id: int) -> Optional[AdaptationRule]:
+        """Правило по ID"""
+        self.sync()
+        return self._rules.get(rule_id)
+
+    def page(self, after_id: Optional[int] = None, limit: Optional[int] = None) -> List[AdaptationRule]:
+        """Страница правил по возрастанию id (keyset-пагинация)"""
+        self.sync()
+        by_id, ids = self._id_order
+        start = bisect_right(ids, after_id) if after_id is not None else 0
+        end = start + limit if limit is not None else len(by_id)
+        return by_id[start:end]
+
+    def get_stats(self) -> Dict[str, int]:
+        """Получить счетчики хранилища"""
+        return {
+            'rules': len(self._rules),
+            'rules_version': self._rules_version or 0,
+            'syncs': self.syncs,
+            'reparsed': self.reparsed
+        }
+
+
+_stores: Dict[str, RuleStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_rule_store(db_path: str) -> RuleStore:
+    """Получить общее для процесса хранилище правил для файла БД"""
+    store = _stores.get(db_path)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(db_path)
+            if store is None:
+                store = RuleStore(db_path)
+                _stores[db_path] = store
+    return store
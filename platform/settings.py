@@ -5,10 +5,67 @@ from datetime import timedelta
 DEBUG = True
 TESTING = False
 
+# Templates
+TEMPLATE_MODE = os.getenv('TEMPLATE_MODE', 'production')  # 'development' - перечитывать шаблоны при изменении
+TEMPLATE_CACHE_DIR = '.jinja_cache'  # байт-код скомпилированных шаблонов
+STATIC_MAX_AGE = 3600  # секунды кеширования статики браузером (в режиме production)
+
+# Static Assets (сборка: python assets.py)
+ASSETS_DIST_DIR = 'dist'  # подкаталог static для собранных файлов
+ASSETS_URL_PATH = '/assets'
+ASSETS_MAX_AGE = 365 * 24 * 3600  # секунды; имя файла меняется вместе с содержимым
+ASSETS_BUILD_ON_START = True  # собирать статику в init_db (при сборке на выкладке - False)
+
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///adaptive_ui.db')
 DATABASE_PATH = 'adaptive_ui.db'
 
+# Connection Pool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_POOL_TIMEOUT = 5.0  # секунды ожидания свободного соединения
+DB_STATEMENT_CACHE_SIZE = 256
+DB_MMAP_SIZE = 256 * 1024 * 1024  # байт
+DB_CACHE_SIZE = -64000  # отрицательное значение - в KiB (~64 MB)
+DB_FETCH_CHUNK_SIZE = 500  # строк за один fetchmany в DatabaseManager.iter_query
+
+# Interaction Write Buffer
+INTERACTION_BUFFER_ENABLED = True
+INTERACTION_BUFFER_BATCH_SIZE = 500
+INTERACTION_BUFFER_FLUSH_INTERVAL = 0.5  # секунды
+INTERACTION_BUFFER_MAX_PENDING = 50000  # событий в памяти
+INTERACTION_BUFFER_OVERFLOW = 'block'  # 'block' | 'drop'
+INTERACTION_BUFFER_MAX_RETRIES = 5  # повторы записи пачки после ошибки, затем пачка отбрасывается
+INTERACTION_BUFFER_RETRY_BACKOFF = 0.2  # секунды; пауза удваивается с каждым повтором
+INTERACTION_BUFFER_RETRY_MAX_DELAY = 5.0  # секунды; предел паузы между повторами
+
+# Interaction Storage (партиции user_interactions и сроки хранения)
+INTERACTION_PARTITION_PERIOD = 'month'  # 'day' | 'month'
+INTERACTION_RAW_RETENTION_DAYS = 30  # старше - сворачиваются в дневные агрегаты (не меньше 1: окна поведения)
+INTERACTION_AGGREGATE_RETENTION_DAYS = 365  # старше - дневные агрегаты удаляются
+INTERACTION_COMPACTION_INTERVAL = 3600  # секунды между запусками сжатия (0 - не запускать)
+
+# Analytics Snapshot (колоночная выгрузка user_interactions, python columnar.py)
+ANALYTICS_SNAPSHOT_PATH = 'analytics_snapshot'
+ANALYTICS_EXPORT_CHUNK_SIZE = 100000  # строк на один fetchmany
+
+# Bulk Ingestion (POST /api/interactions/bulk)
+INTERACTION_BULK_CHUNK_SIZE = 5000  # событий в одной транзакции
+INTERACTION_BULK_MAX_LINE = 64 * 1024  # байт на одно событие NDJSON
+
+# Page Fragment Cache (дашборд и аналитика)
+FRAGMENT_CACHE_SIZE = 256  # фрагментов
+FRAGMENT_CACHE_TTL = 3600  # секунды (актуальность обеспечивает версия данных в ключе)
+
+# Behavior Feature Cache
+BEHAVIOR_CACHE_SIZE = 10000  # пользователей
+BEHAVIOR_CACHE_TTL = 300  # секунды
+
+# Behavior Aggregation (скользящие окна 5 мин / 1 ч / 24 ч)
+BEHAVIOR_CHECKPOINT_INTERVAL = 60  # секунды между снимками
+BEHAVIOR_SYNC_INTERVAL = 1.0  # секунды между чтениями новых событий из БД (задержка признаков)
+BEHAVIOR_SYNC_BATCH = 10000  # событий за один запрос
+BEHAVIOR_SESSION_GAP = 1800  # паузы длиннее не входят во время взаимодействия
+
 # Session Configuration
 PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 SESSION_COOKIE_SECURE = False  
@@ -20,16 +77,49 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'secret')
 
 # ML Model Configuration
 ML_MODEL_ACCURACY_TARGET = 0.85
-ML_MODEL_PATH = 'models/ml_model.pkl'
+ML_MODEL_PATH = 'ml_model'  # каталог весов .npy и manifest.json (python training.py)
+ML_TRAIN_ITERATIONS = 300  # шаги градиентного спуска
+ML_TRAIN_LEARNING_RATE = 0.5
+ML_TRAIN_L2 = 1e-3  # L2-регуляризация весов
+ML_TRAIN_BLOCK_ROWS = 65536  # примеров в блоке при обучении (память не зависит от размера выборки)
+ML_TRAIN_WORKERS = os.cpu_count() or 1  # процессов сборки признаков (шарды по диапазонам user_id)
+ML_TRAIN_CHUNK_SIZE = 100000  # строк на один fetchmany
+ML_TRAIN_BLOCK_EVENTS = 200000  # событий (в среднем) в одном упорядоченном запросе: память сортировки SQLite
 
 # Feature Flags
 ENABLE_ML_PREDICTIONS = True
 ENABLE_A_B_TESTING = True
 ENABLE_ANALYTICS = True
 
+# A/B Testing (эксперименты над правилами адаптации)
+AB_FLUSH_INTERVAL = 5  # секунды между записью показов и конверсий
+AB_DEFAULT_CONVERSION_ACTION = 'click'  # действие, которое считается конверсией
+AB_SIGNIFICANCE_LEVEL = 0.05
+AB_MIN_EXPOSURES = 100  # показов в каждом варианте до расчета значимости
+AB_MSPRT_TAU = 0.05  # масштаб ожидаемой разницы конверсий для последовательного теста
+
+# Adaptation (асинхронный эндпоинт /api/user/adapt)
+ADAPTATION_WORKERS = 16  # потоков для блокирующих этапов
+# Этапов, выполняемых одновременно (включая те, чей ответ уже не ждут после
+# таймаута); сверх этого этап сразу считается невыполненным, а не ждет в очереди
+ADAPTATION_MAX_IN_FLIGHT = ADAPTATION_WORKERS
+ADAPTATION_STAGE_TIMEOUTS = {  # секунды на этап; поток этапа при таймауте не прерывается
+    'context': 0.2,
+    'customer_status': 0.5,
+    'rules': 0.2,
+    'behavior': 0.3,
+    'prediction': 0.2,
+}
+
 # API Configuration
 API_PREFIX = '/api'
 API_VERSION = '1.0'
+API_STREAM_MIN_ROWS = 1000  # полный список длиннее отдается потоком (без кеша и ETag)
+API_STREAM_BATCH_ROWS = 200  # строк в одном куске потокового JSON-ответа
+
+# Metrics (/metrics, формат Prometheus)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+METRICS_MAX_QUERIES = 10000  # различных текстов SQL в кеше нормализации
 
 # Logging
 LOG_LEVEL = 'INFO'
@@ -0,0 +1,45 @@
+import os
+import time
+from typing import Dict
+from jinja2 import FileSystemBytecodeCache
+import settings
+
+TEMPLATE_MODES = ('development', 'production')
+
+
+def configure_templates(app, mode: str = settings.TEMPLATE_MODE,
+                        cache_dir: str = settings.TEMPLATE_CACHE_DIR) -> None:
+    """
+    Настроить рендеринг шаблонов.
+
+    development - шаблоны перечитываются при изменении (в режиме отладки);
+    production - автоперезагрузка выключена (шаблон не сверяется с файлом
+    при каждом рендере), скомпилированный байт-код хранится в cache_dir и
+    переживает перезапуск процесса, статика кешируется браузером.
+    """
+    if mode not in TEMPLATE_MODES:
+        raise ValueError(f"Неизвестный режим шаблонов: {mode}")
+    if mode == 'development':
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Явное значение: app.run(debug=True) не включит перезагрузку обратно
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = settings.STATIC_MAX_AGE
+    app.jinja_env.auto_reload = False
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+
+def precompile_templates(app) -> Dict[str, float]:
+    """
+    Загрузить все шаблоны заранее (при старте), чтобы первый запрос к
+    странице не ждал компиляции. Возвращает время загрузки каждого шаблона.
+    """
+    timings: Dict[str, float] = {}
+    env = app.jinja_env
+    for name in env.list_templates(extensions=('html',)):
+        started = time.perf_counter()
+        env.get_template(name)
+        timings[name] = time.perf_counter() - started
+    print(f"[templating] Загружено шаблонов: {len(timings)} за {sum(timings.values()) * 1000:.1f} мс")
+    return timings
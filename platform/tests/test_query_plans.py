@@ -0,0 +1,61 @@
+"""Горячие запросы к событиям используют индексы (database.DatabaseManager.explain)"""
+import pytest
+from database import DatabaseManager, STATISTICS_QUERY
+
+HISTORY_QUERY = 'SELECT * FROM {table} WHERE user_id = ? ORDER BY timestamp DESC LIMIT 100'
+DISTINCT_USERS_QUERY = 'SELECT COUNT(DISTINCT user_id) FROM {table}'
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Новая база после всех миграций, с событиями в двух месячных партициях"""
+    db = DatabaseManager(str(tmp_path / 'plans.db'), partition_period='month')
+    db.record_interactions([
+        (1, 'click', None, '{}', '2026-09-01 10:00:00'),
+        (2, 'view', 3, '{}', '2026-10-01 10:00:00'),
+    ])
+    with db.pool.connection() as conn:
+        conn.execute('ANALYZE')
+    return db
+
+
+def event_tables(db):
+    with db.pool.connection() as conn:
+        keys = db.list_partitions(conn)
+    return ['user_interactions_legacy'] + [f'user_interactions_{key}' for key in keys]
+
+
+def uses_index(plan):
+    return any('USING INDEX' in step or 'USING COVERING INDEX' in step for step in plan)
+
+
+def test_event_tables_exist(db):
+    assert event_tables(db) == ['user_interactions_legacy', 'user_interactions_202609',
+                                'user_interactions_202610']
+
+
+def test_user_history_uses_index_in_every_table(db):
+    for table in event_tables(db):
+        plan = db.explain(HISTORY_QUERY.format(table=table), (1,))
+        assert uses_index(plan), (table, plan)
+        assert any(step.startswith(f'SEARCH {table} ') and '(user_id=?' in step
+                   for step in plan), (table, plan)
+        assert not any('TEMP B-TREE FOR ORDER BY' in step for step in plan), (table, plan)
+
+
+def test_user_history_view_searches_every_table_by_index(db):
+    plan = db.explain(HISTORY_QUERY.format(table='user_interactions'), (1,))
+    searched = [step.split()[1] for step in plan if step.startswith('SEARCH')]
+    assert searched == event_tables(db), plan
+    assert all(uses_index([step]) for step in plan if step.startswith('SEARCH')), plan
+
+
+def test_distinct_users_uses_covering_index_in_every_table(db):
+    for table in event_tables(db):
+        plan = db.explain(DISTINCT_USERS_QUERY.format(table=table))
+        assert any('USING COVERING INDEX' in step for step in plan), (table, plan)
+
+
+def test_statistics_query_reads_one_row_by_key(db):
+    plan = db.explain(STATISTICS_QUERY)
+    assert len(plan) == 1 and plan[0].startswith('SEARCH statistics'), plan
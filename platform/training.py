@@ -0,0 +1,165 @@
+"""Офлайн-обучение модели MLEngine: признаки потоком из SQLite, шарды по процессам
+
+Запуск (например, из cron) из каталога platform:
+    python training.py --workers 4
+
+Пользователи делятся на диапазоны user_id по числу процессов. Каждый процесс
+читает события своего диапазона упорядоченными по (user_id, timestamp)
+пачками fetchmany в буфер NumPy фиксированного размера, по мере чтения
+пользователей целиком строит их дневные примеры (ml_model.daily_samples)
+и дописывает в файл шарда. Дни старше INTERACTION_RAW_RETENTION_DAYS уже
+свернуты сжатием в interaction_daily и читаются оттуда же - выборка
+покрывает всю сохраненную историю, а не только сырые события. Шарды склеиваются в один файл, который обучение
+читает через memory map блоками. Память процессов не зависит от длины
+истории: в ней одна пачка событий и один блок примеров.
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import settings
+from database import DatabaseManager
+from ml_model import DAY, EVENT_ACTIONS, SAMPLE_DTYPE, daily_samples, save_model, train
+
+# Столбцы буфера событий: user_id, unix-время, код действия (EVENT_ACTIONS),
+# число событий строки дневного агрегата (0 - сырое событие)
+EVENT_COLUMNS = 4
+
+
+def iter_complete_users(chunks: Iterable[List[Tuple[int, int, int, int]]],
+                        chunk_size: int = settings.ML_TRAIN_CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    Пачки событий (упорядоченных по user_id) -> матрицы (N, EVENT_COLUMNS) с
+    событиями только целиком прочитанных пользователей. События последнего
+    пользователя пачки переносятся в начало буфера и выходят со следующей.
+    Матрица - представление буфера: она действительна до следующей итерации.
+    """
+    buffer = np.empty((2 * chunk_size, EVENT_COLUMNS), dtype=np.int64)
+    filled = 0
+    for chunk in chunks:
+        end = filled + len(chunk)
+        if end > len(buffer):
+            # События одного пользователя не уместились - буфер растет
+            grown = np.empty((max(end, 2 * len(buffer)), EVENT_COLUMNS), dtype=np.int64)
+            grown[:filled] = buffer[:filled]
+            buffer = grown
+        buffer[filled:end] = chunk
+        split = int(np.searchsorted(buffer[:end, 0], buffer[end - 1, 0]))
+        if split:
+            yield buffer[:split]
+            buffer[:end - split] = buffer[split:end]
+        filled = end - split
+    if filled:
+        yield buffer[:filled]
+
+
+def build_shard(db_path: str, first: int, last: int, users: int, rows_per_user: float,
+                last_day: int, out_path: str, chunk_size: int = settings.ML_TRAIN_CHUNK_SIZE,
+                block_events: int = settings.ML_TRAIN_BLOCK_EVENTS) -> Tuple[int, int, int]:
+    """
+    Записать примеры пользователей first..last в out_path (строки SAMPLE_DTYPE).
+    События читаются запросами по блокам пользователей примерно из block_events
+    строк. Выполняется в отдельном процессе; возвращает (событий, из них
+    из дневных агрегатов, примеров).
+    """
+    db = DatabaseManager(db_path, initialize=False)
+    events = compacted = samples = 0
+    blocks = math.ceil(users * rows_per_user / block_events)
+    with open(out_path, 'wb') as out:
+        for low, high, _ in db.split_user_ids(blocks, first, last):
+            chunks = db.iter_user_events(low, high, EVENT_ACTIONS, chunk_size)
+            for block in iter_complete_users(chunks, chunk_size):
+                rows = daily_samples(block[:, 0], block[:, 1], block[:, 2], last_day, block[:, 3])
+                out.write(rows.tobytes())
+                block_compacted = int(block[:, 3].sum())
+                events += int(np.count_nonzero(block[:, 3] == 0)) + block_compacted
+                compacted += block_compacted
+                samples += len(rows)
+    return events, compacted, samples
+
+
+def build_training_set(db, path: str, workers: int = settings.ML_TRAIN_WORKERS,
+                       chunk_size: int = settings.ML_TRAIN_CHUNK_SIZE,
+                       block_events: int = settings.ML_TRAIN_BLOCK_EVENTS
+                       ) -> Tuple[np.memmap, int, int]:
+    """
+    Собрать обучающую выборку в файл path (шарды по диапазонам user_id
+    в workers процессах). Возвращает (примеры через memory map, число событий,
+    из них из дневных агрегатов).
+    """
+    last_ts = db.get_last_interaction_ts()
+    if last_ts is None:
+        raise ValueError("Нет событий для обучения")
+    shards = db.split_user_ids(workers)
+    if not shards:
+        raise ValueError("Нет событий для обучения")
+    # Блоки считаются по строкам, которые реально будут прочитаны
+    rows_per_user = sum(db.get_event_row_counts()) / sum(users for _, _, users in shards)
+    parts = [f'{path}.{i}' for i in range(len(shards))]
+    tasks = [(db.db_path, first, last, users, rows_per_user, last_ts // DAY, part, chunk_size,
+              block_events) for (first, last, users), part in zip(shards, parts)]
+
+    if len(tasks) == 1:
+        results = [build_shard(*tasks[0])]
+    else:
+        # spawn: процессы открывают свои соединения, а не наследуют пул родителя
+        with multiprocessing.get_context('spawn').Pool(len(tasks)) as pool:
+            results = pool.starmap(build_shard, tasks)
+
+    with open(path, 'wb') as out:
+        for part in parts:
+            with open(part, 'rb') as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+            os.remove(part)
+    events, compacted, samples = (sum(column) for column in zip(*results))
+    if not samples:
+        raise ValueError("Нет размеченных примеров: история короче двух дней")
+    return np.memmap(path, dtype=SAMPLE_DTYPE, mode='r', shape=(samples,)), events, compacted
+
+
+def train_model(db, path: str = settings.ML_MODEL_PATH, workers: int = settings.ML_TRAIN_WORKERS,
+                chunk_size: int = settings.ML_TRAIN_CHUNK_SIZE,
+                block_events: int = settings.ML_TRAIN_BLOCK_EVENTS,
+                work_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Обучить модель по истории и сохранить в path; возвращает метрики"""
+    tmp_dir = tempfile.mkdtemp(prefix='training_', dir=work_dir)
+    try:
+        started = time.perf_counter()
+        samples, events, compacted = build_training_set(db, os.path.join(tmp_dir, 'samples.bin'),
+                                             workers, chunk_size, block_events)
+        features_seconds = round(time.perf_counter() - started, 3)
+        arrays, metrics = train(samples)
+        del samples
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    metrics.update(events=events, compacted_events=compacted, workers=workers,
+                   features_seconds=features_seconds)
+    save_model(arrays, metrics, path)
+    print(f"[Training] Событий: {events} (из дневных агрегатов {compacted}), "
+          f"примеров: {metrics['samples']}; признаки за "
+          f"{features_seconds} с ({workers} проц.), обучение за {metrics['train_seconds']} с; "
+          f"точность {metrics['accuracy']:.3f} (базовая {metrics['baseline_accuracy']:.3f})")
+    return metrics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=settings.DATABASE_PATH)
+    parser.add_argument('--model', default=settings.ML_MODEL_PATH)
+    parser.add_argument('--workers', type=int, default=settings.ML_TRAIN_WORKERS)
+    parser.add_argument('--chunk-size', type=int, default=settings.ML_TRAIN_CHUNK_SIZE)
+    parser.add_argument('--block-events', type=int, default=settings.ML_TRAIN_BLOCK_EVENTS)
+    parser.add_argument('--work-dir', help='Каталог для временного файла примеров')
+    args = parser.parse_args()
+    train_model(DatabaseManager(args.db), args.model, args.workers, args.chunk_size,
+                args.block_events, args.work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import atexit
+import json
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from database import format_timestamp
+import settings
+
+InteractionRow = Tuple[int, str, Optional[int], str, str]
+
+
+class InteractionWriteBuffer:
+    """Буфер отложенной записи взаимодействий пользователей
+
+    События копятся в памяти и записываются фоновым потоком пачками
+    (executemany в одной транзакции) при накоплении batch_size событий или
+    раз в flush_interval секунд. Время события фиксируется при добавлении,
+    а не при записи. Очередь ограничена max_pending событиями: при
+    переполнении add() ждет писателя (overflow='block') или отбрасывает
+    событие (overflow='drop'). Пачка, которую не удалось записать
+    (например, база занята), повторяется до max_retries раз с растущей
+    паузой и отбрасывается только после этого.
+    """
+
+    def __init__(self, db, batch_size: int = settings.INTERACTION_BUFFER_BATCH_SIZE,
+                 flush_interval: float = settings.INTERACTION_BUFFER_FLUSH_INTERVAL,
+                 max_pending: int = settings.INTERACTION_BUFFER_MAX_PENDING,
+                 overflow: str = settings.INTERACTION_BUFFER_OVERFLOW,
+                 max_retries: int = settings.INTERACTION_BUFFER_MAX_RETRIES,
+                 retry_backoff: float = settings.INTERACTION_BUFFER_RETRY_BACKOFF):
+        if overflow not in ('block', 'drop'):
+            raise ValueError(f"Неизвестная политика переполнения: {overflow}")
+
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._pending: Deque[InteractionRow] = deque()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+
+        # Счетчики буфера
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+        self.flushes = 0
+        self.blocked_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name='interaction-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, user_id: int, action: str, component_id: Optional[int] = None,
+            metadata: Optional[Dict] = None, timestamp: Optional[str] = None) -> bool:
+        """Поставить взаимодействие в очередь на запись"""
+        row = (user_id, action, component_id, json.dumps(metadata or {}),
+               timestamp or format_timestamp())
+
+        with self._cond:
+            if len(self._pending) >= self.max_pending and not self._closed:
+                if self.overflow == 'drop':
+                    self.dropped += 1
+                    return False
+
+                started = time.perf_counter()
+                self._cond.notify_all()
+                while len(self._pending) >= self.max_pending and not self._closed:
+                    self._cond.wait()
+                self.blocked_time += time.perf_counter() - started
+
+            if not self._closed:
+                self._pending.append(row)
+                self.enqueued += 1
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify_all()
+                return True
+
+        # Буфер уже закрыт - пишем напрямую
+        self._write([row])
+        return True
+
+    def _take(self) -> List[InteractionRow]:
+        with self._cond:
+            count = min(self.batch_size, len(self._pending))
+            rows = [self._pending.popleft() for _ in range(count)]
+            if rows:
+                self._cond.notify_all()
+            return rows
+
+    def _write(self, rows: List[InteractionRow]) -> int:
+        # Пачка пишется одной транзакцией: после ошибки ее можно повторить целиком
+        attempt = 0
+        while True:
+            try:
+                self.db.record_interactions(rows)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    self.failed += len(rows)
+                    print(f"[InteractionWriteBuffer] ВНИМАНИЕ: {len(rows)} событий отброшено "
+                          f"после {attempt + 1} попыток записи: {e}")
+                    return 0
+                delay = min(self.retry_backoff * 2 ** attempt,
+                            settings.INTERACTION_BUFFER_RETRY_MAX_DELAY)
+                attempt += 1
+                self.retries += 1
+                print(f"[InteractionWriteBuffer] Ошибка записи {len(rows)} событий: {e}; "
+                      f"повтор {attempt}/{self.max_retries} через {delay:.1f} с")
+                time.sleep(delay)
+        self.written += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    def flush(self) -> int:
+        """Записать все накопленные события (возвращает число записанных)"""
+        written = 0
+        with self._write_lock:
+            while True:
+                rows = self._take()
+                if not rows:
+                    break
+                written += self._write(rows)
+        return written
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self) -> None:
+        """Остановить фоновую запись и сбросить остаток очереди"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, float]:
+        """Получить счетчики буфера"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'pending': pending,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'retries': self.retries,
+            'flushes': self.flushes,
+            'blocked_time': self.blocked_time
+        }
+
+
+_buffers: Dict[str, InteractionWriteBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_buffer(db) -> InteractionWriteBuffer:
+    """Получить общий для процесса буфер записи для файла БД"""
+    buffer = _buffers.get(db.db_path)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(db.db_path)
+            if buffer is None:
+                buffer = InteractionWriteBuffer(db)
+                _buffers[db.db_path] = buffer
+    return buffer
+
+
+@atexit.register
+def close_all() -> None:
+    """Сбросить все буферы при завершении процесса"""
+    for buffer in list(_buffers.values()):
+        buffer.close()